@@ -1,254 +1,122 @@
-import random
-import numpy as np
-import tensorflow as tf
-import matplotlib.pyplot as plt
 import sys
 import os
-import scipy.stats as stats 
-import pickle
-import csv
+from trade_log import TradeLog
+from encoding import ROLES
+from action_stats import ActionStats
+from population import TraderPopulation
+from engine import run_simulation, default_strategies, Board, MLStrategy
+from checkpoint import Checkpointer
+from rng import simulation_rngs
+from results_store import save_run, export_dat
+from ml_policy import MLDecisionTable
+from mlp_runtime import NumpyMLP, export_dense_weights, check_export
 
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1'
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '1' # 重みの書き出しで TensorFlow を使うとき用
 
 
-PRICE_RANGE = (0, 200)
-PRICE_MAX = 200
 INITIAL_ASSET = 500.0
 
 
-class ZITrader:
-    """ ZITエージェント """
-    def __init__(self, agent_id, initial_asset):
-        self.id = agent_id
-        self.asset = initial_asset
-        self.has_traded = False
-        self.type = "ZIT"
-        self.cost = 0
-        self.value = 0
-        self.buy_price = 0
-        self.sell_price = 0
-        self.reset_period()
-
-    def reset_period(self):
-        self.has_traded = False
-        self.cost = random.randint(PRICE_RANGE[0], PRICE_MAX)
-        self.value = random.randint(PRICE_RANGE[0], PRICE_MAX)
-        if self.value < self.cost:
-            self.value = random.randint(self.cost, PRICE_MAX)
-        self.buy_price = random.randint(0, self.value)
-        self.sell_price = random.randint(self.cost, PRICE_MAX)
-
-    def choose_action(self):
-        role = random.choice(['buyer', 'seller'])
-        price = self.buy_price if role == 'buyer' else self.sell_price
-        return role, price
-    
-class MLTrader:
-    """ MLプレイヤー """
-    def __init__(self, agent_id, initial_asset, model):
-        self.id = agent_id
-        self.asset = initial_asset
-        self.has_traded = False
-        self.model = model
-        self.type = "ML"
-
-    def reset_period(self):
-        self.has_traded = False
-
-    def choose_action(self, board):
-        chosen_price = random.randint(PRICE_RANGE[0] + 1, PRICE_MAX - 1)
-        action_buy = {'role': 'buyer', 'price': chosen_price}
-        action_sell = {'role': 'seller', 'price': chosen_price}
-        
-        x_buy = encode_input_vector(board, action_buy).reshape(1, -1)
-        x_sell = encode_input_vector(board, action_sell).reshape(1, -1)
-        
-        inputs = np.vstack([x_buy, x_sell])
-        probs = self.model.predict(inputs, verbose=0)
-        
-        prob_success_buy = 1.0 - probs[0][4]
-        prob_success_sell = 1.0 - probs[1][4]
-
-        if prob_success_buy > prob_success_sell:
-            return 'buyer', chosen_price
-        else:
-            return 'seller', chosen_price
-
-
-def encode_input_vector(board, agent_action):
-    board_vec = np.zeros(3 + (PRICE_MAX + 1)) 
-    if board['type'] == 'empty':
-        board_vec[0] = 1
-    elif board['type'] == 'ask':
-        board_vec[1] = 1; board_vec[3 + board['price']] = 1
-    elif board['type'] == 'bid':
-        board_vec[2] = 1; board_vec[3 + board['price']] = 1
-    action_vec = np.zeros(2 + (PRICE_MAX + 1)) 
-    if agent_action['role'] == 'buyer':
-        action_vec[0] = 1; action_vec[2 + agent_action['price']] = 1
-    elif agent_action['role'] == 'seller':
-        action_vec[1] = 1; action_vec[2 + agent_action['price']] = 1
-    return np.concatenate([board_vec, action_vec])
-
-def run_mixed_simulation(traders_list, num_periods, steps_per_period):
-    full_logs = [] 
-    for period in range(num_periods):
-        for agent in traders_list:
-            agent.reset_period()
-        board = {'type': 'empty', 'price': -1, 'agent_id': -1}
-        
-        for step in range(steps_per_period):
-            available_traders = [t for t in traders_list if not t.has_traded]
-            if not available_traders: break 
-            agent = random.choice(available_traders)
-            
-            if isinstance(agent, MLTrader):
-                role, price = agent.choose_action(board)
-            else:
-                role, price = agent.choose_action()
-            
-            log_price = price 
-            result_type = "fail"
-            passive_log_entry = None 
-
-            if role == 'buyer':
-                if board['type'] == 'ask' and price >= board['price']:
-                    if board['agent_id'] != -1 and not traders_list[board['agent_id']].has_traded:
-
-                        seller = traders_list[board['agent_id']] 
-                        agent.has_traded = True
-                        seller.has_traded = True
-                        trade_price = board['price']
-                        
-                        agent.asset -= trade_price
-                        seller.asset += trade_price
-                        
-                        result_type = "executed"
-                        log_price = trade_price 
-
-                        passive_log_entry = [
-                            period+1, step+1, seller.id, seller.type, 'seller', trade_price, "executed"
-                        ]
-                        
-                        board = {'type': 'empty', 'price': -1, 'agent_id': -1}
-                    else:
-                        result_type = "fail"
-                elif (board['type'] == 'bid' and price > board['price']) or board['type'] == 'empty':
-                    board = {'type': 'bid', 'price': price, 'agent_id': agent.id}
-                    result_type = "overwrite"
-                else:
-                    result_type = "fail"
-
-            elif role == 'seller':
-                if board['type'] == 'bid' and price <= board['price']:
-                    if board['agent_id'] != -1 and not traders_list[board['agent_id']].has_traded:
-
-                        buyer = traders_list[board['agent_id']]
-                        agent.has_traded = True
-                        buyer.has_traded = True
-                        trade_price = board['price']
-                        
-                        agent.asset += trade_price
-                        buyer.asset -= trade_price
-                        
-                        result_type = "executed"
-                        log_price = trade_price
-
-                        passive_log_entry = [
-                            period+1, step+1, buyer.id, buyer.type, 'buyer', trade_price, "executed"
-                        ]
-
-                        board = {'type': 'empty', 'price': -1, 'agent_id': -1}
-                    else:
-                        result_type = "fail"
-                elif (board['type'] == 'ask' and price < board['price']) or board['type'] == 'empty':
-                    board = {'type': 'ask', 'price': price, 'agent_id': agent.id}
-                    result_type = "overwrite"
-                else:
-                    result_type = "fail"
-
-            full_logs.append([period+1, step+1, agent.id, agent.type, role, log_price, result_type])
-            if passive_log_entry is not None:
-                full_logs.append(passive_log_entry)
-        
-        if (period + 1) % 10 == 0:
-            print(f" ... 期間 {period + 1}/{num_periods} 完了")
-            
-    return traders_list, full_logs
-
-
-def save_dat_simple(data_list, filename, header=None):
-
-    try:
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, 'w') as f:
-            if header: f.write(header + "\n")
-            for val in data_list:
-                f.write(f"{val}\n")
-        print(f"   -> Saved: {filename}")
-    except Exception as e:
-        print(f"Error saving {filename}: {e}")
-
-def save_assets(traders, label, out_dir):
-
-    zit_assets = [t.asset for t in traders if t.type == "ZIT"]
-    ml_assets  = [t.asset for t in traders if t.type == "ML"]
-    all_assets = [t.asset for t in traders]
+# ml_choose_action で使い回す戦略 (MLStrategy は作るときに表をリストに写すので、policy ごとに1つだけ作る)
+_ML_STRATEGIES = {}
+
+
+def ml_choose_action(policy, board):
+    """ MLプレイヤーの行動 (板(dict)を受け取る版). 中身は engine.MLStrategy """
+    strategy = _ML_STRATEGIES.get(id(policy))
+    if strategy is None or strategy.policy is not policy:
+        strategy = _ML_STRATEGIES[id(policy)] = MLStrategy(policy)
+    role, price = strategy.choose(-1, Board.from_dict(board))
+    return ROLES[role], price
+
+
+def run_mixed_simulation(population, num_periods, steps_per_period, trade_log=None, action_stats=None, policy=None,
+                         prof=None, market='board', start_period=0, checkpointer=None, rng=None, backend='python'):
+    """
+    ZIT と ML の混合市場を実行する (マッチングは engine.run_simulation)
+    population: TraderPopulation (資産・取引済みフラグ・指値・タイプを配列で持つ)
+    行動統計は action_stats (ActionStats) にその場で数える
+    取引ログは trade_log (TradeLog) を渡したときだけ記録する
+    policy: MLエージェントが使う MLDecisionTable
+    prof: profiling.Profiler を渡すとフェーズ別・タイプ別の時間を計測する
+    market: 'board' (従来の1枠の板) / 'book' (価格優先・時間優先の複数価格の板)
+    start_period / checkpointer: チェックポイントからの再開と定期保存 (checkpoint.Checkpointer)
+    rng: 選択・売買・価格の乱数 (rng.BlockRNG など. 既定は random モジュール)
+    backend: 'python' / 'kernel' (kernels.py のコンパイル済みカーネル. rng は BlockRNG, 取引ログなし)
+    """
+    if action_stats is None:
+        action_stats = ActionStats()
+    return run_simulation(population, default_strategies(policy, rng), num_periods, steps_per_period,
+                          trade_log=trade_log, action_stats=action_stats, prof=prof, market=market,
+                          start_period=start_period, checkpointer=checkpointer, rng=rng, backend=backend)
+
+
+def load_policy(weights_path='zit_model_407.npz', model_path='zit_model_407.keras', out_dir=None):
+    """
+    重み (.npz) から MLDecisionTable を作る. .npz が無ければ Keras モデルから書き出す (TensorFlow はそのときだけ読み込む)
+    out_dir を渡すと意思決定表を ml_decision_table.npy として保存する
+    """
+    print("--- ML Model Loading ---")
+    if not os.path.exists(weights_path):
+        if not os.path.exists(model_path):
+            print(f"Error: {model_path} not found.")
+            sys.exit(1)
+        # TensorFlowは重みを .npz に書き出すときだけ必要 (以降は NumPy だけで推論する)
+        import tensorflow as tf
+        keras_model = tf.keras.models.load_model(model_path)
+        export_dense_weights(keras_model, weights_path)
+        diff = check_export(keras_model, NumpyMLP.load(weights_path))
+        print(f"   -> Max |Keras - NumPy| = {diff:.2e}")
+    model = NumpyMLP.load(weights_path)
+
+    # 全ての (板の状態, 提示価格, 売買) を一括推論して意思決定表にする
+    print("--- Building ML Decision Table ---")
+    policy = MLDecisionTable(model)
+    if out_dir is not None:
+        policy.save(f"{out_dir}/ml_decision_table.npy")
+    return policy
+
+
+def run_ml_simulation(policy, ml_percentage, total_traders, num_periods, steps_per_period, out_dir="fig_ml", seed=None,
+                      checkpoint_every=10, export_csv=False, export_dat_files=False, market='board'):
+    """ ZIT と ML の混合市場を1回実行し、out_dir/results_<割合>pct に結果を保存する (保存先を返す) """
+    os.makedirs(out_dir, exist_ok=True)
+    label = f"{int(ml_percentage*100)}pct"
+    print(f"\n--- Simulation Start: ML Ratio {int(ml_percentage*100)}% ---")
+ 
+    # 先頭 int(total_traders * ml_percentage) 人が ML, 残りが ZIT
+    population_rng, rng = simulation_rngs(seed)
+    population = TraderPopulation.mixed(total_traders, ml_percentage, 'ML', initial_asset=INITIAL_ASSET, rng=population_rng)
     
-    # 1. 生データ (個別ファイル)
-    save_dat_simple([str(x) for x in zit_assets], f"{out_dir}/asset_raw_{label}_zit.dat", "# ZIT Assets")
-    save_dat_simple([str(x) for x in ml_assets],  f"{out_dir}/asset_raw_{label}_ml.dat",  "# ML Assets")
+ 
+    trade_log = TradeLog(out_dir=f"{out_dir}/trade_log_{label}")
+    action_stats = ActionStats()
+    # 途中で落ちたときは最新のチェックポイントから同じ結果になるように再開する
+    checkpointer = Checkpointer(f"{out_dir}/checkpoints_{label}", every=checkpoint_every,
+                                params=dict(seed=seed, ratio=ml_percentage, num_traders=total_traders,
+                                            num_periods=num_periods, steps_per_period=steps_per_period, market=market))
+    start_period = checkpointer.resume(population, trade_log, action_stats, rng)
+    final_population, action_stats = run_mixed_simulation(population, num_periods, steps_per_period, trade_log, action_stats,
+                                                          policy=policy, market=market, start_period=start_period,
+                                                          checkpointer=checkpointer, rng=rng)
+    print(f"   -> Trade Log Saved: {trade_log.out_dir} ({len(trade_log)} rows)")
     
-    # 2. CCDFデータ (全体)
-    if len(all_assets) > 0:
-        mu = np.mean(all_assets)
-        sd = np.std(all_assets)
-        if sd > 0:
-            norm_assets = np.sort(np.abs([(x - mu) / sd for x in all_assets]))
-            y_vals = 1.0 - np.arange(len(all_assets)) / len(all_assets)
-            
-            ccdf_lines = [f"{x} {y}" for x, y in zip(norm_assets, y_vals) if x > 0]
-            save_dat_simple(ccdf_lines, f"{out_dir}/asset_ccdf_{label}_all.dat", "# NormalizedAsset CCDF")
-
-def analyze_and_save_action_stats(logs, label, out_dir):
 
-    stats = {
-        'ZIT': {'Fail': 0, 'Buy_Over': 0, 'Buy_Exec': 0, 'Sell_Over': 0, 'Sell_Exec': 0},
-        'ML':  {'Fail': 0, 'Buy_Over': 0, 'Buy_Exec': 0, 'Sell_Over': 0, 'Sell_Exec': 0}
-    }
+    # 資産・タイプ・行動統計を .npy + metadata.json で保存する
+    run_dir = f"{out_dir}/results_{label}"
+    save_run(run_dir, final_population, action_stats, label=label, types=['ZIT', 'ML'], strategy='ML',
+             ratio=ml_percentage, num_periods=num_periods, steps_per_period=steps_per_period, seed=seed, market=market)
+    checkpointer.clear()
+    if export_dat_files:
+        export_dat(run_dir, out_dir)
     
-    for row in logs:
-        # row: [Period, Step, AgentID, Type, Role, Price, Result]
-        agent_type = row[3]
-        role = row[4]
-        result = row[6]
-        
-        if result == 'fail':
-            stats[agent_type]['Fail'] += 1
-        elif role == 'buyer':
-            if result == 'executed':
-                stats[agent_type]['Buy_Exec'] += 1
-            elif result == 'overwrite':
-                stats[agent_type]['Buy_Over'] += 1
-        elif role == 'seller':
-            if result == 'executed':
-                stats[agent_type]['Sell_Exec'] += 1
-            elif result == 'overwrite':
-                stats[agent_type]['Sell_Over'] += 1
-            
-    filename = f"{out_dir}/action_stats_{label}.dat"
-    try:
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, 'w') as f:
+    if export_csv:
+        trade_log.export_csv(f"{out_dir}/trade_history_{label}.csv")
 
-            f.write("# Type Fail Buy_Over Buy_Exec Sell_Over Sell_Exec\n")
-            for t_type in ['ZIT', 'ML']:
-                d = stats[t_type]
-
-                f.write(f"{t_type} {d['Fail']} {d['Buy_Over']} {d['Buy_Exec']} {d['Sell_Over']} {d['Sell_Exec']}\n")
-        print(f"   -> Action Stats Saved: {filename}")
-    except Exception as e:
-        print(f"Error saving action stats: {e}")
+    print(f" Simulation Completed. All results saved in '{out_dir}/'.")
+    if not export_dat_files:
+        print(f" gnuplot .dat files: python results_store.py export {run_dir} --out {out_dir}")
+    return run_dir
 
 
 if __name__ == '__main__':
@@ -256,47 +124,17 @@ if __name__ == '__main__':
     out_dir = "fig_ml"
     os.makedirs(out_dir, exist_ok=True)
 
-    x_th = np.logspace(-2, 1, 100)
-    y_th = 2 * stats.norm.sf(x_th)
-    save_dat_simple([f"{x} {y}" for x, y in zip(x_th, y_th)], f"{out_dir}/gaussian_theory.dat", "# X Y")
-
-    print("--- ML Model Loading ---")
-    model_path = 'zit_model_407.keras'
-    if not os.path.exists(model_path):
-        print(f"Error: {model_path} not found.")
-        sys.exit(1)
-    model = tf.keras.models.load_model(model_path)
+    policy = load_policy('zit_model_407.npz', 'zit_model_407.keras', out_dir)
 
 
     TOTAL_TRADERS = 2000    
     NUM_PERIODS = 100       
     STEPS_PER_PERIOD = TOTAL_TRADERS * 2 
     ML_PERCENTAGE = 0.3
+    EXPORT_CSV = False  # True: バイナリのログに加えてCSVも書き出す
+    CHECKPOINT_EVERY = 10  # この期間ごとにチェックポイントを保存する (0 なら保存しない)
+    SEED = None  # 整数にすると同じ結果を再現できる (None: 毎回別の乱数)
+    EXPORT_DAT = False  # True: gnuplot 用の .dat もすぐ書き出す (後から python results_store.py export でも作れる)
     
-    label = f"{int(ML_PERCENTAGE*100)}pct"
-    print(f"\n--- Simulation Start: ML Ratio {int(ML_PERCENTAGE*100)}% ---")
- 
-    num_ml = int(TOTAL_TRADERS * ML_PERCENTAGE)
-    num_zit = TOTAL_TRADERS - num_ml
-    
-    traders = []
-    for i in range(num_ml):
-        traders.append(MLTrader(i, INITIAL_ASSET, model))
-    for i in range(num_zit):
-        traders.append(ZITrader(i + num_ml, INITIAL_ASSET))
-    
- 
-    final_traders, full_logs = run_mixed_simulation(traders, NUM_PERIODS, STEPS_PER_PERIOD)
-    
-
-    save_assets(final_traders, label, out_dir)
-    analyze_and_save_action_stats(full_logs, label, out_dir)
-    
-    csv_name = f"{out_dir}/trade_history_{label}.csv"
-    with open(csv_name, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(["Period", "Step", "AgentID", "Type", "Role", "Price", "Result"])
-        writer.writerows(full_logs)
-    print(f"   -> CSV Saved: {csv_name}")
-
-    print(f" Simulation Completed. All results saved in '{out_dir}/'.")
\ No newline at end of file
+    run_ml_simulation(policy, ML_PERCENTAGE, TOTAL_TRADERS, NUM_PERIODS, STEPS_PER_PERIOD, out_dir=out_dir, seed=SEED,
+                      checkpoint_every=CHECKPOINT_EVERY, export_csv=EXPORT_CSV, export_dat_files=EXPORT_DAT)
@@ -1,239 +1,55 @@
-import random
 import numpy as np
-import matplotlib.pyplot as plt
-import sys
 import os
-import scipy.stats as stats 
-import pickle
-import csv
+import analysis
+from trade_log import TradeLog
+from encoding import ROLES
+from action_stats import ActionStats
+from population import TraderPopulation
+from engine import run_simulation, default_strategies, Board, RuleStrategy
+from checkpoint import Checkpointer
+from rng import simulation_rngs
+from results_store import save_run, export_dat
 
 
-PRICE_RANGE = (0, 200)
-PRICE_MAX = 200
 INITIAL_ASSET = 500.0
-
-class ZITrader:
-    """ ZITエージェント """
-    def __init__(self, agent_id, initial_asset):
-        self.id = agent_id
-        self.asset = initial_asset
-        self.has_traded = False
-        self.type = "ZIT" 
-        self.cost = 0
-        self.value = 0
-        self.buy_price = 0
-        self.sell_price = 0
-        self.reset_period()
-
-    def reset_period(self):
-        self.has_traded = False
-        self.cost = random.randint(PRICE_RANGE[0], PRICE_MAX)
-        self.value = random.randint(PRICE_RANGE[0], PRICE_MAX)
-        if self.value < self.cost:
-            self.value = random.randint(self.cost, PRICE_MAX)
-        self.buy_price = random.randint(0, self.value)
-        self.sell_price = random.randint(self.cost, PRICE_MAX)
-
-    def choose_action(self):
-        role = random.choice(['buyer', 'seller'])
-        price = self.buy_price if role == 'buyer' else self.sell_price
-        return role, price
-    
-class RuleTrader:
-    """ ルールベース・プレイヤー """
-    def __init__(self, agent_id, initial_asset):
-        self.id = agent_id
-        self.asset = initial_asset
-        self.has_traded = False
-        self.type = "Rule" 
-
-    def reset_period(self):
-        self.has_traded = False
-
-    def choose_action(self, board):
-        chosen_price = random.randint(PRICE_RANGE[0] + 1, PRICE_MAX - 1)
-        board_type = board['type']
-        
-        if board_type == 'empty':
-            return random.choice(['buyer', 'seller']), chosen_price
-        
-        board_price = board['price']
-        
-        if board_type == 'ask': # 板は「売り」
-            if chosen_price >= board_price:
-                return 'buyer', chosen_price # 成立
-            else:
-                return 'seller', chosen_price # 上書き
-                
-        elif board_type == 'bid': # 板は「買い」
-            if chosen_price <= board_price:
-                return 'seller', chosen_price # 成立
-            else:
-                return 'buyer', chosen_price # 上書き
-
-
-
-def run_mixed_simulation(traders_list, num_periods, steps_per_period):
-    full_logs = [] 
-
-    for period in range(num_periods):
-        for agent in traders_list:
-            agent.reset_period()
-            
-        board = {'type': 'empty', 'price': -1, 'agent_id': -1}
-        
-        for step in range(steps_per_period):
-            available_traders = [t for t in traders_list if not t.has_traded]
-            if not available_traders: break 
-
-            agent = random.choice(available_traders)
-            
-            if isinstance(agent, RuleTrader):
-                role, price = agent.choose_action(board)
-            else:
-                role, price = agent.choose_action()
-            
-            # ログ用変数
-            log_price = price
-            result_type = "fail"
-            passive_log_entry = None # 相手側のログ用
-
-            if role == 'buyer':
-                if board['type'] == 'ask' and price >= board['price']:
-                    if board['agent_id'] != -1 and not traders_list[board['agent_id']].has_traded:
-                        # --- 取引成立 ---
-                        seller = traders_list[board['agent_id']] 
-                        
-                        agent.has_traded = True
-                        seller.has_traded = True
-                        
-                        trade_price = board['price'] # 約定価格
-                        
-                        agent.asset -= trade_price
-                        seller.asset += trade_price
-                        
-                        result_type = "executed"
-                        log_price = trade_price 
-
-                        passive_log_entry = [
-                            period+1, step+1, seller.id, seller.type, 'seller', trade_price, "executed"
-                        ]
-
-                        board = {'type': 'empty', 'price': -1, 'agent_id': -1}
-                    else:
-                        result_type = "fail"
-                elif (board['type'] == 'bid' and price > board['price']) or board['type'] == 'empty':
-                    board = {'type': 'bid', 'price': price, 'agent_id': agent.id}
-                    result_type = "overwrite"
-                else:
-                    result_type = "fail"
-
-            elif role == 'seller':
-                if board['type'] == 'bid' and price <= board['price']:
-                    if board['agent_id'] != -1 and not traders_list[board['agent_id']].has_traded:
-                        # --- 取引成立 ---
-                        buyer = traders_list[board['agent_id']]
-                        
-                        agent.has_traded = True
-                        buyer.has_traded = True
-                        
-                        trade_price = board['price'] # 約定価格
-                        
-                        agent.asset += trade_price
-                        buyer.asset -= trade_price
-                        
-                        result_type = "executed"
-                        log_price = trade_price
-
-                        passive_log_entry = [
-                            period+1, step+1, buyer.id, buyer.type, 'buyer', trade_price, "executed"
-                        ]
-
-                        board = {'type': 'empty', 'price': -1, 'agent_id': -1}
-                    else:
-                        result_type = "fail"
-                elif (board['type'] == 'ask' and price < board['price']) or board['type'] == 'empty':
-                    board = {'type': 'ask', 'price': price, 'agent_id': agent.id}
-                    result_type = "overwrite"
-                else:
-                    result_type = "fail"
-
-            # 1. 能動的エージェントのログ追加
-            full_logs.append([period+1, step+1, agent.id, agent.type, role, log_price, result_type])
-            
-            # 2. 受動的エージェント（相手）がいる場合、そのログも追加
-            if passive_log_entry is not None:
-                full_logs.append(passive_log_entry)
-        
-        if (period + 1) % 10 == 0:
-            print(f" ... 期間 {period + 1}/{num_periods} 完了")
-
-    return traders_list, full_logs
-
-
-def save_cdf_data_file(data, filename):
-
-    if len(data) == 0: return
-    
-    data_mean = np.mean(data)
-    data_std = np.std(data)
-    if data_std == 0: return
-
-    # 標準化 & 絶対値
-    standardized_data = np.abs([(x - data_mean) / data_std for x in data])
-    sorted_data = np.sort(standardized_data)
-    
-    n = len(data)
-    y_values = 1.0 - (np.arange(n) / n)
-    
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    
-    with open(filename, 'w') as f:
-        f.write("# Normalized_Asset_Abs CCDF_Value\n")
-        for x, y in zip(sorted_data, y_values):
-            if x > 0: 
-                f.write(f"{x} {y}\n")
-    print(f"資産CCDF DAT保存: {filename}")
-
-def save_raw_asset_data(data, filename):
-
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, 'w') as f:
-        f.write("# Raw Asset Values\n")
-        for val in data:
-            f.write(f"{val}\n")
-    print(f"資産生データ(Raw)保存: {filename}")
-
-def save_gaussian_reference(filename):
-
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    x_th = np.logspace(-2, 1, 100)
-    y_th = 2 * stats.norm.sf(x_th)
-    
-    with open(filename, 'w') as f:
-        f.write("# Gaussian_X Gaussian_Y(CCDF)\n")
-        for x, y in zip(x_th, y_th):
-            f.write(f"{x} {y}\n")
-    print(f"正規分布理論値保存: {filename}")
-
-
-def plot_and_save_graph(traders_list, title, output_filename):
-
-    final_assets = [t.asset for t in traders_list]
-    
-    data_mean = np.mean(final_assets)
-    data_std = np.std(final_assets)
-    
-    if data_std == 0: return
+# rule_choose_action で使い回す戦略 (乱数は random モジュール)
+_RULE_STRATEGY = RuleStrategy()
+
+def rule_choose_action(board):
+    """ ルールベース・プレイヤーの行動 (板(dict)を見て成立・上書きになる側を選ぶ). 中身は engine.RuleStrategy """
+    role, price = _RULE_STRATEGY.choose(-1, Board.from_dict(board))
+    return ROLES[role], price
+
+
+def run_mixed_simulation(population, num_periods, steps_per_period, trade_log=None, action_stats=None,
+                         prof=None, market='board', start_period=0, checkpointer=None, rng=None, backend='python'):
+    """
+    ZIT と Rule の混合市場を実行する (マッチングは engine.run_simulation)
+    population: TraderPopulation (資産・取引済みフラグ・指値・タイプを配列で持つ)
+    行動統計は action_stats (ActionStats) にその場で数える
+    取引ログは trade_log (TradeLog) を渡したときだけ記録する
+    prof: profiling.Profiler を渡すとフェーズ別・タイプ別の時間を計測する
+    market: 'board' (従来の1枠の板) / 'book' (価格優先・時間優先の複数価格の板)
+    start_period / checkpointer: チェックポイントからの再開と定期保存 (checkpoint.Checkpointer)
+    rng: 選択・売買・価格の乱数 (rng.BlockRNG など. 既定は random モジュール)
+    backend: 'python' / 'kernel' (kernels.py のコンパイル済みカーネル. rng は BlockRNG, 取引ログなし)
+    """
+    if action_stats is None:
+        action_stats = ActionStats()
+    return run_simulation(population, default_strategies(rng=rng), num_periods, steps_per_period,
+                          trade_log=trade_log, action_stats=action_stats, prof=prof, market=market,
+                          start_period=start_period, checkpointer=checkpointer, rng=rng, backend=backend)
+
+
+def plot_and_save_graph(assets, title, output_filename):
+    import matplotlib.pyplot as plt  # 描画するときだけ読み込む (起動を速くするため)
 
     # 全体での正規化
-    std_data = np.abs([(x - data_mean) / data_std for x in final_assets])
-    sorted_data = np.sort(std_data)
-    y_values = 1.0 - (np.arange(len(sorted_data)) / len(sorted_data))
+    sorted_data, y_values = analysis.asset_ccdf(assets)
+    if sorted_data.size == 0: return
     
     # 理論値
-    x_th = np.logspace(-2, 1, 100)
-    y_th = 2 * stats.norm.sf(x_th)
+    x_th, y_th = analysis.gaussian_ccdf()
 
     plt.figure(figsize=(10, 6))
     plt.plot(sorted_data, y_values, 'b.', label='Simulation (All)', markersize=3)
@@ -251,48 +67,20 @@ def plot_and_save_graph(traders_list, title, output_filename):
     print(f"グラフPNG保存(全体版): {output_filename}")
 
 
-def analyze_and_save_graph(logs, label, output_dir="fig"):
+def analyze_and_save_graph(action_stats, label, output_dir="fig", types=('ZIT', 'Rule')):
+    """ シミュレーション中に数えた ActionStats から行動グラフを作る (DAT は results_store.export_dat で書く) """
+    import matplotlib.pyplot as plt
     os.makedirs(output_dir, exist_ok=True)
     
-    stats = {
-        'ZIT':  {'Sell Exec': 0, 'Sell Over': 0, 'Buy Exec': 0, 'Buy Over': 0, 'Fail': 0},
-        'Rule': {'Sell Exec': 0, 'Sell Over': 0, 'Buy Exec': 0, 'Buy Over': 0, 'Fail': 0}
-    }
-    
-    for row in logs:
-        agent_type = row[3]
-        role = row[4]
-        result = row[6]
-        
-        if result == 'fail':
-            stats[agent_type]['Fail'] += 1
-        elif role == 'buyer':
-            if result == 'executed':
-                stats[agent_type]['Buy Exec'] += 1
-            elif result == 'overwrite':
-                stats[agent_type]['Buy Over'] += 1
-        elif role == 'seller':
-            if result == 'executed':
-                stats[agent_type]['Sell Exec'] += 1
-            elif result == 'overwrite':
-                stats[agent_type]['Sell Over'] += 1
-
-    dat_filename = os.path.join(output_dir, f"action_stats_{label}.dat")
-    with open(dat_filename, "w") as f:
-        f.write("# Type Fail Buy_Over Buy_Exec Sell_Over Sell_Exec\n")
-        for t_type in ['ZIT', 'Rule']:
-            d = stats[t_type]
-            line = f"{t_type} {d['Fail']} {d['Buy Over']} {d['Buy Exec']} {d['Sell Over']} {d['Sell Exec']}\n"
-            f.write(line)
-    print(f"行動統計DAT保存: {dat_filename}")
+    types = list(types)
+    stats = action_stats.as_dict(types)
 
     pdf_filename = os.path.join(output_dir, f"action_graph_{label}.pdf")
     
-    types = ['ZIT', 'Rule']
-    sell_exec = [stats[t]['Sell Exec'] for t in types]
-    sell_over = [stats[t]['Sell Over'] for t in types]
-    buy_exec  = [stats[t]['Buy Exec'] for t in types]
-    buy_over  = [stats[t]['Buy Over'] for t in types]
+    sell_exec = [stats[t]['Sell_Exec'] for t in types]
+    sell_over = [stats[t]['Sell_Over'] for t in types]
+    buy_exec  = [stats[t]['Buy_Exec'] for t in types]
+    buy_over  = [stats[t]['Buy_Over'] for t in types]
     fail      = [stats[t]['Fail'] for t in types]
 
     bottom_1 = np.array(fail)
@@ -309,7 +97,7 @@ def analyze_and_save_graph(logs, label, output_dir="fig"):
     plt.bar(types, sell_over, bottom=bottom_3, width=bar_width, color='orange', label='Sell Overwrite')
     plt.bar(types, sell_exec, bottom=bottom_4, width=bar_width, color='tab:red', label='Sell Executed')
 
-    plt.title(f"Action Pattern Breakdown (Rule: {label})")
+    plt.title(f"Action Pattern Breakdown ({types[-1]}: {label})")
     plt.ylabel("Count")
     plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', borderaxespad=0)
     plt.tight_layout()
@@ -319,59 +107,79 @@ def analyze_and_save_graph(logs, label, output_dir="fig"):
     print(f"行動グラフPDF保存: {pdf_filename}")
 
 
-if __name__ == '__main__':
-    
-    TOTAL_TRADERS = 2000    
-    NUM_PERIODS = 100       
-    STEPS_PER_PERIOD = TOTAL_TRADERS * 2 
-    
-    output_dir = "fig"
+def run_rule_sweep(rule_percentages, total_traders, num_periods, steps_per_period, output_dir="fig", seed=None,
+                   checkpoint_every=10, export_csv=False, export_dat_files=False, plot=True, market='board',
+                   backend='python'):
+    """
+    Rule の割合ごとに混合市場を実行し、results_Rule_<割合>pct に結果を保存する
+    plot=True なら資産CCDFのPNGと行動グラフのPDFも作る (matplotlib はそのときだけ読み込む)
+    backend='kernel' なら kernels.py のカーネルで実行する (取引ログは取らない)
+    """
     os.makedirs(output_dir, exist_ok=True)
 
-    save_gaussian_reference(f"{output_dir}/gaussian_theory.dat")
-
     print(f"\n--- Rule Trader シミュレーション開始 (出力先: {output_dir}) ---")
-    
-    rule_percentages = [0.1, 0.2, 0.3, 0.4, 0.5] 
 
-    for pct in rule_percentages:
+    run_dirs = []
+    for i, pct in enumerate(rule_percentages):
         label = f"{int(pct*100)}pct"
         print(f"\n=== Rule割合: {int(pct*100)}% ===")
         
-        num_rule = int(TOTAL_TRADERS * pct)
-        num_zit = TOTAL_TRADERS - num_rule
-        
-        mixed_traders = []
-        for i in range(num_rule):
-            mixed_traders.append(RuleTrader(i, INITIAL_ASSET))
-        for i in range(num_zit):
-            mixed_traders.append(ZITrader(i + num_rule, INITIAL_ASSET))
+        population_rng, rng = simulation_rngs(None if seed is None else [seed, i])
+        # 先頭 int(total_traders * pct) 人が Rule, 残りが ZIT
+        mixed_population = TraderPopulation.mixed(total_traders, pct, 'Rule', initial_asset=INITIAL_ASSET,
+                                                  rng=population_rng)
             
-        final_traders, logs = run_mixed_simulation(mixed_traders, NUM_PERIODS, STEPS_PER_PERIOD)
+        trade_log = TradeLog(out_dir=f'trade_log_Rule_{label}') if backend == 'python' else None
+        action_stats = ActionStats()
+        # 途中で落ちたときは最新のチェックポイントから同じ結果になるように再開する
+        checkpointer = Checkpointer(f'checkpoints_Rule_{label}', every=checkpoint_every,
+                                    params=dict(seed=seed, ratio=pct, num_traders=total_traders, num_periods=num_periods,
+                                                steps_per_period=steps_per_period, market=market, backend=backend))
+        start_period = checkpointer.resume(mixed_population, trade_log, action_stats, rng)
+        final_population, action_stats = run_mixed_simulation(mixed_population, num_periods, steps_per_period, trade_log,
+                                                              action_stats, market=market, start_period=start_period,
+                                                              checkpointer=checkpointer, rng=rng, backend=backend)
+        if trade_log is not None:
+            print(f"ログ保存: {trade_log.out_dir} ({len(trade_log)} 行)")
         
 
-        pkl_name = f'results_Rule_{label}.pkl'
-        with open(pkl_name, 'wb') as f:
-            pickle.dump(final_traders, f)
-        print(f"PKL保存: {pkl_name}")
+        # 資産・タイプ・行動統計を .npy + metadata.json で保存する (pickle の代わり)
+        run_dir = f'results_Rule_{label}'
+        save_run(run_dir, final_population, action_stats, label=label, types=['ZIT', 'Rule'], strategy='Rule',
+                 ratio=pct, num_periods=num_periods, steps_per_period=steps_per_period, seed=seed, market=market,
+                 backend=backend)
+        checkpointer.clear()
+        run_dirs.append(run_dir)
+        if export_dat_files:
+            export_dat(run_dir, output_dir)
 
 
-        csv_name = f'trade_history_Rule_{label}.csv'
-        with open(csv_name, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(["Period", "Step", "AgentID", "Type", "Role", "Price", "Result"])
-            writer.writerows(logs)
-        print(f"CSV保存: {csv_name}")
+        if export_csv and trade_log is not None:
+            trade_log.export_csv(f'trade_history_Rule_{label}.csv')
 
 
-        all_assets = [t.asset for t in final_traders]
-        
-        save_cdf_data_file(all_assets, f"{output_dir}/asset_ccdf_{label}_all.dat")
+        if plot:
+            plot_and_save_graph(final_population.asset, f"Rule {label} Asset Distribution (All)",
+                                f"{output_dir}/asset_dist_{label}.png")
+            analyze_and_save_graph(action_stats, label, output_dir=output_dir)
 
-        save_raw_asset_data(all_assets, f"{output_dir}/asset_raw_{label}_all.dat")
+    print("全シミュレーション完了")
+    if not export_dat_files:
+        print(f"gnuplot 用の .dat: python results_store.py export {' '.join(run_dirs)} --out {output_dir}")
+    return run_dirs
 
-        plot_and_save_graph(final_traders, f"Rule {label} Asset Distribution (All)", f"{output_dir}/asset_dist_{label}.png")
 
-        analyze_and_save_graph(logs, label, output_dir=output_dir)
+if __name__ == '__main__':
+    
+    TOTAL_TRADERS = 2000    
+    NUM_PERIODS = 100       
+    STEPS_PER_PERIOD = TOTAL_TRADERS * 2 
+    EXPORT_CSV = False  # True: バイナリのログに加えてCSVも書き出す
+    CHECKPOINT_EVERY = 10  # この期間ごとにチェックポイントを保存する (0 なら保存しない)
+    SEED = None  # 整数にすると同じ結果を再現できる (None: 毎回別の乱数)
+    EXPORT_DAT = False  # True: gnuplot 用の .dat もすぐ書き出す (後から python results_store.py export でも作れる)
+    
+    rule_percentages = [0.1, 0.2, 0.3, 0.4, 0.5] 
 
-    print("全シミュレーション完了")
\ No newline at end of file
+    run_rule_sweep(rule_percentages, TOTAL_TRADERS, NUM_PERIODS, STEPS_PER_PERIOD, output_dir="fig", seed=SEED,
+                   checkpoint_every=CHECKPOINT_EVERY, export_csv=EXPORT_CSV, export_dat_files=EXPORT_DAT)
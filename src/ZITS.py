@@ -1,60 +1,41 @@
 import random
 import numpy as np
 import sys
+import os
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from encoding import (encode_compact, COMPACT_DIM, COMPACT_DTYPE,
+                      BOARD_EMPTY, BOARD_ASK, BOARD_BID, ROLE_BUYER)
 
 # --- 定数 ---
 MAX_PRICE = 200 
 
 # --- エージェントクラス ---
 class ZeroIntelligenceTrader:
-    def __init__(self, agent_id):
+    def __init__(self, agent_id, rng=random):
         self.id = agent_id
-        self.cost = random.randint(0, MAX_PRICE)
-        self.value = random.randint(self.cost, MAX_PRICE)
+        self.rng = rng
+        self.cost = rng.randint(0, MAX_PRICE)
+        self.value = rng.randint(self.cost, MAX_PRICE)
 
     def get_buy_price(self):
-        return random.randint(0, self.value)
+        return self.rng.randint(0, self.value)
 
     def get_sell_price(self):
-        return random.randint(self.cost, MAX_PRICE)
-
-def encode_input_vector(board, agent_action):
-
-    # 1. 板の状態 (3 + 201 = 204次元)
-    # [空, 売り, 買い] + [価格0, ..., 価格200]
-    board_vec = np.zeros(3 + (MAX_PRICE + 1)) 
-    if board['type'] == 'empty':
-        board_vec[0] = 1
-    elif board['type'] == 'ask': # 売り板
-        board_vec[1] = 1
-        board_vec[3 + board['price']] = 1
-    elif board['type'] == 'bid': # 買い板
-        board_vec[2] = 1
-        board_vec[3 + board['price']] = 1
-
-    # 2. エージェントの行動 (2 + 201 = 203次元)
-    # [買い, 売り] + [価格0, ..., 価格200]
-    action_vec = np.zeros(2 + (MAX_PRICE + 1)) 
-    if agent_action['role'] == 'buyer':
-        action_vec[0] = 1
-        action_vec[2 + agent_action['price']] = 1
-    elif agent_action['role'] == 'seller':
-        action_vec[1] = 1
-        action_vec[2 + agent_action['price']] = 1
-    
-    # 結合して407次元ベクトルを返す
-    return np.concatenate([board_vec, action_vec])
-
-def run_market_simulation(num_traders, num_steps):
-    traders = [ZeroIntelligenceTrader(i) for i in range(num_traders)]
+        return self.rng.randint(self.cost, MAX_PRICE)
+
+def run_market_simulation(num_traders, num_steps, rng=random):
+    """ rng: random モジュール (既定) か random.Random / rng.BlockRNG """
+    traders = [ZeroIntelligenceTrader(i, rng) for i in range(num_traders)]
     board = {'type': 'empty', 'price': -1}
-    x_data, y_data = [], []
+    # x: コンパクト形式 (板の種類, 板の価格, 売買, 提示価格), y: 0~4のクラス
+    x_data = np.empty((num_steps, COMPACT_DIM), dtype=COMPACT_DTYPE)
+    y_data = np.empty(num_steps, dtype=np.uint8)
 
     print(f"シミュレーション開始 (Steps: {num_steps}, Traders: {num_traders})")
-    for _ in range(num_steps):
-        agent = random.choice(traders)
-        role = random.choice(['buyer', 'seller'])
+    for step in range(num_steps):
+        agent = rng.choice(traders)
+        role = rng.choice(['buyer', 'seller'])
         
         if role == 'buyer':
             price = agent.get_buy_price()
@@ -63,62 +44,182 @@ def run_market_simulation(num_traders, num_steps):
         
         agent_action = {'role': role, 'price': price}
 
-        x_data.append(encode_input_vector(board, agent_action))
+        x_data[step] = encode_compact(board, agent_action)
 
         # 0:売り上書き, 1:買い上書き, 2:売り成立, 3:買い成立, 4:不成立
         
         if role == 'buyer':
             if board['type'] == 'ask' and price >= board['price']:
-                y_data.append(3) 
+                y_data[step] = 3 
                 board = {'type': 'empty', 'price': -1}
             
             elif (board['type'] == 'bid' and price > board['price']) or board['type'] == 'empty':
-                y_data.append(1) 
+                y_data[step] = 1 
                 board = {'type': 'bid', 'price': price}
             else:
-                y_data.append(4) 
+                y_data[step] = 4 
                 pass 
 
         else: # seller
 
             if board['type'] == 'bid' and price <= board['price']:
-                y_data.append(2)
+                y_data[step] = 2
                 board = {'type': 'empty', 'price': -1} 
 
             elif (board['type'] == 'ask' and price < board['price']) or board['type'] == 'empty':
-                y_data.append(0)
+                y_data[step] = 0
                 board = {'type': 'ask', 'price': price} 
 
             else:
-                y_data.append(4) 
+                y_data[step] = 4 
                 pass 
 
     print(f"データ生成完了")
-    return np.array(x_data), np.array(y_data)
+    return x_data, y_data
+
+def _scan_board(roles, prices, board_type, board_price):
+    """
+    板の状態遷移を1チャンク分まとめて走査する
+    roles/prices はリスト, 板は (種類, 価格) の整数で受け渡す
+    """
+    n = len(roles)
+    board_types = [0] * n
+    board_prices = [0] * n
+    labels = [0] * n
+
+    for i in range(n):
+        board_types[i] = board_type
+        board_prices[i] = board_price
+        price = prices[i]
+
+        if roles[i] == ROLE_BUYER:
+            if board_type == BOARD_ASK and price >= board_price:
+                labels[i] = 3
+                board_type, board_price = BOARD_EMPTY, -1
+            elif (board_type == BOARD_BID and price > board_price) or board_type == BOARD_EMPTY:
+                labels[i] = 1
+                board_type, board_price = BOARD_BID, price
+            else:
+                labels[i] = 4
+
+        else: # seller
+            if board_type == BOARD_BID and price <= board_price:
+                labels[i] = 2
+                board_type, board_price = BOARD_EMPTY, -1
+            elif (board_type == BOARD_ASK and price < board_price) or board_type == BOARD_EMPTY:
+                labels[i] = 0
+                board_type, board_price = BOARD_ASK, price
+            else:
+                labels[i] = 4
+
+    return board_types, board_prices, labels, board_type, board_price
+
+def run_market_simulation_vectorized(num_traders, num_steps, seed=None, chunk_size=1 << 20):
+    """
+    run_market_simulation のベクトル化版 (ラベルの意味は同じ)
+    エージェント・売買・価格の抽選は板に依存しないのでまとめて引き、
+    板の遷移だけをチャンクごとに走査する
+    """
+    rng = np.random.default_rng(seed)
+    cost = rng.integers(0, MAX_PRICE + 1, size=num_traders)
+    value = rng.integers(cost, MAX_PRICE + 1)
+
+    x_data = np.empty((num_steps, COMPACT_DIM), dtype=COMPACT_DTYPE)
+    y_data = np.empty(num_steps, dtype=np.uint8)
+    board_type, board_price = BOARD_EMPTY, -1
+
+    print(f"シミュレーション開始 (Steps: {num_steps}, Traders: {num_traders}, vectorized)")
+    for start in range(0, num_steps, chunk_size):
+        end = min(start + chunk_size, num_steps)
+        size = end - start
+
+        agents = rng.integers(0, num_traders, size=size)
+        roles = rng.integers(0, 2, size=size)
+        # 買い: [0, value], 売り: [cost, MAX_PRICE]
+        is_buyer = roles == ROLE_BUYER
+        low = np.where(is_buyer, 0, cost[agents])
+        high = np.where(is_buyer, value[agents], MAX_PRICE)
+        prices = rng.integers(low, high + 1)
+
+        board_types, board_prices, labels, board_type, board_price = _scan_board(
+            roles.tolist(), prices.tolist(), board_type, board_price)
+
+        x_data[start:end, 0] = board_types
+        x_data[start:end, 1] = board_prices
+        x_data[start:end, 2] = roles
+        x_data[start:end, 3] = prices
+        y_data[start:end] = labels
+
+    print(f"データ生成完了")
+    return x_data, y_data
+
+def shard_filenames(seed, out_dir="."):
+    x_data_filename = os.path.join(out_dir, f"x_data_{seed:02d}.npy")
+    y_data_filename = os.path.join(out_dir, f"y_data_{seed:02d}.npy")
+    return x_data_filename, y_data_filename
+
+def save_npy_atomic(filename, array):
+    """ 一時ファイルに書き切ってから置き換える (途中で落ちても壊れたシャードを残さない) """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+def generate_shard(seed, num_traders, num_steps, out_dir="."):
+    """ 1シード分のデータを生成して保存する (既に両方のファイルがあれば何もしない) """
+    x_data_filename, y_data_filename = shard_filenames(seed, out_dir)
+    if os.path.exists(x_data_filename) and os.path.exists(y_data_filename):
+        return f"スキップ (既存): {x_data_filename}, {y_data_filename}"
+
+    # 乱数はシードごとに独立しているので、どのワーカーが担当しても同じデータになる
+    x_data, y_data = run_market_simulation_vectorized(num_traders, num_steps, seed=seed)
+    save_npy_atomic(y_data_filename, y_data)
+    save_npy_atomic(x_data_filename, x_data)
+    return f"保存完了: {x_data_filename}, {y_data_filename}"
+
+def generate_datasets(seeds, num_traders, num_steps, out_dir=".", workers=None):
+    """ シードごとのシャードをプロセスプールで並列に生成する """
+    os.makedirs(out_dir, exist_ok=True)
+    seeds = list(seeds)
+    workers = workers or os.cpu_count()
+    print(f"合計 {len(seeds)} セットのデータを {workers} プロセスで生成します")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(generate_shard, seed, num_traders, num_steps, out_dir): seed for seed in seeds}
+        for done, future in enumerate(as_completed(futures), 1):
+            print(f"[{done}/{len(seeds)}] Seed={futures[future]}: {future.result()}")
 
 if __name__ == "__main__":
 
     NUM_DATASETS = 20    
     NUM_TRADERS = 2000    
     SIMULATION_STEPS = 50000
+    # True: ベクトル化版 (np.random.default_rng(シード)), False: 従来のループ版
+    VECTORIZED = True
+    NUM_WORKERS = None  # None: CPUコア数
+
+    if VECTORIZED:
+        generate_datasets(range(NUM_DATASETS), NUM_TRADERS, SIMULATION_STEPS, workers=NUM_WORKERS)
+        print("全データの生成が完了しました")
+        sys.exit()
 
     print(f"合計 {NUM_DATASETS} セットのデータを連続生成します")
 
     for i in range(NUM_DATASETS):
         SEED_VALUE = i  
         
-        # シードの設定
-        random.seed(SEED_VALUE)
-        np.random.seed(SEED_VALUE)
+        # シードごとに独立した乱数 (グローバルの random は使わない. random.seed(シード) と同じ系列)
+        rng = random.Random(SEED_VALUE)
 
         print(f"--- [Set {i+1}/{NUM_DATASETS}] Seed={SEED_VALUE} ---")
         
         # シミュレーション実行
-        x_data, y_data = run_market_simulation(NUM_TRADERS, SIMULATION_STEPS)
+        x_data, y_data = run_market_simulation(NUM_TRADERS, SIMULATION_STEPS, rng)
         
         # ファイル名決定 
-        x_data_filename = f"x_data_{SEED_VALUE:02d}.npy"
-        y_data_filename = f"y_data_{SEED_VALUE:02d}.npy"
+        x_data_filename, y_data_filename = shard_filenames(SEED_VALUE)
         
         # 保存
         np.save(x_data_filename, x_data)
@@ -1,15 +1,19 @@
 import numpy as np
 import tensorflow as tf
-from collections import Counter
-from sklearn.model_selection import train_test_split
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Dropout, Input
 import glob 
+import os
 import sys  
+from encoding import INPUT_DIM as ONE_HOT_DIM, to_one_hot
+from dataset import ShardedDataset, BalancedBatchSampler, class_counts, stratified_split_indices, iter_batches
+from rng import spawn_generators, TRAINING_STREAMS
 
 
 SEED_VALUE = 42
-np.random.seed(SEED_VALUE)
+# 訓練データの均等化: 'under' (毎エポック引き直す), 'over' (水増し), 'none' (全件)
+SAMPLING_MODE = 'under'
+USE_CLASS_WEIGHT = False  # True: SAMPLING_MODE='none' などでクラス重みを使う
 tf.random.set_seed(SEED_VALUE)
 
 def create_model(input_dim, output_dim):
@@ -26,69 +30,80 @@ def create_model(input_dim, output_dim):
                   metrics=['accuracy'])
     return model
 
-def manual_under_sampling(X, y):
-    counts = Counter(y)
-    if len(counts) == 0:
-        return X, y
-    min_class_count = min(counts.values())
-    print(f"各クラスを最小数: {min_class_count} にサンプリングします。")
-
-    sampled_indices = []
-    for class_label in counts.keys():
-        class_indices = np.where(y == class_label)[0]
-        chosen_indices = np.random.choice(class_indices, min_class_count, replace=False)
-        sampled_indices.extend(chosen_indices)
-    
-    np.random.shuffle(sampled_indices)
-    return X[sampled_indices], y[sampled_indices]
-
-if __name__ == "__main__":
+def make_tf_dataset(dataset, epoch_indices, input_dim, batch_size=32):
+    """
+    エポックごとに epoch_indices() の添字でバッチを作る tf.data パイプライン
+    mmap したシャードから必要な行だけ読み、バッチごとに407次元へ展開する
+    """
+    output_signature = (
+        tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.uint8),
+    )
+    # エポックごとにジェネレータが呼び直され、サンプラーが添字を引き直す
+    ds = tf.data.Dataset.from_generator(
+        lambda: iter_batches(dataset, epoch_indices(), batch_size),
+        output_signature=output_signature,
+    )
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+def train(data_dir=".", epochs=30, sampling_mode=SAMPLING_MODE, use_class_weight=USE_CLASS_WEIGHT, seed=SEED_VALUE,
+          model_path='zit_model_407.keras'):
+    """
+    data_dir の x_data_*.npy / y_data_*.npy で学習し、model_path にモデルを保存する (学習済みモデルを返す)
+    均等化済みのテストデータも data_dir に保存する
+    """
     
     print(" 学習プロセスを開始します。")
     print("パターンに一致するデータファイルを検索中...")
 
-    x_files = sorted(glob.glob('x_data_*.npy'))
-    y_files = sorted(glob.glob('y_data_*.npy'))
+    x_files = sorted(glob.glob(os.path.join(data_dir, 'x_data_*.npy')))
+    y_files = sorted(glob.glob(os.path.join(data_dir, 'y_data_*.npy')))
 
     if not x_files:
         print(f"エラー: 'x_data_*.npy' (例: 'x_data_01.npy') という形式のファイルが見つかりません。")
-        sys.exit()
+        return None
     if len(x_files) != len(y_files):
         print(f"エラー: x_data ( {len(x_files)}個) と y_data ( {len(y_files)}個) のファイル数が一致しません。")
-        sys.exit()
+        return None
 
     print(f"--- 読み込むxデータファイル ({len(x_files)}個) ---")
     print(x_files)
     print(f"--- 読み込むyデータファイル ({len(y_files)}個) ---")
     print(y_files)
 
-    x_data_list = [np.load(f) for f in x_files]
-    y_data_list = [np.load(f) for f in y_files]
-
-    x_data = np.concatenate(x_data_list, axis=0)
-    y_data = np.concatenate(y_data_list, axis=0)
+    # x はメモリマップで開き、分割・均等化は添字だけで行う
+    dataset = ShardedDataset(x_files, y_files)
+    y_data = dataset.y
     
-    print(f"合計 {len(x_data)} ステップ分のデータを読み込みました。")
+    print(f"合計 {len(dataset)} ステップ分のデータを読み込みました。")
 
 
-    x_train, x_test, y_train, y_test = train_test_split(
-        x_data, y_data, test_size=0.2, random_state=SEED_VALUE, stratify=y_data
-    )
+    # 分割・均等化は用途ごとに独立した乱数ストリームを使う (SeedSequence(seed).spawn)
+    rngs = spawn_generators(seed, TRAINING_STREAMS)
+    train_indices, test_indices = stratified_split_indices(y_data, test_size=0.2, seed=rngs['split'])
+    # 訓練データの20%を検証用にする (validation_split=0.2 の代わり)
+    fit_pos, val_pos = stratified_split_indices(y_data[train_indices], test_size=0.2, seed=rngs['val_split'])
+    fit_indices, val_indices = train_indices[fit_pos], train_indices[val_pos]
     
     print("\n--- 訓練データのクラス内訳（均等化前）---")
-    print(sorted(Counter(y_train).items()))
-    x_train_resampled, y_train_resampled = manual_under_sampling(x_train, y_train)
-    print("--- 訓練データのクラス内訳（均等化後）---")
-    print(sorted(Counter(y_train_resampled).items()))
+    print(class_counts(y_data[fit_indices]))
+    # 訓練データはエポックごとに均等化し直す (多数派クラスの行を毎回引き直す)
+    train_sampler = BalancedBatchSampler(y_data, fit_indices, mode=sampling_mode, seed=rngs['train_sampler'])
+    print(f"--- 訓練データのクラス内訳（均等化後, 1エポックあたり, mode={sampling_mode}）---")
+    print(class_counts(y_data[train_sampler.epoch_indices()]))
+
+    # 検証・テストデータは一度だけ均等化して固定する
+    val_resampled = BalancedBatchSampler(y_data, val_indices, mode='under', seed=rngs['val_sampler']).epoch_indices()
 
     print("\n--- テストデータのクラス内訳（均等化前）---")
-    print(sorted(Counter(y_test).items()))
-    x_test_resampled, y_test_resampled = manual_under_sampling(x_test, y_test)
+    print(class_counts(y_data[test_indices]))
+    test_resampled = BalancedBatchSampler(y_data, test_indices, mode='under', seed=rngs['test_sampler']).epoch_indices()
     print("--- テストデータのクラス内訳（均等化後）---")
-    print(sorted(Counter(y_test_resampled).items()))
+    print(class_counts(y_data[test_resampled]))
 
 
-    INPUT_DIM = x_data.shape[1]
+    # コンパクト形式 (n, 4) はバッチごとに407次元へ展開する
+    INPUT_DIM = ONE_HOT_DIM if dataset.is_compact else dataset.dim
     OUTPUT_DIM = len(np.unique(y_data))
     
 
@@ -96,17 +111,28 @@ if __name__ == "__main__":
         print(f" 読み込まれたデータの入力次元が 407 ではありません。(検出値: {INPUT_DIM})")
         
     model = create_model(INPUT_DIM, OUTPUT_DIM)
+
+    train_batches = make_tf_dataset(dataset, train_sampler.epoch_indices, INPUT_DIM, batch_size=32)
+    val_batches = make_tf_dataset(dataset, lambda: val_resampled, INPUT_DIM, batch_size=32)
+    class_weight = train_sampler.class_weights() if use_class_weight else None
     
     print("\n--- モデルの学習開始 ---")
     history = model.fit(
-        x_train_resampled, y_train_resampled,
-        epochs=30,
-        batch_size=32,
-        validation_split=0.2,
+        train_batches,
+        epochs=epochs,
+        validation_data=val_batches,
+        class_weight=class_weight,
         verbose=1
     )
     
-    model.save('zit_model_407.keras')
-    np.save('x_test_resampled.npy', x_test_resampled)
-    np.save('y_test_resampled.npy', y_test_resampled)
-    print("モデルと均等化済みテストデータを保存しました。")
\ No newline at end of file
+    model.save(model_path)
+    # テストデータは従来どおり407次元の one-hot で保存する (モデルにそのまま入れられる形)
+    np.save(os.path.join(data_dir, 'x_test_resampled.npy'), to_one_hot(dataset.take(test_resampled)))
+    np.save(os.path.join(data_dir, 'y_test_resampled.npy'), y_data[test_resampled])
+    print("モデルと均等化済みテストデータを保存しました。")
+    return model
+
+if __name__ == "__main__":
+
+    if train() is None:
+        sys.exit()
@@ -0,0 +1,94 @@
+import os
+import numpy as np
+
+from trade_log import AGENT_TYPES, AGENT_TYPE_CODES, RESULT_FAIL, RESULT_OVERWRITE, RESULT_EXECUTED
+
+
+OUTCOMES = ('Fail', 'Buy_Over', 'Buy_Exec', 'Sell_Over', 'Sell_Exec')
+
+# OUTCOME_INDEX[result][role] -> OUTCOMES の列番号 (role: 0 買い, 1 売り)
+OUTCOME_INDEX = [None, None, None]
+OUTCOME_INDEX[RESULT_FAIL] = [0, 0]
+OUTCOME_INDEX[RESULT_OVERWRITE] = [1, 3]
+OUTCOME_INDEX[RESULT_EXECUTED] = [2, 4]
+
+
+class ActionStats:
+    """
+    行動パターン (Fail/Buy_Over/Buy_Exec/Sell_Over/Sell_Exec) のタイプ別カウンタ
+    マッチングループから record() で1件ずつ数え、期間ごとの内訳も残す
+    """
+    def __init__(self):
+        self.period_counts = []
+        self._current = None
+
+    def start_period(self):
+        # 現在の期間は Python の int のリストで数える (ループ内で numpy を触らない)
+        self._current = [[0] * len(OUTCOMES) for _ in AGENT_TYPES]
+
+    def end_period(self):
+        if self._current is not None:
+            self.period_counts.append(np.array(self._current, dtype=np.int64))
+            self._current = None
+
+    def record(self, agent_type, role, result):
+        """ agent_type/role/result はコード (AGENT_TYPE_CODES, ROLE_*, RESULT_*) """
+        self._current[agent_type][OUTCOME_INDEX[result][role]] += 1
+
+    def add_period(self, counts):
+        """ 1期間分の (タイプ数, 5) のカウントをまとめて加える (kernels のように外で数えたとき用) """
+        self.period_counts.append(np.array(counts, dtype=np.int64))
+
+    def per_period(self):
+        """ (期間数, タイプ数, 5) の配列 """
+        periods = list(self.period_counts)
+        if self._current is not None:
+            periods.append(np.array(self._current, dtype=np.int64))
+        if not periods:
+            return np.zeros((0, len(AGENT_TYPES), len(OUTCOMES)), dtype=np.int64)
+        return np.stack(periods)
+
+    def load_per_period(self, counts):
+        """ per_period() で取り出した配列から戻す (チェックポイントからの再開用) """
+        self.period_counts = [np.array(c, dtype=np.int64) for c in counts]
+        self._current = None
+
+    def totals(self):
+        """ (タイプ数, 5) の配列 """
+        return self.per_period().sum(axis=0)
+
+    def as_dict(self, types=AGENT_TYPES):
+        totals = self.totals()
+        return {t: dict(zip(OUTCOMES, totals[AGENT_TYPE_CODES[t]].tolist())) for t in types}
+
+    def save_dat(self, filename, types):
+        """ 従来の action_stats_*.dat と同じ形式で保存する """
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        totals = self.totals()
+        with open(filename, 'w') as f:
+            f.write("# Type " + " ".join(OUTCOMES) + "\n")
+            for t in types:
+                f.write(f"{t} " + " ".join(str(c) for c in totals[AGENT_TYPE_CODES[t]]) + "\n")
+
+    def save_period_dat(self, filename, types):
+        """ 期間ごとの内訳を保存する (1行 = 1期間, 列はタイプごとの5項目) """
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        counts = self.per_period()[:, [AGENT_TYPE_CODES[t] for t in types], :]
+        header = "Period " + " ".join(f"{t}_{o}" for t in types for o in OUTCOMES)
+        table = np.column_stack([np.arange(1, len(counts) + 1), counts.reshape(len(counts), -1)])
+        np.savetxt(filename, table, fmt='%d', header=header)
+
+    @classmethod
+    def from_trade_log(cls, log):
+        """ 保存済みの TradeLog (構造化配列) から集計し直す """
+        stats = cls()
+        if len(log) == 0:
+            return stats
+        lookup = np.array(OUTCOME_INDEX, dtype=np.intp)
+        outcome = lookup[log['result'], log['role']]
+        periods = log['period'].astype(np.intp) - 1
+        num_periods = periods.max() + 1
+        counts = np.zeros((num_periods, len(AGENT_TYPES), len(OUTCOMES)), dtype=np.int64)
+        np.add.at(counts, (periods, log['type'].astype(np.intp), outcome), 1)
+        stats.period_counts = list(counts)
+        return stats
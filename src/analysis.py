@@ -0,0 +1,110 @@
+import math
+import os
+import numpy as np
+
+
+# 正規分布の理論値を描く範囲 (従来の np.logspace(-2, 1, 100) と同じ)
+GAUSS_X = np.logspace(-2, 1, 100)
+
+# erfc の近似 (Numerical Recipes の erfcc, チェビシェフ近似. どの z でも相対誤差 < 1.2e-7)
+_ERFC_COEFFS = (-1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+                0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277)
+
+
+def _erfc(z):
+    """ 配列の erfc (scipy があれば scipy.special.erfc, 無ければ上の近似を NumPy で計算する) """
+    z = np.asarray(z, dtype=np.float64)
+    try:
+        from scipy.special import erfc
+    except ImportError:
+        t = 1.0 / (1.0 + 0.5 * np.abs(z))
+        poly = np.zeros_like(t)
+        for c in reversed(_ERFC_COEFFS):
+            poly = c + t * poly
+        ans = t * np.exp(-z * z + poly)
+        return np.where(z >= 0, ans, 2.0 - ans)
+    return erfc(z)
+
+
+def standardized_abs(data):
+    """ |x - μ| / σ (σ = 0 のときは空配列) """
+    data = np.asarray(data, dtype=np.float64)
+    if data.size == 0:
+        return np.array([])
+    sd = data.std()
+    if sd == 0:
+        return np.array([])
+    return np.abs((data - data.mean()) / sd)
+
+
+def ccdf(values):
+    """ 経験的な相補累積分布 P(X >= x) (全点) """
+    sorted_values = np.sort(np.asarray(values, dtype=np.float64))
+    n = sorted_values.size
+    return sorted_values, 1.0 - np.arange(n) / max(n, 1)
+
+
+def asset_ccdf(assets):
+    """ 標準化した資産の絶対値のCCDF """
+    return ccdf(standardized_abs(assets))
+
+
+def log_binned_ccdf(values, num_bins=100, x_min=1e-2, x_max=None):
+    """
+    対数等間隔の点でCCDFを評価する (出力は num_bins 点で、エージェント数に依存しない)
+    空のビンになる点は除く
+    """
+    sorted_values = np.sort(np.asarray(values, dtype=np.float64))
+    n = sorted_values.size
+    if n == 0:
+        return np.array([]), np.array([])
+    if x_max is None:
+        x_max = sorted_values[-1]
+    x = np.logspace(np.log10(x_min), np.log10(max(x_max, x_min)), num_bins)
+    y = (n - np.searchsorted(sorted_values, x, side='left')) / n
+    keep = y > 0
+    return x[keep], y[keep]
+
+
+def gaussian_ccdf(x=GAUSS_X):
+    """ 標準正規分布の |X| のCCDF: 2 * sf(x) = erfc(x / √2) """
+    x = np.asarray(x, dtype=np.float64)
+    return x, _erfc(x / math.sqrt(2.0))
+
+
+def _prepare(filename):
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+
+
+def save_xy_dat(filename, x, y, header):
+    """ 2列のgnuplot用DATを一括で書き出す (header は先頭に '# ' が付く) """
+    _prepare(filename)
+    np.savetxt(filename, np.column_stack([x, y]), fmt='%.12g', header=header, comments='# ')
+
+
+def save_values_dat(filename, values, header):
+    """ 1列のgnuplot用DATを一括で書き出す """
+    _prepare(filename)
+    np.savetxt(filename, np.asarray(values, dtype=np.float64), fmt='%.12g', header=header, comments='# ')
+
+
+def save_ccdf_dat(assets, filename, header="Normalized_Asset_Abs CCDF_Value"):
+    """ 資産のCCDFを保存する (x > 0 の点のみ). σ = 0 なら何もせず False を返す """
+    x, y = asset_ccdf(assets)
+    if x.size == 0:
+        return False
+    keep = x > 0
+    save_xy_dat(filename, x[keep], y[keep], header)
+    return True
+
+
+def save_log_binned_ccdf_dat(assets, filename, num_bins=100, header="Normalized_Asset_Abs CCDF_Value (log-binned)"):
+    x, y = log_binned_ccdf(standardized_abs(assets), num_bins=num_bins)
+    if x.size == 0:
+        return False
+    save_xy_dat(filename, x, y, header)
+    return True
+
+
+def save_gaussian_dat(filename, header="Gaussian_X Gaussian_Y(CCDF)"):
+    save_xy_dat(filename, *gaussian_ccdf(), header)
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+BENCHMARKS = ['zit', 'rule', 'ml', 'rule_book', 'zits', 'zits_loop', 'ml_decision']
+DEFAULT_SIZES = [1000, 10000, 100000]
+BOARDS = [{'type': 'empty', 'price': -1, 'agent_id': -1},
+          {'type': 'ask', 'price': 100, 'agent_id': 0},
+          {'type': 'bid', 'price': 100, 'agent_id': 0}]
+
+
+def _peak_rss_mb():
+    # Linux の ru_maxrss は KB 単位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _random_policy(seed, weights_path=None):
+    """ ベンチマーク用の MLDecisionTable (重みが無ければ乱数の重みの NumpyMLP で作る) """
+    from ml_policy import MLDecisionTable
+    from mlp_runtime import NumpyMLP
+    if weights_path is not None:
+        return MLDecisionTable(NumpyMLP.load(weights_path))
+    return MLDecisionTable(NumpyMLP.random(seed))
+
+
+LOOP_BENCHMARKS = ('zit', 'rule', 'ml', 'rule_book')
+
+
+def run_case(kind, num_traders, num_periods, steps_per_period, ratio, seed, weights_path=None, trace_file=None,
+             rng_mode='global'):
+    """
+    1ケース分を実行して結果の dict を返す (ピークRSSを測るため別プロセスで呼ぶ)
+    期間ループは計測なしで時間を測ったあと、同じシードで Profiler 付きでもう一度回してフェーズ別の時間を取る
+    rng_mode: 'global' (random モジュール) / 'block' (rng.BlockRNG)
+    """
+    from population import TraderPopulation
+    from profiling import Profiler
+    from rng import simulation_rngs
+    total_steps = num_periods * steps_per_period
+    policy = _random_policy(seed, weights_path) if kind in ('ml', 'ml_decision') else None
+
+    # BlockRNG は毎回同じシードから作り直す (計測なし・計測ありで同じステップ数になる)
+    make_rng = (lambda: simulation_rngs(seed)[1]) if rng_mode == 'block' else (lambda: None)
+
+    # import (matplotlib など) を計測に含めないよう先に済ませる
+    if kind == 'zit':
+        from ZIT import run_ZIT_simulation
+        make_population = lambda: TraderPopulation.mixed(num_traders, seed=seed)
+        run = lambda population, prof=None, rng=None: run_ZIT_simulation(population, num_periods, steps_per_period,
+                                                                        prof=prof, rng=rng)
+    elif kind == 'rule':
+        from Rule import run_mixed_simulation
+        make_population = lambda: TraderPopulation.mixed(num_traders, ratio, 'Rule', seed=seed)
+        run = lambda population, prof=None, rng=None: run_mixed_simulation(population, num_periods, steps_per_period,
+                                                                          prof=prof, rng=rng)
+    elif kind == 'rule_book':
+        from Rule import run_mixed_simulation
+        import orderbook  # noqa: F401  (engine.run_simulation は market='book' のときに初めて読み込む)
+        make_population = lambda: TraderPopulation.mixed(num_traders, ratio, 'Rule', seed=seed)
+        run = lambda population, prof=None, rng=None: run_mixed_simulation(population, num_periods, steps_per_period,
+                                                                          prof=prof, market='book', rng=rng)
+    elif kind == 'ml':
+        from ML import run_mixed_simulation
+        make_population = lambda: TraderPopulation.mixed(num_traders, ratio, 'ML', seed=seed)
+        run = lambda population, prof=None, rng=None: run_mixed_simulation(population, num_periods, steps_per_period,
+                                                                          policy=policy, prof=prof, rng=rng)
+    elif kind == 'zits':
+        from ZITS import run_market_simulation_vectorized
+        make_population = lambda: None
+        run = lambda population: run_market_simulation_vectorized(num_traders, total_steps, seed=seed)
+    elif kind == 'zits_loop':
+        from ZITS import run_market_simulation
+        make_population = lambda: None
+        run = lambda population: run_market_simulation(num_traders, total_steps, make_rng() or random.Random(seed))
+    elif kind == 'ml_decision':
+        from ML import ml_choose_action
+
+        make_population = lambda: None
+
+        def run(population):
+            for i in range(total_steps):
+                ml_choose_action(policy, BOARDS[i % 3])
+    else:
+        raise ValueError(f"未知のベンチマークです: {kind}")
+
+    random.seed(seed)
+    np.random.seed(seed)
+    population = make_population()
+    loop_args = (None, make_rng()) if kind in LOOP_BENCHMARKS else ()
+    t0 = time.perf_counter()
+    run(population, *loop_args)
+    elapsed = time.perf_counter() - t0
+
+    result = {
+        'benchmark': kind, 'traders': num_traders, 'periods': num_periods,
+        'steps_per_period': steps_per_period, 'ratio': ratio, 'seed': seed, 'rng': rng_mode,
+        'steps': total_steps, 'seconds': elapsed,
+    }
+    if kind in LOOP_BENCHMARKS:
+        # 板に誰もいなくなるとループは途中で終わるので、実際のステップ数は Profiler から取る
+        random.seed(seed)
+        np.random.seed(seed)
+        prof = Profiler(progress_interval=None, sample_every=1000 if trace_file else 0)
+        run(make_population(), prof, make_rng())
+        summary = prof.summary()
+        result['steps'] = summary['steps']
+        result['phase_seconds'] = summary['phase_seconds']
+        result['by_type'] = summary['by_type']
+        if trace_file:
+            prof.export_chrome_trace(trace_file)
+    result['steps_per_sec'] = result['steps'] / elapsed
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit or 'unknown', 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpu_count': os.cpu_count()}
+
+
+def run_benchmarks(benchmarks, sizes, num_periods, steps_factor, ratio, seed, weights_path=None, trace_dir=None,
+                   rng_mode='global'):
+    results = []
+    # ケースごとに新しいプロセスで実行し、ピークRSSが前のケースの影響を受けないようにする
+    ctx = get_context('spawn')
+    for kind in benchmarks:
+        for n in sizes:
+            trace_file = os.path.join(trace_dir, f"trace_{kind}_{n}.json") if trace_dir else None
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                result = executor.submit(run_case, kind, n, num_periods, n * steps_factor, ratio, seed,
+                                         weights_path, trace_file, rng_mode).result()
+            results.append(result)
+            print(f"{kind:12s} N={n:>7d}: {result['steps_per_sec']:>12.0f} steps/s, "
+                  f"{result['seconds']:.2f} s, peak RSS {result['peak_rss_mb']:.0f} MB")
+            if 'phase_seconds' in result:
+                print("              " + ", ".join(f"{k} {v:.3f}s" for k, v in result['phase_seconds'].items()))
+    return {'meta': _metadata(), 'results': results}
+
+
+def compare(old_file, new_file):
+    """ 2つの結果JSONの steps/s を比べる """
+    with open(old_file) as f:
+        old = {(r['benchmark'], r['traders']): r for r in json.load(f)['results']}
+    with open(new_file) as f:
+        new = json.load(f)['results']
+    for r in new:
+        key = (r['benchmark'], r['traders'])
+        if key in old:
+            ratio = r['steps_per_sec'] / old[key]['steps_per_sec']
+            print(f"{key[0]:12s} N={key[1]:>7d}: {old[key]['steps_per_sec']:>12.0f} -> "
+                  f"{r['steps_per_sec']:>12.0f} steps/s (x{ratio:.2f})")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="市場シミュレータのベンチマーク")
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--periods', type=int, default=2)
+    parser.add_argument('--steps-factor', type=int, default=2, help="1期間のステップ数 = トレーダー数 × この値")
+    parser.add_argument('--ratio', type=float, default=0.3, help="Rule/ML の割合")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rng', choices=['global', 'block'], default='global',
+                        help="期間ループの乱数: random モジュール / rng.BlockRNG")
+    parser.add_argument('--ml-weights', default=None, help="zit_model_407.npz (省略時は乱数の重み)")
+    parser.add_argument('--out', default=None, help="結果JSONの保存先 (省略時は bench_results/bench_<commit>.json)")
+    parser.add_argument('--trace-dir', default=None, help="期間ループの Chrome trace JSON を書き出すディレクトリ")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="2つの結果JSONを比較する")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    report = run_benchmarks(args.benchmarks, args.sizes, args.periods, args.steps_factor,
+                            args.ratio, args.seed, args.ml_weights, args.trace_dir, args.rng)
+    out = args.out or os.path.join("bench_results", f"bench_{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"結果を保存しました: {out}")
@@ -0,0 +1,178 @@
+import glob
+import json
+import os
+import random
+import numpy as np
+
+from rng import BlockRNG
+
+
+POPULATION_ARRAYS = ('type', 'asset', 'traded', 'cost', 'value', 'buy_price', 'sell_price')
+FORMAT_VERSION = 1
+
+
+def _write_atomic(filename, write):
+    """ 一時ファイルに書き切ってから置き換える (途中で落ちても壊れたファイルを残さない) """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def save_checkpoint(filename, periods_done, population, trade_log=None, action_stats=None, extra=None, rng=None):
+    """
+    期間の区切りの状態を filename (.npz) と同名の .json に保存する (pickle は使わない)
+    .npz: トレーダーの配列, random / np.random / rng (BlockRNG の残りのバッファも) の内部状態,
+          期間別の行動統計 (メモリ上のログ)
+    .json: 期間数, 乱数の状態のスカラー部分, ログのオフセット, extra
+    .json は最後に書くので、.json があるチェックポイントは完全に書き終わっている
+    """
+    if trade_log is not None:
+        trade_log.flush()
+
+    version, mt_state, gauss_next = random.getstate()
+    np_name, np_keys, np_pos, np_has_gauss, np_cached_gaussian = np.random.get_state()
+    arrays = {name: getattr(population, name) for name in POPULATION_ARRAYS}
+    arrays['random_state'] = np.array(mt_state, dtype=np.uint32)
+    arrays['np_random_keys'] = np_keys
+    if action_stats is not None:
+        arrays['action_stats'] = action_stats.per_period()
+    if trade_log is not None and trade_log.out_dir is None:
+        arrays['trade_log'] = trade_log.read()
+    rng_meta = None
+    if isinstance(rng, BlockRNG):
+        rng_meta, arrays['rng_buffer'] = rng.getstate()
+    elif isinstance(rng, random.Random):
+        # random モジュールそのもの (グローバルの状態) は上の random_state で保存済み
+        rng_version, rng_mt_state, rng_gauss_next = rng.getstate()
+        arrays['rng_mt_state'] = np.array(rng_mt_state, dtype=np.uint32)
+        rng_meta = {'version': rng_version, 'gauss_next': rng_gauss_next}
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'periods_done': periods_done,
+        'random': {'version': version, 'gauss_next': gauss_next},
+        'np_random': {'name': np_name, 'pos': int(np_pos), 'has_gauss': int(np_has_gauss),
+                      'cached_gaussian': float(np_cached_gaussian)},
+        'population_rng': population.rng.bit_generator.state,
+        'rng': rng_meta,
+        'trade_log': None if trade_log is None else {
+            'out_dir': trade_log.out_dir, 'num_chunks': trade_log.num_chunks, 'num_flushed': trade_log.num_flushed},
+        'extra': extra or {},
+    }
+    _write_atomic(filename, lambda f: np.savez(f, **arrays))
+    json_filename = os.path.splitext(filename)[0] + ".json"
+    _write_atomic(json_filename, lambda f: f.write(json.dumps(meta, indent=2).encode('utf-8')))
+
+
+def read_checkpoint_meta(filename):
+    """ チェックポイント (.npz) と同名の .json のメタデータを返す """
+    with open(os.path.splitext(filename)[0] + ".json") as f:
+        return json.load(f)
+
+
+def load_checkpoint(filename, population, trade_log=None, action_stats=None, rng=None):
+    """ save_checkpoint で保存した状態に population / 乱数 (rng も) / ログ / 行動統計を戻し、メタデータを返す """
+    meta = read_checkpoint_meta(filename)
+    if meta['format_version'] != FORMAT_VERSION:
+        raise ValueError(f"チェックポイントの形式が違います: {meta['format_version']}")
+
+    with np.load(filename) as data:
+        if len(data['type']) != len(population):
+            raise ValueError(f"トレーダー数が違います: {len(data['type'])} != {len(population)}")
+        for name in POPULATION_ARRAYS:
+            getattr(population, name)[:] = data[name]
+        random_meta = meta['random']
+        random.setstate((random_meta['version'], tuple(data['random_state'].tolist()), random_meta['gauss_next']))
+        np_meta = meta['np_random']
+        np.random.set_state((np_meta['name'], data['np_random_keys'], np_meta['pos'],
+                             np_meta['has_gauss'], np_meta['cached_gaussian']))
+        population.rng.bit_generator.state = meta['population_rng']
+        if isinstance(rng, BlockRNG):
+            rng.setstate((meta['rng'], data['rng_buffer']))
+        elif isinstance(rng, random.Random):
+            rng.setstate((meta['rng']['version'], tuple(data['rng_mt_state'].tolist()), meta['rng']['gauss_next']))
+        if action_stats is not None:
+            action_stats.load_per_period(data['action_stats'] if 'action_stats' in data else [])
+        if trade_log is not None and meta['trade_log'] is not None:
+            log_meta = meta['trade_log']
+            rows = data['trade_log'] if 'trade_log' in data else None
+            trade_log.resume(log_meta['num_chunks'], log_meta['num_flushed'], rows)
+    return meta
+
+
+class Checkpointer:
+    """
+    every 期間ごとに directory/checkpoint_NNNNNN.npz (+ .json) を書き、新しい keep 個だけ残す
+    resume() は最新のチェックポイントから状態を戻して、次に実行する期間の番号を返す
+    params (シード・人数・割合などランの設定) は extra に書き、resume() では設定が同じチェックポイントだけ使う
+    ランが最後まで終わって結果を保存したら clear() で消す (次のランが古い状態から再開しないように)
+    """
+    def __init__(self, directory, every=10, keep=2, params=None):
+        self.directory = directory
+        self.every = every
+        self.keep = keep
+        # 保存した .json と比べるので、JSON に通した形 (タプルはリスト) にしておく
+        self.params = json.loads(json.dumps(params or {}))
+        os.makedirs(directory, exist_ok=True)
+
+    def _filename(self, periods_done):
+        return os.path.join(self.directory, f"checkpoint_{periods_done:06d}.npz")
+
+    def list(self):
+        """ 書き終わっている (.json がある) チェックポイントを古い順に返す """
+        done = []
+        for json_filename in sorted(glob.glob(os.path.join(self.directory, "checkpoint_*.json"))):
+            filename = os.path.splitext(json_filename)[0] + ".npz"
+            if os.path.exists(filename):
+                done.append(filename)
+        return done
+
+    def latest(self):
+        checkpoints = self.list()
+        return checkpoints[-1] if checkpoints else None
+
+    def due(self, periods_done):
+        return self.every > 0 and periods_done % self.every == 0
+
+    def save(self, periods_done, population, trade_log=None, action_stats=None, extra=None, rng=None):
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self._filename(periods_done)
+        save_checkpoint(filename, periods_done, population, trade_log, action_stats,
+                        dict(extra or {}, params=self.params), rng)
+        for old in self.list()[:-self.keep] if self.keep else []:
+            os.remove(old)
+            os.remove(os.path.splitext(old)[0] + ".json")
+        print(f"  ... チェックポイント保存: {filename}")
+
+    def clear(self):
+        """ チェックポイント (書きかけの一時ファイルも) をすべて消し、空になったディレクトリも消す """
+        if not os.path.isdir(self.directory):
+            return
+        for filename in glob.glob(os.path.join(self.directory, "checkpoint_*")):
+            os.remove(filename)
+        if not os.listdir(self.directory):
+            os.rmdir(self.directory)
+
+    def resume(self, population, trade_log=None, action_stats=None, rng=None):
+        """
+        最新のチェックポイントがあれば戻して期間数を返す (無ければ 0)
+        設定 (params) が違うチェックポイントは使わずに消す. 最初から実行するときは trade_log の古いチャンクも消す
+        """
+        filename = self.latest()
+        if filename is not None:
+            saved = read_checkpoint_meta(filename)['extra'].get('params', {})
+            if saved != self.params:
+                print(f"チェックポイントの設定が今回と違うので使わずに消します: {filename}\n"
+                      f"  保存時: {saved}\n  今回: {self.params}")
+                self.clear()
+                filename = None
+        if filename is None:
+            if trade_log is not None:
+                trade_log.resume(0, 0)
+            return 0
+        meta = load_checkpoint(filename, population, trade_log, action_stats, rng)
+        print(f"チェックポイントから再開: {filename} (期間 {meta['periods_done']} まで完了)")
+        return meta['periods_done']
@@ -0,0 +1,163 @@
+"""
+研究用スクリプトの共通の入口 (python cli.py <サブコマンド> ...)
+NumPy 以外の重いライブラリ (matplotlib, TensorFlow) は、そのサブコマンドで必要になったときだけ読み込む
+  generate       学習データ (x_data_*.npy / y_data_*.npy) の生成 (ZITS.py)
+  train          モデルの学習 (ZITT.py, TensorFlow)
+  simulate-zit   ZITのみのベースライン (ZIT.py)
+  simulate-rule  ZIT + Rule の混合市場 (Rule.py)
+  simulate-ml    ZIT + ML の混合市場 (ML.py)
+  analyze        保存したランの統計表示と gnuplot 用 .dat の書き出し (results_store.py)
+  plot           保存したランのグラフ (matplotlib)
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def cmd_generate(args):
+    from ZITS import generate_datasets
+    generate_datasets(range(args.datasets), args.traders, args.steps, out_dir=args.out, workers=args.workers)
+    print("全データの生成が完了しました")
+
+
+def cmd_train(args):
+    from ZITT import train
+    if train(args.data_dir, epochs=args.epochs, sampling_mode=args.sampling, use_class_weight=args.class_weight,
+             seed=args.seed, model_path=args.model) is None:
+        return 1
+
+
+def cmd_simulate_zit(args):
+    from ZIT import run_baseline
+    run_baseline(args.traders, args.periods, args.traders * args.steps_factor, plot=args.plot, seed=args.seed,
+                 results_dir=args.results, backend=args.backend)
+
+
+def cmd_simulate_rule(args):
+    from Rule import run_rule_sweep
+    run_rule_sweep(args.ratios, args.traders, args.periods, args.traders * args.steps_factor, output_dir=args.out,
+                   seed=args.seed, checkpoint_every=args.checkpoint_every, export_csv=args.csv,
+                   export_dat_files=args.dat, plot=args.plot, market=args.market, backend=args.backend)
+
+
+def cmd_simulate_ml(args):
+    from ML import load_policy, run_ml_simulation
+    policy = load_policy(args.weights, args.model, args.out)
+    run_ml_simulation(policy, args.ratio, args.traders, args.periods, args.traders * args.steps_factor,
+                      out_dir=args.out, seed=args.seed, checkpoint_every=args.checkpoint_every, export_csv=args.csv,
+                      export_dat_files=args.dat, market=args.market)
+
+
+def cmd_analyze(args):
+    from results_store import load_run, export_dat
+    from trade_log import AGENT_TYPE_CODES
+    for run in args.runs:
+        meta, assets, type_codes, _ = load_run(run)
+        print(f"{run} ({meta['label']}, {len(assets)} 人)")
+        print(f"  全体: 平均資産 {assets.mean():.4f}, 標準偏差 {assets.std():.4f}")
+        for t in meta['types']:
+            values = assets[type_codes == AGENT_TYPE_CODES[t]]
+            if len(values):
+                print(f"  {t}: {len(values)} 人, 平均資産 {values.mean():.4f}, 標準偏差 {values.std():.4f}")
+        if not args.no_dat:
+            export_dat(run, args.out)
+
+
+def cmd_plot(args):
+    from results_store import load_run
+    from Rule import plot_and_save_graph, analyze_and_save_graph
+    os.makedirs(args.out, exist_ok=True)
+    for run in args.runs:
+        meta, assets, _, action_stats = load_run(run)
+        label = meta['label']
+        plot_and_save_graph(assets, f"{meta.get('strategy', '')} {label} Asset Distribution (All)".strip(),
+                            f"{args.out}/asset_dist_{label}.png")
+        if action_stats is not None:
+            analyze_and_save_graph(action_stats, label, output_dir=args.out, types=meta['types'])
+
+
+def add_simulation_args(parser, out_default):
+    parser.add_argument('--traders', type=int, default=2000)
+    parser.add_argument('--periods', type=int, default=100)
+    parser.add_argument('--steps-factor', type=int, default=2, help="1期間のステップ数 = トレーダー数 x これ")
+    parser.add_argument('--seed', type=int, default=None)
+    if out_default is not None:
+        parser.add_argument('--out', default=out_default, help=f"出力先 (既定: {out_default})")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ZIT/Rule/ML 市場シミュレーションの共通コマンド")
+    parser.add_argument('--time', action='store_true', help="終了時に経過時間を表示する")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('generate', help="学習データを生成する (ZITS.py)")
+    p.add_argument('--datasets', type=int, default=20, help="シード 0 ~ datasets-1 のシャードを作る")
+    p.add_argument('--traders', type=int, default=2000)
+    p.add_argument('--steps', type=int, default=50000)
+    p.add_argument('--workers', type=int, default=None, help="既定: CPUコア数")
+    p.add_argument('--out', default=".")
+    p.set_defaults(func=cmd_generate)
+
+    p = subparsers.add_parser('train', help="モデルを学習する (ZITT.py, TensorFlow が必要)")
+    p.add_argument('--data-dir', default=".")
+    p.add_argument('--epochs', type=int, default=30)
+    p.add_argument('--sampling', choices=['under', 'over', 'none'], default='under')
+    p.add_argument('--class-weight', action='store_true')
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--model', default='zit_model_407.keras')
+    p.set_defaults(func=cmd_train)
+
+    p = subparsers.add_parser('simulate-zit', help="ZITのみのベースライン (ZIT.py)")
+    add_simulation_args(p, None)
+    p.add_argument('--results', default=None, help="資産を results_store 形式で保存するディレクトリ")
+    p.add_argument('--plot', action='store_true', help="CCDFのグラフも作る (matplotlib を読み込む)")
+    p.add_argument('--backend', choices=['python', 'kernel'], default='python', help="kernel: kernels.py で実行する")
+    p.set_defaults(func=cmd_simulate_zit)
+
+    for name, out_default in (('simulate-rule', "fig"), ('simulate-ml', "fig_ml")):
+        p = subparsers.add_parser(name, help=f"ZIT + {name.split('-')[1].capitalize()} の混合市場")
+        add_simulation_args(p, out_default)
+        p.add_argument('--market', choices=['board', 'book'], default='board')
+        p.add_argument('--checkpoint-every', type=int, default=10, help="0 ならチェックポイントを保存しない")
+        p.add_argument('--csv', action='store_true', help="取引ログのCSVも書き出す")
+        p.add_argument('--dat', action='store_true', help="gnuplot 用の .dat もすぐ書き出す")
+        if name == 'simulate-rule':
+            p.add_argument('--ratios', type=float, nargs='+', default=[0.1, 0.2, 0.3, 0.4, 0.5])
+            p.add_argument('--plot', action='store_true', help="グラフも作る (matplotlib を読み込む)")
+            p.add_argument('--backend', choices=['python', 'kernel'], default='python',
+                           help="kernel: kernels.py で実行する (--market board / book とも. 取引ログは取らない)")
+            p.set_defaults(func=cmd_simulate_rule)
+        else:
+            p.add_argument('--ratio', type=float, default=0.3)
+            p.add_argument('--weights', default='zit_model_407.npz')
+            p.add_argument('--model', default='zit_model_407.keras', help="重みが無いときだけ読む Keras モデル")
+            p.set_defaults(func=cmd_simulate_ml)
+
+    p = subparsers.add_parser('analyze', help="保存したランの統計を表示し、gnuplot 用 .dat を書き出す")
+    p.add_argument('runs', nargs='+', help="results_store.save_run で保存したディレクトリ")
+    p.add_argument('--out', default="fig")
+    p.add_argument('--no-dat', action='store_true', help="統計の表示だけにする")
+    p.set_defaults(func=cmd_analyze)
+
+    p = subparsers.add_parser('plot', help="保存したランの資産CCDFと行動グラフを作る (matplotlib)")
+    p.add_argument('runs', nargs='+')
+    p.add_argument('--out', default="fig")
+    p.set_defaults(func=cmd_plot)
+    return parser
+
+
+def main(argv=None):
+    t0 = time.perf_counter()
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'backend', 'python') == 'kernel' and getattr(args, 'csv', False):
+        parser.error("--backend kernel では取引ログを取らないので --csv は使えません")
+    status = args.func(args)
+    if args.time:
+        print(f"[{args.command}] {time.perf_counter() - t0:.3f} 秒")
+    return status or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import numpy as np
+
+from encoding import is_compact, to_one_hot
+
+
+class ShardedDataset:
+    """
+    x_data_*.npy のシャードを mmap_mode='r' で開き、1つの配列のように添字で引く
+    x は必要な行だけを読み込み、y (uint8) だけはメモリに載せる
+    """
+    def __init__(self, x_files, y_files):
+        self.xs = [np.load(f, mmap_mode='r') for f in x_files]
+        self.y = np.concatenate([np.load(f) for f in y_files])
+        self.offsets = np.concatenate([[0], np.cumsum([len(x) for x in self.xs])])
+
+        widths = {x.shape[1] for x in self.xs}
+        if len(widths) != 1:
+            raise ValueError(f"シャードごとに入力の次元が違います: {sorted(widths)}")
+        if self.offsets[-1] != len(self.y):
+            raise ValueError(f"x ({self.offsets[-1]}行) と y ({len(self.y)}行) の行数が一致しません")
+        self.dim = widths.pop()
+        self.dtype = self.xs[0].dtype
+        self.is_compact = is_compact(self.xs[0])
+
+    def __len__(self):
+        return len(self.y)
+
+    def take(self, indices):
+        """ 全体の行番号 indices の x を読み出す (シャード内は昇順に読む) """
+        indices = np.asarray(indices)
+        order = np.argsort(indices, kind='stable')
+        sorted_indices = indices[order]
+        shard_ids = np.searchsorted(self.offsets, sorted_indices, side='right') - 1
+
+        out = np.empty((len(indices), self.dim), dtype=self.dtype)
+        bounds = np.searchsorted(shard_ids, np.arange(len(self.xs) + 1))
+        for s in range(len(self.xs)):
+            lo, hi = bounds[s], bounds[s + 1]
+            if lo == hi:
+                continue
+            out[order[lo:hi]] = self.xs[s][sorted_indices[lo:hi] - self.offsets[s]]
+        return out
+
+    def batch(self, indices):
+        """ モデルに渡す形 (407次元one-hot, ラベル) """
+        return to_one_hot(self.take(indices)), self.y[indices]
+
+
+def class_counts(y):
+    """ sorted(Counter(y).items()) と同じ形の内訳 """
+    labels, counts = np.unique(y, return_counts=True)
+    return list(zip(labels.tolist(), counts.tolist()))
+
+
+def stratified_split_indices(y, test_size=0.2, seed=None):
+    """ クラスごとの比率を保った訓練/テストの分割を添字だけで作る (seed は int か np.random.Generator) """
+    rng = np.random.default_rng(seed)
+    train_parts, test_parts = [], []
+    for label in np.unique(y):
+        class_indices = rng.permutation(np.flatnonzero(y == label))
+        num_test = int(round(len(class_indices) * test_size))
+        test_parts.append(class_indices[:num_test])
+        train_parts.append(class_indices[num_test:])
+    train_indices = rng.permutation(np.concatenate(train_parts))
+    test_indices = rng.permutation(np.concatenate(test_parts))
+    return train_indices, test_indices
+
+
+def iter_batches(dataset, indices, batch_size=32, shuffle=False, rng=None):
+    """ 添字の並びに沿ってバッチを順に返す (tf.data.Dataset.from_generator 用) """
+    if shuffle:
+        indices = (rng or np.random.default_rng()).permutation(indices)
+    for start in range(0, len(indices), batch_size):
+        yield dataset.batch(indices[start:start + batch_size])
+
+
+class BalancedBatchSampler:
+    """
+    クラスごとの添字を一度だけ作っておき、エポックごとにその場で引き直すサンプラー
+    mode='under': 各クラスを最小クラスの数だけ非復元抽出 (毎エポック別の多数派の行を使う)
+    mode='over' : 各クラスを最大クラスの数まで復元抽出で水増し
+    mode='none' : 全件をそのまま使う (class_weights() と組み合わせる)
+    seed は int か np.random.Generator (rng.spawn_generators のストリームをそのまま渡せる)
+    """
+    def __init__(self, y, indices=None, mode='under', seed=None):
+        if mode not in ('under', 'over', 'none'):
+            raise ValueError(f"mode は 'under', 'over', 'none' のいずれかです: {mode}")
+        y = np.asarray(y)
+        indices = np.arange(len(y)) if indices is None else np.asarray(indices)
+        self.mode = mode
+        self.rng = np.random.default_rng(seed)
+        self.labels, inverse = np.unique(y[indices], return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(self.labels) + 1))
+        self.class_indices = [indices[order[bounds[i]:bounds[i + 1]]] for i in range(len(self.labels))]
+        self.class_sizes = np.array([len(c) for c in self.class_indices])
+
+    def epoch_size(self):
+        k = len(self.labels)
+        if self.mode == 'under':
+            return int(self.class_sizes.min()) * k
+        if self.mode == 'over':
+            return int(self.class_sizes.max()) * k
+        return int(self.class_sizes.sum())
+
+    def epoch_indices(self):
+        """ 1エポック分の添字 (シャッフル済み) """
+        rng = self.rng
+        if self.mode == 'under':
+            per_class = self.class_sizes.min()
+            parts = [rng.choice(c, per_class, replace=False) for c in self.class_indices]
+        elif self.mode == 'over':
+            per_class = self.class_sizes.max()
+            parts = [np.concatenate([c, rng.choice(c, per_class - len(c), replace=True)]) for c in self.class_indices]
+        else:
+            parts = self.class_indices
+        return rng.permutation(np.concatenate(parts))
+
+    def class_weights(self):
+        """ Keras の class_weight 用: n / (クラス数 × クラスの件数) """
+        total = self.class_sizes.sum()
+        k = len(self.labels)
+        return {int(label): float(total / (k * size)) for label, size in zip(self.labels, self.class_sizes)}
+
+    def batches(self, dataset, batch_size=32):
+        """ 1エポック分のバッチを順に返す """
+        indices = self.epoch_indices()
+        for start in range(0, len(indices), batch_size):
+            yield dataset.batch(indices[start:start + batch_size])
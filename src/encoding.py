@@ -0,0 +1,67 @@
+import numpy as np
+
+
+PRICE_MAX = 200
+
+# 板の種類と売買のコード (407次元one-hotの並びと同じ順番)
+BOARD_EMPTY = 0
+BOARD_ASK = 1
+BOARD_BID = 2
+BOARD_TYPES = {'empty': BOARD_EMPTY, 'ask': BOARD_ASK, 'bid': BOARD_BID}
+
+ROLE_BUYER = 0
+ROLE_SELLER = 1
+ROLES = ('buyer', 'seller')
+
+# one-hotベクトル内の各ブロックの開始位置
+# [空, 売り, 買い] + [板価格0..200] + [買い, 売り] + [提示価格0..200]
+BOARD_PRICE_OFFSET = 3
+ROLE_OFFSET = BOARD_PRICE_OFFSET + PRICE_MAX + 1
+ACTION_PRICE_OFFSET = ROLE_OFFSET + 2
+INPUT_DIM = ACTION_PRICE_OFFSET + PRICE_MAX + 1
+
+# コンパクト形式の列: (板の種類, 板の価格(空板は-1), 売買, 提示価格)
+COMPACT_DIM = 4
+COMPACT_DTYPE = np.int16
+
+
+def encode_compact(board, agent_action):
+    """ 板とエージェントの行動を4つの整数にする """
+    board_type = BOARD_TYPES[board['type']]
+    board_price = board['price'] if board_type != BOARD_EMPTY else -1
+    role = ROLE_BUYER if agent_action['role'] == 'buyer' else ROLE_SELLER
+    return board_type, board_price, role, agent_action['price']
+
+
+def is_compact(x):
+    return x.ndim == 2 and x.shape[1] == COMPACT_DIM
+
+
+def expand_one_hot(x_compact, dtype=np.float32):
+    """ コンパクト形式 (n, 4) を407次元one-hot (n, 407) に展開する """
+    x_compact = np.asarray(x_compact)
+    n = len(x_compact)
+    rows = np.arange(n)
+    board_type = x_compact[:, 0].astype(np.intp)
+    board_price = x_compact[:, 1].astype(np.intp)
+
+    out = np.zeros((n, INPUT_DIM), dtype=dtype)
+    out[rows, board_type] = 1
+    has_price = board_type != BOARD_EMPTY
+    out[rows[has_price], BOARD_PRICE_OFFSET + board_price[has_price]] = 1
+    out[rows, ROLE_OFFSET + x_compact[:, 2].astype(np.intp)] = 1
+    out[rows, ACTION_PRICE_OFFSET + x_compact[:, 3].astype(np.intp)] = 1
+    return out
+
+
+def to_one_hot(x, dtype=np.float32):
+    """ コンパクト形式なら展開し、既に407次元ならそのまま返す """
+    if is_compact(x):
+        return expand_one_hot(x, dtype=dtype)
+    return np.asarray(x, dtype=dtype)
+
+
+def encode_input_vector(board, agent_action):
+    """ 1ステップ分の407次元ベクトル (互換用) """
+    x = np.array([encode_compact(board, agent_action)], dtype=COMPACT_DTYPE)
+    return expand_one_hot(x, dtype=np.float64)[0]
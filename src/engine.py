@@ -0,0 +1,261 @@
+import random
+
+from trader_pool import AvailablePool
+from trade_log import AGENT_TYPES, RESULT_FAIL, RESULT_OVERWRITE, RESULT_EXECUTED
+from encoding import BOARD_EMPTY, BOARD_ASK, BOARD_BID, BOARD_TYPES, ROLE_BUYER, ROLE_SELLER
+from population import ZIT, RULE, ML
+from rule_policy import RULE_POLICY, RANDOM_ROLE
+from ml_policy import UNKNOWN
+
+
+# Rule/ML が提示する価格 (1 ~ 199)
+CHOICE_MIN = 1
+CHOICE_MAX = 199
+ROLE_CODES = (ROLE_BUYER, ROLE_SELLER)
+
+
+class Board:
+    """ 板の状態 (type は BOARD_* のコード). ステップごとに dict を作らず、その場で書き換える """
+    __slots__ = ('type', 'price', 'agent_id')
+
+    def __init__(self, board_type=BOARD_EMPTY, price=-1, agent_id=-1):
+        self.type = board_type
+        self.price = price
+        self.agent_id = agent_id
+
+    @classmethod
+    def from_dict(cls, board):
+        """ 従来の {'type': 'ask', 'price': .., 'agent_id': ..} から作る """
+        return cls(BOARD_TYPES[board['type']], board['price'], board['agent_id'])
+
+    def clear(self):
+        self.type = BOARD_EMPTY
+        self.price = -1
+        self.agent_id = -1
+
+    def set(self, board_type, price, agent_id):
+        self.type = board_type
+        self.price = price
+        self.agent_id = agent_id
+
+    def __repr__(self):
+        names = {code: name for name, code in BOARD_TYPES.items()}
+        return f"Board(type={names[self.type]}, price={self.price}, agent_id={self.agent_id})"
+
+
+class Strategy:
+    """
+    エージェントの戦略のインターフェース
+    choose(agent_id, board) が (売買のコード ROLE_*, 提示価格) を返す
+    rng: random モジュール (既定) か、同じ関数を持つ rng.BlockRNG / random.Random
+    """
+    def __init__(self, rng=None):
+        self.rng = random if rng is None else rng
+
+    def start_period(self, population):
+        """ 期間の初めに呼ばれる (population.reset_period() の後) """
+
+    def choose(self, agent_id, board):
+        raise NotImplementedError
+
+
+class ZITStrategy(Strategy):
+    """ 売買をランダムに選び、期間ごとに引いた指値 (buy_price/sell_price) を出す """
+    def start_period(self, population):
+        self.buy_prices = population.buy_price.tolist()
+        self.sell_prices = population.sell_price.tolist()
+
+    def choose(self, agent_id, board):
+        role = self.rng.choice(ROLE_CODES)
+        return role, (self.buy_prices[agent_id] if role == ROLE_BUYER else self.sell_prices[agent_id])
+
+
+class RuleStrategy(Strategy):
+    """
+    価格をランダムに引き、板に対して成立・上書きになる側を選ぶ (空板なら売買もランダム)
+    売買は RuleDecisionTable を引く (表はリストにしておく. 空板の行はどの価格もランダムなので price=-1 でも引ける)
+    """
+    def __init__(self, rng=None, policy=RULE_POLICY):
+        super().__init__(rng)
+        self.policy = policy
+        self.rows = policy.table.tolist()
+
+    def choose(self, agent_id, board):
+        rng = self.rng
+        price = rng.randint(CHOICE_MIN, CHOICE_MAX)
+        code = self.rows[board.type][board.price][price - CHOICE_MIN]
+        if code == RANDOM_ROLE:
+            return rng.choice(ROLE_CODES), price
+        return code, price
+
+
+class MLStrategy(Strategy):
+    """
+    価格をランダムに引き、売買は MLDecisionTable を引く (RuleStrategy と同じく表はリストにしておく)
+    lazy の表で未計算 (UNKNOWN) のところだけ policy.role_code で推論し、埋まった行をリストに写す
+    """
+    def __init__(self, policy, rng=None):
+        super().__init__(rng)
+        if policy is None:
+            raise ValueError("MLStrategy には意思決定表 (MLDecisionTable) が必要です")
+        self.policy = policy
+        self.rows = policy.table.tolist()
+
+    def choose(self, agent_id, board):
+        price = self.rng.randint(CHOICE_MIN, CHOICE_MAX)
+        code = self.rows[board.type][board.price][price - CHOICE_MIN]
+        if code == UNKNOWN:
+            code = int(self.policy.role_code(board.type, board.price, price))
+            table = self.policy.table
+            if board.type == BOARD_EMPTY:
+                # 空板の状態はどの板の価格の行にも同じ行が入る
+                self.rows[BOARD_EMPTY] = table[BOARD_EMPTY].tolist()
+            else:
+                self.rows[board.type][board.price] = table[board.type, board.price].tolist()
+        return code, price
+
+
+def default_strategies(policy=None, rng=None):
+    """ タイプのコード -> 戦略 (ML は policy を渡したときだけ). rng は全員で共有する """
+    strategies = {ZIT: ZITStrategy(rng), RULE: RuleStrategy(rng)}
+    if policy is not None:
+        strategies[ML] = MLStrategy(policy, rng)
+    return strategies
+
+
+def run_simulation(population, strategies, num_periods, steps_per_period,
+                   trade_log=None, action_stats=None, prof=None, progress_every=10, market='board',
+                   start_period=0, checkpointer=None, rng=None, backend='python'):
+    """
+    板1枚の連続ダブルオークションを num_periods 期間実行する (ZIT/Rule/ML 共通のマッチングループ)
+    strategies: タイプのコード -> Strategy
+    action_stats (ActionStats) / trade_log (TradeLog) / prof (profiling.Profiler) は渡したときだけ使う
+    market='book' なら複数価格の板 (orderbook.run_book_simulation) で実行する
+    start_period から始め、checkpointer (checkpoint.Checkpointer) があれば期間の区切りで状態を保存する
+    rng: エージェントの選択に使う乱数 (既定は random モジュール. 戦略の乱数は各 Strategy が持つ)
+    backend='kernel' なら ZIT / Rule / ML を kernels.run_kernel_simulation (期間ごとのコンパイル済みカーネル) で実行する
+    (market='board' / 'book' のどちらも)
+    """
+    if backend == 'kernel':
+        if trade_log is not None or prof is not None:
+            raise ValueError("backend='kernel' は取引ログ・プロファイラなしのときだけ使えます")
+        from kernels import run_kernel_simulation
+        return run_kernel_simulation(population, strategies, num_periods, steps_per_period, action_stats=action_stats,
+                                     progress_every=progress_every, start_period=start_period,
+                                     checkpointer=checkpointer, rng=rng, market=market)
+    if backend != 'python':
+        raise ValueError(f"backend は 'python' か 'kernel' です: {backend}")
+    if market == 'book':
+        from orderbook import run_book_simulation
+        return run_book_simulation(population, strategies, num_periods, steps_per_period, trade_log=trade_log,
+                                   action_stats=action_stats, prof=prof, progress_every=progress_every,
+                                   start_period=start_period, checkpointer=checkpointer, rng=rng)
+    if market != 'board':
+        raise ValueError(f"market は 'board' か 'book' です: {market}")
+    type_codes = population.type.tolist()
+    missing = sorted(set(type_codes) - set(strategies))
+    if missing:
+        raise ValueError(f"戦略が指定されていないタイプがあります: {[AGENT_TYPES[t] for t in missing]}")
+    choose = [strategies[t].choose if t in strategies else None for t in range(len(AGENT_TYPES))]
+    unique_strategies = list({id(s): s for s in strategies.values()}.values())
+
+    if rng is None:
+        rng = random
+    pool = AvailablePool(len(population))
+    pick = pool.pick
+    remove = pool.remove
+    asset = population.asset
+    traded = population.traded
+    board = Board()
+    if action_stats is not None:
+        record = action_stats.record
+    if trade_log is not None:
+        append = trade_log.append
+    if prof is not None:
+        now = prof.clock
+        prof.start_run(num_periods, steps_per_period)
+
+    for period in range(start_period, num_periods):
+        if prof is not None:
+            prof.start_period(period)
+        population.reset_period()
+        pool.reset()
+        for strategy in unique_strategies:
+            strategy.start_period(population)
+        if action_stats is not None:
+            action_stats.start_period()
+        board.clear()
+
+        for step in range(steps_per_period):
+            if not pool:
+                break
+
+            if prof is not None: t0 = now()
+            agent_id = pick(rng)
+            if prof is not None: t1 = now()
+            agent_type = type_codes[agent_id]
+            role, price = choose[agent_type](agent_id, board)
+            if prof is not None: t2 = now()
+
+            result = RESULT_FAIL
+            log_price = price
+            counterpart = -1
+            board_type = board.type
+            if role == ROLE_BUYER:
+                if board_type == BOARD_ASK and price >= board.price:
+                    if board.agent_id != -1 and not traded[board.agent_id]:
+                        counterpart = board.agent_id
+                elif board_type == BOARD_EMPTY or (board_type == BOARD_BID and price > board.price):
+                    board.set(BOARD_BID, price, agent_id)
+                    result = RESULT_OVERWRITE
+            else:
+                if board_type == BOARD_BID and price <= board.price:
+                    if board.agent_id != -1 and not traded[board.agent_id]:
+                        counterpart = board.agent_id
+                elif board_type == BOARD_EMPTY or (board_type == BOARD_ASK and price < board.price):
+                    board.set(BOARD_ASK, price, agent_id)
+                    result = RESULT_OVERWRITE
+
+            if counterpart != -1:
+                # --- 取引成立 (約定価格は板の価格) ---
+                log_price = board.price
+                traded[agent_id] = True
+                traded[counterpart] = True
+                remove(agent_id)
+                remove(counterpart)
+                if role == ROLE_BUYER:
+                    asset[agent_id] -= log_price
+                    asset[counterpart] += log_price
+                else:
+                    asset[agent_id] += log_price
+                    asset[counterpart] -= log_price
+                result = RESULT_EXECUTED
+                board.clear()
+
+            if prof is not None: t3 = now()
+
+            # 能動側と、成立したときは受動側 (相手) の分も数える
+            if action_stats is not None:
+                record(agent_type, role, result)
+                if counterpart != -1:
+                    record(type_codes[counterpart], 1 - role, RESULT_EXECUTED)
+            if trade_log is not None:
+                append(period + 1, step + 1, agent_id, agent_type, role, log_price, result)
+                if counterpart != -1:
+                    append(period + 1, step + 1, counterpart, type_codes[counterpart], 1 - role, log_price,
+                           RESULT_EXECUTED)
+            if prof is not None:
+                prof.step(agent_type, t0, t1, t2, t3, now())
+
+        if action_stats is not None:
+            action_stats.end_period()
+        if checkpointer is not None and checkpointer.due(period + 1):
+            checkpointer.save(period + 1, population, trade_log, action_stats, rng=rng)
+        if prof is not None:
+            prof.end_period(period)
+        elif progress_every and (period + 1) % progress_every == 0:
+            print(f"  ... 期間 {period + 1}/{num_periods} 完了")
+
+    if trade_log is not None:
+        trade_log.flush()
+    return population, action_stats
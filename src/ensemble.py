@@ -0,0 +1,222 @@
+import argparse
+import os
+import time
+import numpy as np
+
+import analysis
+from encoding import BOARD_EMPTY
+from trade_log import AGENT_TYPES, AGENT_TYPE_CODES
+from action_stats import OUTCOMES
+from population import ZIT, INITIAL_ASSET, draw_limit_prices
+from ml_policy import UNKNOWN
+from rule_policy import RULE_POLICY
+from kernels import (njit, HAVE_NUMBA, board_period_kernel, KERNEL_ZIT, KERNEL_TABLE, UNIFORMS_PER_STEP,
+                     STATE_SIZE, STATE_STEPS)
+
+
+@njit(cache=True)
+def ensemble_period_kernel(type_codes, kernel_of_type, tables, buy_price, sell_price, asset, traded, members, position,
+                           state, arrivals, uniforms, max_steps, counts):
+    """
+    K 個の市場を1つずつ、kernels.board_period_kernel で最大 max_steps ステップ進める
+    引数は board_period_kernel の人ごとの配列・state・uniforms・counts に市場の軸 (先頭の K) を付けたもの
+    使った乱数の個数の合計を返す
+    """
+    used = 0
+    for k in range(len(state)):
+        used += board_period_kernel(type_codes, kernel_of_type, tables, buy_price[k], sell_price[k], asset[k],
+                                    traded[k], members[k], position[k], state[k], arrivals, uniforms[k],
+                                    max_steps, counts[k])
+    return used
+
+
+class EnsembleMarket:
+    """
+    同じ構成 (人数・Rule/ML の割合) の独立な市場 K 個を、(K, N) の配列で持ってまとめて進める
+    1期間は ensemble_period_kernel で、市場ごとに engine.run_simulation の1期間と同じ規則で回す
+    乱数は np.random.Generator 1本から市場ごとに引くので、1市場ずつ回したときとは同じ分布で別の系列になる
+    """
+    def __init__(self, num_replicas, num_traders, ratio=0.0, special_type='Rule', policy=None,
+                 initial_asset=INITIAL_ASSET, seed=None, rng=None):
+        self.num_replicas = num_replicas
+        self.num_traders = num_traders
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        # 先頭 int(num_traders * ratio) 人が special_type, 残りが ZIT (TraderPopulation.mixed と同じ)
+        self.type = np.full(num_traders, ZIT, dtype=np.uint8)
+        self.type[:int(num_traders * ratio)] = AGENT_TYPE_CODES[special_type]
+        # タイプごとのカーネルの番号と意思決定表 (ZIT の行は使わない)
+        self.kernel_of_type = np.full(len(AGENT_TYPES), KERNEL_TABLE, dtype=np.int64)
+        self.kernel_of_type[ZIT] = KERNEL_ZIT
+        self.tables = np.zeros((len(AGENT_TYPES),) + RULE_POLICY.table.shape, dtype=np.int8)
+        self.tables[AGENT_TYPE_CODES['Rule']] = RULE_POLICY.table
+        if special_type == 'ML':
+            if policy is None:
+                raise ValueError("ML のアンサンブルには意思決定表 (MLDecisionTable) が必要です")
+            if (policy.table == UNKNOWN).any():
+                policy.build()
+            self.tables[AGENT_TYPE_CODES['ML']] = policy.table
+
+        shape = (num_replicas, num_traders)
+        self.asset = np.full(shape, initial_asset, dtype=np.float64)
+        self.traded = np.zeros(shape, dtype=bool)
+        self.members = np.empty(shape, dtype=np.int64)
+        self.position = np.empty(shape, dtype=np.int64)
+        self.size = np.zeros(num_replicas, dtype=np.int64)
+        # counts[市場, タイプ, OUTCOMES の列] (全期間の合計)
+        self.counts = np.zeros((num_replicas, len(AGENT_TYPES), len(OUTCOMES)), dtype=np.int64)
+        self.steps = 0
+
+    def run_period(self, steps_per_period, chunk_steps=4096):
+        """
+        1期間進める. chunk_steps ステップごとに、市場ごとに UNIFORMS_PER_STEP x chunk_steps 個の一様乱数を引いて
+        ensemble_period_kernel に渡す (ZIT のステップなどで使わずに残った分は捨てる)
+        """
+        K, N = self.num_replicas, self.num_traders
+        rng = self.rng
+        self.traded[:] = False
+        _, _, buy_price, sell_price = draw_limit_prices(rng, (K, N))
+        self.members[:] = np.arange(N)
+        self.position[:] = np.arange(N)
+        # 市場ごとの state (kernels.run_kernel_simulation の期間の始めと同じ値)
+        state = np.tile(np.array([BOARD_EMPTY, -1, -1, N, 0, 0, -1], dtype=np.int64), (K, 1))
+        counts = np.zeros((K, self.counts[0].size), dtype=np.int64)
+        arrays = [buy_price, sell_price, self.asset, self.traded, self.members, self.position, state, counts]
+        type_codes, kernel_of_type, tables = self.type, self.kernel_of_type, self.tables
+        if HAVE_NUMBA:
+            no_arrivals = np.empty(0, dtype=np.int64)
+        else:
+            # Python で実行するときは配列の要素アクセスが遅いので、リストに直してから回す
+            arrays = [a.tolist() for a in arrays]
+            type_codes, kernel_of_type, tables = type_codes.tolist(), kernel_of_type.tolist(), tables.tolist()
+            no_arrivals = []
+
+        for start in range(0, steps_per_period, chunk_steps):
+            if not any(row[STATE_SIZE] > 0 for row in arrays[6]):
+                break
+            max_steps = min(chunk_steps, steps_per_period - start)
+            uniforms = rng.random((K, UNIFORMS_PER_STEP * max_steps))
+            ensemble_period_kernel(type_codes, kernel_of_type, tables, *arrays[:7], no_arrivals,
+                                   uniforms if HAVE_NUMBA else uniforms.tolist(), max_steps, arrays[7])
+
+        if not HAVE_NUMBA:
+            self.asset[:], self.traded[:], self.members[:], self.position[:] = arrays[2:6]
+        state = np.asarray(arrays[6])
+        self.size[:] = state[:, STATE_SIZE]
+        self.steps += int(state[:, STATE_STEPS].sum())
+        self.counts += np.reshape(arrays[7], self.counts.shape)
+
+    def run(self, num_periods, steps_per_period, progress_every=10):
+        """ num_periods 期間進めて、市場ごとの資産 (K, N) を返す """
+        for period in range(num_periods):
+            self.run_period(steps_per_period)
+            if progress_every and (period + 1) % progress_every == 0:
+                print(f"  ... 期間 {period + 1}/{num_periods} 完了 ({self.num_replicas} 市場)")
+        return self.asset
+
+    def assets_of(self, type_name):
+        """ (K, その タイプの人数) の資産 """
+        return self.asset[:, self.type == AGENT_TYPE_CODES[type_name]]
+
+
+def ensemble_standardized_abs(assets):
+    """ 市場ごとに標準化した |資産| を全市場分つなげる (σ = 0 の市場は除く) """
+    return np.concatenate([analysis.standardized_abs(row) for row in assets])
+
+
+def ensemble_ccdf(assets):
+    """
+    市場ごとの標準化した資産のCCDFの、K 市場での平均
+    人数が同じなので、全市場の値をまとめた経験的CCDFと一致する
+    """
+    return analysis.ccdf(ensemble_standardized_abs(assets))
+
+
+def tail_spread(assets, x=(2.0, 3.0, 4.0)):
+    """ P(|標準化した資産| >= x) の市場間の平均と標準偏差 (裾の推定のばらつき) """
+    probs = np.array([[np.mean(analysis.standardized_abs(row) >= xi) for xi in x] for row in assets])
+    return probs.mean(axis=0), probs.std(axis=0)
+
+
+def cross_check(num_replicas=20, num_traders=500, num_periods=20, steps_factor=2, ratio=0.3, seed=0, alpha=0.01):
+    """
+    K 市場のアンサンブルを、同じ構成で engine.run_simulation を K 回回した結果と比べる
+    期間ごとの未取引プールが正しく、資産の分布 (市場ごとに標準化する前の生の値の KS 検定) と
+    行動の割合が同じとみなせれば True
+    """
+    from action_stats import ActionStats
+    from engine import run_simulation, default_strategies
+    from kernels import _ks_statistic
+    from population import TraderPopulation
+    from rng import simulation_rngs
+
+    steps_per_period = num_traders * steps_factor
+    ensemble = EnsembleMarket(num_replicas, num_traders, ratio, 'Rule', seed=seed)
+    # 期間の終わりに、どの市場でもプール (members[:size]) がちょうど未取引の人になっていること
+    pool_ok = True
+    for period in range(num_periods):
+        ensemble.run_period(steps_per_period)
+        for k in range(num_replicas):
+            pool = np.sort(ensemble.members[k, :ensemble.size[k]])
+            pool_ok &= np.array_equal(pool, np.flatnonzero(~ensemble.traded[k]))
+    print(f"期間の終わりの未取引プール ({num_replicas} 市場 x {num_periods} 期間) ... {'OK' if pool_ok else 'NG'}")
+
+    reference = []
+    totals = 0
+    for i in range(num_replicas):
+        population_rng, rng = simulation_rngs([seed, i])
+        population = TraderPopulation.mixed(num_traders, ratio, 'Rule', rng=population_rng)
+        stats = ActionStats()
+        run_simulation(population, default_strategies(rng=rng), num_periods, steps_per_period,
+                       action_stats=stats, progress_every=0, rng=rng)
+        reference.append(population.asset.copy())
+        totals = totals + stats.totals()
+
+    d, p = _ks_statistic(np.concatenate(reference), ensemble.asset.ravel())
+    ok = p > alpha
+    print(f"資産分布の KS 検定 ({num_replicas} 市場 x {num_traders} 人): D = {d:.4f}, p = {p:.3f} ... "
+          f"{'OK' if ok else 'NG'}")
+    ensemble_totals = ensemble.counts.sum(axis=0)
+    fractions = [t / t.sum(axis=1, keepdims=True).clip(1) for t in (totals, ensemble_totals)]
+    diff = np.abs(fractions[0] - fractions[1]).max()
+    print(f"行動の割合の最大差: {diff:.4f} ... {'OK' if diff < 0.01 else 'NG'}")
+    return pool_ok and ok and diff < 0.01
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="独立な市場 K 個をまとめて実行し、アンサンブル平均のCCDFを書き出す")
+    parser.add_argument('--replicas', type=int, default=100)
+    parser.add_argument('--traders', type=int, default=2000)
+    parser.add_argument('--periods', type=int, default=100)
+    parser.add_argument('--steps-factor', type=int, default=2)
+    parser.add_argument('--ratios', type=float, nargs='+', default=[0.0, 0.1, 0.2, 0.3, 0.4, 0.5])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default="fig")
+    parser.add_argument('--check', action='store_true', help="参照のループとの突き合わせだけ行う")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if cross_check() else 1)
+
+    for i, ratio in enumerate(args.ratios):
+        label = f"{int(ratio*100)}pct"
+        print(f"\n=== Rule割合: {int(ratio*100)}% ({args.replicas} 市場) ===")
+        ensemble = EnsembleMarket(args.replicas, args.traders, ratio, 'Rule',
+                                  seed=None if args.seed is None else [args.seed, i])
+        t0 = time.perf_counter()
+        assets = ensemble.run(args.periods, args.traders * args.steps_factor)
+        elapsed = time.perf_counter() - t0
+        print(f"{ensemble.steps:,} ステップ / {elapsed:.1f} 秒 ({ensemble.steps / elapsed:,.0f} ステップ/秒)")
+
+        values = ensemble_standardized_abs(assets)
+        os.makedirs(args.out, exist_ok=True)
+        x, y = analysis.ccdf(values)
+        analysis.save_xy_dat(f"{args.out}/asset_ccdf_{label}_ensemble.dat", x[x > 0], y[x > 0],
+                             f"Normalized_Asset_Abs CCDF_Value (ensemble of {args.replicas})")
+        x, y = analysis.log_binned_ccdf(values)
+        analysis.save_xy_dat(f"{args.out}/asset_ccdf_{label}_ensemble_logbin.dat", x, y,
+                             f"Normalized_Asset_Abs CCDF_Value (log-binned, ensemble of {args.replicas})")
+        np.save(f"{args.out}/asset_ensemble_{label}.npy", assets)
+        mean, sd = tail_spread(assets)
+        for xi, m, s in zip((2, 3, 4), mean, sd):
+            print(f"  P(|z| >= {xi}) = {m:.4f} ± {s:.4f} (市場間の標準偏差)")
@@ -0,0 +1,377 @@
+import math
+import random
+import time
+import numpy as np
+
+from encoding import PRICE_MAX, BOARD_EMPTY, BOARD_ASK, BOARD_BID, ROLE_BUYER
+from trade_log import AGENT_TYPES
+from action_stats import OUTCOMES
+from engine import CHOICE_MIN, ZITStrategy, RuleStrategy, MLStrategy
+from rule_policy import RULE_POLICY, RANDOM_ROLE
+from ml_policy import NUM_CHOICES, UNKNOWN
+from rng import BlockRNG
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """ numba が無いときは何もしないデコレータ (同じ関数を Python のまま実行する) """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+
+# カーネルの中での戦略の番号 (タイプのコード -> この番号 の表を渡す)
+KERNEL_NONE = -1
+KERNEL_ZIT = 0
+KERNEL_TABLE = 1  # Rule / ML: 価格を引き、意思決定表 (RuleDecisionTable / MLDecisionTable) で売買を決める
+# 1ステップで使う一様乱数の最大数 (選択 + 価格 + 売買)
+UNIFORMS_PER_STEP = 3
+NUM_OUTCOMES = len(OUTCOMES)
+# board_period_kernel の state (呼び出しをまたいで持ち越す値) の添字
+# STATE_LAST_SIDE は orderbook.book_period_kernel で直前に板に注文を置いた側 (板1枚のカーネルでは使わない)
+STATE_BOARD_TYPE, STATE_BOARD_PRICE, STATE_BOARD_AGENT, STATE_SIZE, STATE_ARRIVAL, STATE_STEPS, STATE_LAST_SIDE = range(7)
+# カーネルで実行できる板 (engine.run_simulation の market)
+MARKETS = ('board', 'book')
+# 到着の決め方: 'uniform' 毎ステップ未取引の人から一様に選ぶ (参照と同じ), 'permutation' 未取引の人の順列の順に来る
+ARRIVAL_MODES = ('uniform', 'permutation')
+# 1回の呼び出しで進めるステップ数 (事前に引く乱数は UNIFORMS_PER_STEP 倍. メモリを期間の長さによらず一定にする)
+CHUNK_STEPS = 1 << 16
+
+
+@njit(cache=True)
+def board_period_kernel(type_codes, kernel_of_type, tables, buy_price, sell_price, asset, traded, members, position,
+                        state, arrivals, uniforms, max_steps, counts):
+    """
+    板1枚のマッチングを最大 max_steps ステップ実行する (engine.run_simulation の1期間を区切って呼ぶ)
+    板・未取引プールの大きさ・進んだステップ数は state (STATE_* の添字) に持ち、次の呼び出しで続きから回す
+    arrivals が空なら未取引の人 (members[:size]) から毎ステップ一様に選び、
+    空でなければ arrivals の順に到着させる (取引済みの人は飛ばし、使い切ったら止まる)
+    乱数は uniforms (事前に引いた [0, 1) の一様乱数) を先頭から順に使い、BlockRNG と同じ規則で整数にする
+    tables[タイプ, 板の種類, 板の価格, 提示価格 - CHOICE_MIN] は KERNEL_TABLE のタイプの意思決定表
+    counts[タイプ * NUM_OUTCOMES + OUTCOMES の列] に行動を数え、使った乱数の個数を返す
+    numba があれば配列のままコンパイルして実行し、無ければ (リストを渡して) Python で実行する
+    """
+    board_type = state[STATE_BOARD_TYPE]
+    board_price = state[STATE_BOARD_PRICE]
+    board_agent = state[STATE_BOARD_AGENT]
+    size = state[STATE_SIZE]
+    arrival = state[STATE_ARRIVAL]
+    use_arrivals = len(arrivals) > 0
+    cursor = 0
+    steps = 0
+
+    while steps < max_steps and size > 0:
+        if use_arrivals:
+            while arrival < len(arrivals) and traded[arrivals[arrival]]:
+                arrival += 1
+            if arrival == len(arrivals):
+                break
+            agent_id = arrivals[arrival]
+            arrival += 1
+        else:
+            agent_id = members[int(uniforms[cursor] * size)]
+            cursor += 1
+        steps += 1
+        agent_type = type_codes[agent_id]
+        if kernel_of_type[agent_type] == KERNEL_ZIT:
+            role = int(uniforms[cursor] * 2)
+            cursor += 1
+            price = buy_price[agent_id] if role == ROLE_BUYER else sell_price[agent_id]
+        else:
+            price = CHOICE_MIN + int(uniforms[cursor] * NUM_CHOICES)
+            cursor += 1
+            role = tables[agent_type][board_type][board_price if board_type != BOARD_EMPTY else 0][price - CHOICE_MIN]
+            if role == RANDOM_ROLE:
+                role = int(uniforms[cursor] * 2)
+                cursor += 1
+
+        # outcome: 0 Fail, 1 + 2*role 上書き, 2 + 2*role 成立 (action_stats.OUTCOMES の列)
+        outcome = 0
+        counterpart = -1
+        if role == ROLE_BUYER:
+            if board_type == BOARD_ASK and price >= board_price:
+                if board_agent != -1 and not traded[board_agent]:
+                    counterpart = board_agent
+            elif board_type == BOARD_EMPTY or (board_type == BOARD_BID and price > board_price):
+                board_type = BOARD_BID
+                board_price = price
+                board_agent = agent_id
+                outcome = 1
+        else:
+            if board_type == BOARD_BID and price <= board_price:
+                if board_agent != -1 and not traded[board_agent]:
+                    counterpart = board_agent
+            elif board_type == BOARD_EMPTY or (board_type == BOARD_ASK and price < board_price):
+                board_type = BOARD_ASK
+                board_price = price
+                board_agent = agent_id
+                outcome = 3
+
+        if counterpart != -1:
+            # --- 取引成立 (約定価格は板の価格) ---
+            traded[agent_id] = True
+            traded[counterpart] = True
+            for removed in (agent_id, counterpart):
+                pos = position[removed]
+                if pos < size:
+                    last_id = members[size - 1]
+                    members[pos] = last_id
+                    position[last_id] = pos
+                    members[size - 1] = removed
+                    position[removed] = size - 1
+                    size -= 1
+            if role == ROLE_BUYER:
+                asset[agent_id] -= board_price
+                asset[counterpart] += board_price
+            else:
+                asset[agent_id] += board_price
+                asset[counterpart] -= board_price
+            outcome = 2 + 2 * role
+            counts[type_codes[counterpart] * NUM_OUTCOMES + 2 + 2 * (1 - role)] += 1
+            board_type = BOARD_EMPTY
+            board_price = -1
+            board_agent = -1
+        counts[agent_type * NUM_OUTCOMES + outcome] += 1
+
+    state[STATE_BOARD_TYPE] = board_type
+    state[STATE_BOARD_PRICE] = board_price
+    state[STATE_BOARD_AGENT] = board_agent
+    state[STATE_SIZE] = size
+    state[STATE_ARRIVAL] = arrival
+    state[STATE_STEPS] += steps
+    return cursor
+
+
+def kernel_types(strategies):
+    """
+    (タイプのコード -> KERNEL_* の配列, タイプごとの意思決定表 (タイプ数, 3, 201, 199)) を返す
+    カーネルで実行できない戦略があれば ValueError
+    """
+    kernel_of_type = np.full(len(AGENT_TYPES), KERNEL_NONE, dtype=np.int64)
+    tables = np.zeros((len(AGENT_TYPES),) + RULE_POLICY.table.shape, dtype=np.int8)
+    for agent_type, strategy in strategies.items():
+        if type(strategy) is ZITStrategy:
+            kernel_of_type[agent_type] = KERNEL_ZIT
+        elif type(strategy) in (RuleStrategy, MLStrategy):
+            kernel_of_type[agent_type] = KERNEL_TABLE
+            if (strategy.policy.table == UNKNOWN).any():
+                strategy.policy.build()
+            tables[agent_type] = strategy.policy.table
+        else:
+            raise ValueError(f"カーネルで実行できるのは ZIT / Rule / ML だけです: {AGENT_TYPES[agent_type]}")
+    return kernel_of_type, tables
+
+
+def run_kernel_simulation(population, strategies, num_periods, steps_per_period, action_stats=None,
+                          progress_every=10, start_period=0, checkpointer=None, rng=None, arrival='uniform',
+                          chunk_steps=CHUNK_STEPS, on_period_end=None, market='board'):
+    """
+    engine.run_simulation の ZIT / Rule / ML を、1期間ずつ board_period_kernel で実行する
+    market='book' なら複数価格の板 (orderbook.book_period_kernel) で実行する
+    rng は rng.BlockRNG (既定は新しい BlockRNG). 同じ BlockRNG なら engine.run_simulation と同じ結果になる
+    (arrival='uniform' のとき. 'permutation' は到着の順番を未取引の人の順列で前もって決める別のモデル)
+    1期間を chunk_steps ステップずつ区切って回すので、計算量は O(ステップ数), メモリは O(人数 + chunk_steps)
+    取引ログとプロファイラは使えない (行動統計は action_stats に期間ごとに加える)
+    on_period_end(period, counts) があれば期間ごとに呼ぶ (counts は タイプ x OUTCOMES の行動数)
+    """
+    if arrival not in ARRIVAL_MODES:
+        raise ValueError(f"arrival は {ARRIVAL_MODES} のどれかです: {arrival}")
+    if market not in MARKETS:
+        raise ValueError(f"market は {MARKETS} のどれかです: {market}")
+    kernel_of_type, tables = kernel_types(strategies)
+    type_codes = population.type
+    missing = sorted(set(np.unique(type_codes).tolist()) - set(strategies))
+    if missing:
+        raise ValueError(f"戦略が指定されていないタイプがあります: {[AGENT_TYPES[t] for t in missing]}")
+    if rng is None:
+        rng = BlockRNG()
+    if not isinstance(rng, BlockRNG):
+        raise ValueError("カーネルの乱数は rng.BlockRNG で渡してください")
+    # 順列で到着させるときは「誰が来るか」に乱数を使わない
+    uniforms_per_step = UNIFORMS_PER_STEP - (arrival == 'permutation')
+
+    n = len(population)
+    if market == 'book':
+        # orderbook は kernels を読み込むので、ここで初めて読み込む
+        from orderbook import book_period_kernel, NO_ORDER
+        num_ticks = PRICE_MAX + 1
+        # next_, prev, order_price, order_side (人数), head, tail (2 x ティック数), best (買い・売り)
+        book_sizes = (n, n, n, n, 2 * num_ticks, 2 * num_ticks, 2)
+    if HAVE_NUMBA:
+        members = np.empty(n, dtype=np.int64)
+        position = np.empty(n, dtype=np.int64)
+        no_arrivals = np.empty(0, dtype=np.int64)
+    else:
+        # Python で実行するときは配列の要素アクセスが遅いので、リストに直してから回す
+        kernel_of_type = kernel_of_type.tolist()
+        tables = tables.tolist()
+        type_codes = type_codes.tolist()
+        no_arrivals = []
+
+    for period in range(start_period, num_periods):
+        population.reset_period()
+        if HAVE_NUMBA:
+            members[:] = np.arange(n)
+            position[:] = members
+            counts = np.zeros(len(AGENT_TYPES) * NUM_OUTCOMES, dtype=np.int64)
+            state = np.array([BOARD_EMPTY, -1, -1, n, 0, 0, -1], dtype=np.int64)
+            asset, traded = population.asset, population.traded
+            buy_price, sell_price = population.buy_price, population.sell_price
+        else:
+            members = list(range(n))
+            position = list(range(n))
+            counts = [0] * (len(AGENT_TYPES) * NUM_OUTCOMES)
+            state = [BOARD_EMPTY, -1, -1, n, 0, 0, -1]
+            asset = population.asset.tolist()
+            traded = population.traded.tolist()
+            buy_price, sell_price = population.buy_price.tolist(), population.sell_price.tolist()
+        if market == 'book':
+            if HAVE_NUMBA:
+                book = [np.full(size, NO_ORDER, dtype=np.int64) for size in book_sizes]
+            else:
+                book = [[NO_ORDER] * size for size in book_sizes]
+
+        arrivals = no_arrivals
+        while state[STATE_STEPS] < steps_per_period and state[STATE_SIZE] > 0:
+            if arrival == 'permutation' and state[STATE_ARRIVAL] >= len(arrivals):
+                # 未取引の人を並べ替えて次の到着順にする (1巡の中では同じ人は来ない)
+                arrivals = rng.generator.permutation(np.asarray(members[:state[STATE_SIZE]]))
+                if not HAVE_NUMBA:
+                    arrivals = arrivals.tolist()
+                state[STATE_ARRIVAL] = 0
+            max_steps = min(chunk_steps, steps_per_period - state[STATE_STEPS])
+            uniforms = rng.take(uniforms_per_step * max_steps)
+            if not HAVE_NUMBA:
+                uniforms = uniforms.tolist()
+            if market == 'book':
+                used = book_period_kernel(type_codes, kernel_of_type, tables, buy_price, sell_price, asset, traded,
+                                          members, position, *book, num_ticks, state, arrivals, uniforms, max_steps,
+                                          counts)
+            else:
+                used = board_period_kernel(type_codes, kernel_of_type, tables, buy_price, sell_price, asset, traded,
+                                           members, position, state, arrivals, uniforms, max_steps, counts)
+            rng.unread(uniforms[used:])
+
+        if not HAVE_NUMBA:
+            population.asset[:] = asset
+            population.traded[:] = traded
+        counts = np.reshape(counts, (len(AGENT_TYPES), NUM_OUTCOMES))
+        if action_stats is not None:
+            action_stats.add_period(counts)
+        if on_period_end is not None:
+            on_period_end(period, counts)
+        if checkpointer is not None and checkpointer.due(period + 1):
+            checkpointer.save(period + 1, population, None, action_stats, rng=rng)
+        if progress_every and (period + 1) % progress_every == 0:
+            print(f"  ... 期間 {period + 1}/{num_periods} 完了")
+
+    return population, action_stats
+
+
+def _ks_statistic(a, b):
+    """ 2標本コルモゴロフ-スミルノフ統計量と漸近 p 値 (scipy を使わない) """
+    a = np.sort(a)
+    b = np.sort(b)
+    grid = np.concatenate([a, b])
+    d = np.max(np.abs(np.searchsorted(a, grid, side='right') / len(a) -
+                      np.searchsorted(b, grid, side='right') / len(b)))
+    en = math.sqrt(len(a) * len(b) / (len(a) + len(b)))
+    lam = (en + 0.12 + 0.11 / en) * d
+    p = 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam) for k in range(1, 101))
+    return d, min(max(p, 0.0), 1.0)
+
+
+def cross_check(num_traders=500, num_periods=20, steps_factor=2, ratio=0.3, replicas=20, seed=0, alpha=0.01):
+    """
+    カーネルを engine.run_simulation (参照のループ) と突き合わせる
+    1. 同じ BlockRNG なら資産と行動統計が完全に一致する (ZIT のみ, ZIT + Rule, ZIT + ML)
+    2. 参照のループを random モジュールで回した結果と、資産の分布 (KS 検定) と行動の割合が同じとみなせる
+    一致すれば True を返す
+    """
+    from action_stats import ActionStats
+    from ml_policy import MLDecisionTable
+    from mlp_runtime import NumpyMLP
+    from engine import run_simulation, default_strategies
+    from population import TraderPopulation
+    from rng import simulation_rngs
+
+    steps_per_period = num_traders * steps_factor
+    ok = True
+
+    # 1. 同じ乱数での完全一致 (ML は乱数の重みの意思決定表で確かめる)
+    policy = MLDecisionTable(NumpyMLP.random(seed))
+    for special_type, market_ratio in (('Rule', 0.0), ('Rule', ratio), ('ML', ratio)):
+        results = []
+        for backend in ('python', 'kernel'):
+            population_rng, rng = simulation_rngs(seed)
+            population = TraderPopulation.mixed(num_traders, market_ratio, special_type, rng=population_rng)
+            stats = ActionStats()
+            run_simulation(population, default_strategies(policy, rng), num_periods, steps_per_period,
+                           action_stats=stats, progress_every=0, rng=rng, backend=backend)
+            results.append((population.asset.copy(), stats.per_period(), rng.random()))
+        same = (np.array_equal(results[0][0], results[1][0]) and np.array_equal(results[0][1], results[1][1])
+                and results[0][2] == results[1][2])
+        ok &= same
+        print(f"{special_type} {market_ratio:.0%}: 同じ BlockRNG で完全一致 ... {'OK' if same else 'NG'}")
+
+    # 2. random モジュールの参照ループと分布を比べる
+    assets = {'python': [], 'kernel': []}
+    totals = {'python': 0, 'kernel': 0}
+    for i in range(replicas):
+        for backend in assets:
+            population_rng, block_rng = simulation_rngs([seed, i, backend == 'kernel'])
+            population = TraderPopulation.mixed(num_traders, ratio, 'Rule', rng=population_rng)
+            stats = ActionStats()
+            if backend == 'python':
+                random.seed(seed * 1000003 + i)
+            run_simulation(population, default_strategies(rng=block_rng if backend == 'kernel' else None),
+                           num_periods, steps_per_period, action_stats=stats, progress_every=0,
+                           rng=block_rng if backend == 'kernel' else None, backend=backend)
+            assets[backend].append(population.asset.copy())
+            totals[backend] = totals[backend] + stats.totals()
+    d, p = _ks_statistic(np.concatenate(assets['python']), np.concatenate(assets['kernel']))
+    same = p > alpha
+    ok &= same
+    print(f"資産分布の KS 検定 ({replicas} 回 x {num_traders} 人): D = {d:.4f}, p = {p:.3f} ... {'OK' if same else 'NG'}")
+    fractions = {backend: t / t.sum(axis=1, keepdims=True).clip(1) for backend, t in totals.items()}
+    diff = np.abs(fractions['python'] - fractions['kernel']).max()
+    same = diff < 0.01
+    ok &= same
+    print(f"行動の割合の最大差: {diff:.4f} ... {'OK' if same else 'NG'}")
+    return ok
+
+
+def benchmark(num_traders=2000, num_periods=20, steps_factor=2, ratio=0.3, seed=0):
+    """ 参照のループとカーネルの1ステップあたりの時間を比べる (numba があれば初回のコンパイルは除く) """
+    from engine import run_simulation, default_strategies
+    from population import TraderPopulation
+    from rng import simulation_rngs
+
+    steps_per_period = num_traders * steps_factor
+    if HAVE_NUMBA:
+        population_rng, rng = simulation_rngs(seed)
+        run_kernel_simulation(TraderPopulation.mixed(10, ratio, 'Rule', rng=population_rng),
+                              default_strategies(rng=rng), 1, 20, progress_every=0, rng=rng)
+    seconds = {}
+    for backend in ('python', 'kernel'):
+        population_rng, rng = simulation_rngs(seed)
+        population = TraderPopulation.mixed(num_traders, ratio, 'Rule', rng=population_rng)
+        t0 = time.perf_counter()
+        run_simulation(population, default_strategies(rng=rng), num_periods, steps_per_period, progress_every=0,
+                       rng=rng, backend=backend)
+        seconds[backend] = time.perf_counter() - t0
+    return seconds
+
+
+if __name__ == '__main__':
+
+    print(f"numba: {'あり (コンパイルして実行)' if HAVE_NUMBA else 'なし (Python で実行)'}")
+    ok = cross_check()
+    seconds = benchmark()
+    print(f"参照のループ: {seconds['python']:.3f} 秒, カーネル: {seconds['kernel']:.3f} 秒 "
+          f"({seconds['python'] / seconds['kernel']:.1f} 倍)")
+    raise SystemExit(0 if ok else 1)
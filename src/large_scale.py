@@ -0,0 +1,92 @@
+import argparse
+import resource
+import time
+import numpy as np
+
+from trade_log import AGENT_TYPES
+from action_stats import ActionStats, OUTCOMES
+from population import TraderPopulation
+from engine import default_strategies
+from kernels import run_kernel_simulation, HAVE_NUMBA, ARRIVAL_MODES, CHUNK_STEPS, UNIFORMS_PER_STEP
+from rng import simulation_rngs
+from results_store import save_run
+
+
+def memory_mb():
+    """ (現在の RSS, ピークの RSS) を MB で返す (現在の値は Linux の /proc から. 読めなければピークで代用) """
+    # Linux の ru_maxrss は KB 単位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        current = peak
+    return current, peak
+
+
+def run_large_scale(num_traders, num_periods, steps_per_period, ratio=0.0, special_type='Rule', policy=None,
+                    arrival='uniform', seed=None, chunk_steps=CHUNK_STEPS, report_every=1, results_dir=None):
+    """
+    10^6 人規模の市場を kernels.run_kernel_simulation で実行し、期間ごとに時間とメモリを表示する
+    - 1期間は O(ステップ数): chunk_steps ステップずつカーネルを呼び、乱数もその分だけ前もって引く
+    - メモリは O(人数): トレーダーの状態は TraderPopulation の配列だけ (取引ログは取らず、行動は期間ごとの集計)
+    arrival='uniform' は参照のループと同じ選び方, 'permutation' は未取引の人の順列の順に到着させる
+    results_dir を渡すと資産と行動統計を results_store.save_run で保存する. (population, action_stats) を返す
+    """
+    population_rng, rng = simulation_rngs(seed)
+    population = TraderPopulation.mixed(num_traders, ratio, special_type, rng=population_rng)
+    strategies = default_strategies(policy, rng)
+    action_stats = ActionStats()
+
+    # トレーダーの状態 + 未取引プール (members/position) + 1チャンク分の乱数
+    pool_bytes = 2 * 8 * num_traders
+    uniform_bytes = 8 * UNIFORMS_PER_STEP * chunk_steps
+    print(f"{num_traders:,} 人 x {num_periods} 期間 (1期間 {steps_per_period:,} ステップ, arrival={arrival}, "
+          f"numba: {'あり' if HAVE_NUMBA else 'なし'})")
+    print(f"  トレーダーの状態 {population.nbytes() / 2**20:.1f} MB (1人 {population.nbytes() / num_traders:.0f} バイト), "
+          f"未取引プール {pool_bytes / 2**20:.1f} MB, 乱数 {uniform_bytes / 2**20:.1f} MB")
+
+    t_start = time.perf_counter()
+    t_last = [t_start]
+    buy_exec = OUTCOMES.index('Buy_Exec')
+
+    def report(period, counts):
+        now = time.perf_counter()
+        if report_every and (period + 1) % report_every == 0:
+            current, peak = memory_mb()
+            # 成立1件につき買い手と売り手の両方を数えているので、ステップ数は 合計 - 成立件数
+            trades = int(counts[:, buy_exec].sum())
+            steps = int(counts.sum()) - trades
+            print(f"  期間 {period + 1}/{num_periods}: {now - t_last[0]:.2f} 秒 ({steps / (now - t_last[0]):,.0f} ステップ/秒), "
+                  f"取引 {trades:,} 件, RSS {current:.0f} MB (ピーク {peak:.0f} MB)")
+        t_last[0] = now
+
+    run_kernel_simulation(population, strategies, num_periods, steps_per_period, action_stats=action_stats,
+                          progress_every=0, rng=rng, arrival=arrival, chunk_steps=chunk_steps, on_period_end=report)
+    elapsed = time.perf_counter() - t_start
+    print(f"合計 {elapsed:.1f} 秒, ピーク RSS {memory_mb()[1]:.0f} MB")
+    for t in sorted(set(np.unique(population.type).tolist())):
+        values = population.asset[population.type == t]
+        print(f"  {AGENT_TYPES[t]}: {len(values):,} 人, 平均資産 {values.mean():.4f}, 標準偏差 {values.std():.4f}")
+
+    if results_dir is not None:
+        save_run(results_dir, population, action_stats, label=f"{int(ratio*100)}pct", strategy=special_type,
+                 ratio=ratio, num_periods=num_periods, steps_per_period=steps_per_period, seed=seed, arrival=arrival)
+    return population, action_stats
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="10^6 人規模の市場を O(ステップ数) / O(人数) のカーネルで実行する")
+    parser.add_argument('--traders', type=int, default=1_000_000)
+    parser.add_argument('--periods', type=int, default=100)
+    parser.add_argument('--steps-factor', type=int, default=2, help="1期間のステップ数 = トレーダー数 x これ")
+    parser.add_argument('--ratio', type=float, default=0.0, help="Rule の割合")
+    parser.add_argument('--arrival', choices=ARRIVAL_MODES, default='uniform')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--report-every', type=int, default=1)
+    parser.add_argument('--results', default=None, help="資産を results_store 形式で保存するディレクトリ")
+    args = parser.parse_args()
+
+    run_large_scale(args.traders, args.periods, args.traders * args.steps_factor, ratio=args.ratio,
+                    arrival=args.arrival, seed=args.seed, report_every=args.report_every, results_dir=args.results)
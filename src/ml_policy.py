@@ -0,0 +1,112 @@
+import numpy as np
+
+from encoding import (PRICE_MAX, BOARD_EMPTY, BOARD_ASK, BOARD_BID, BOARD_TYPES, ROLES,
+                      COMPACT_DIM, COMPACT_DTYPE, expand_one_hot)
+
+
+# MLTraderが提示する価格 (1 ~ 199)
+CHOICE_MIN = 1
+CHOICE_MAX = PRICE_MAX - 1
+NUM_CHOICES = CHOICE_MAX - CHOICE_MIN + 1
+
+# 表の未計算マーク
+UNKNOWN = -1
+
+
+def _board_states():
+    """ 取り得る板の状態 (type, price) の一覧 (空板は価格に依存しないので1つ) """
+    states = [(BOARD_EMPTY, 0)]
+    for board_type in (BOARD_ASK, BOARD_BID):
+        for price in range(PRICE_MAX + 1):
+            states.append((board_type, price))
+    return states
+
+
+def _grid_inputs(states):
+    """ 板の状態ごとに (提示価格 × 買い/売り) の全入力をコンパクト形式で並べる """
+    prices = np.arange(CHOICE_MIN, CHOICE_MAX + 1)
+    x = np.empty((len(states), NUM_CHOICES, 2, COMPACT_DIM), dtype=COMPACT_DTYPE)
+    for i, (board_type, board_price) in enumerate(states):
+        x[i, :, :, 0] = board_type
+        x[i, :, :, 1] = board_price if board_type != BOARD_EMPTY else -1
+    # 最後の軸: 0 買い, 1 売り
+    x[:, :, 0, 2] = 0
+    x[:, :, 1, 2] = 1
+    x[:, :, :, 3] = prices[None, :, None]
+    return x.reshape(-1, COMPACT_DIM)
+
+
+class MLDecisionTable:
+    """
+    MLTraderの意思決定表
+    (板の種類, 板の価格, 提示価格) -> 買い/売り をモデルの一括推論で作っておき、
+    シミュレーション中は表を引くだけにする
+    """
+    def __init__(self, model=None, lazy=False, batch_states=32):
+        self.model = model
+        self.batch_states = batch_states
+        # table[board_type, board_price, price - CHOICE_MIN] = 0:買い, 1:売り
+        self.table = np.full((3, PRICE_MAX + 1, NUM_CHOICES), UNKNOWN, dtype=np.int8)
+        if model is not None and not lazy:
+            self.build()
+
+    def _evaluate(self, states):
+        """ 指定した板の状態の行をまとめて1回のpredictで埋める """
+        x_compact = _grid_inputs(states)
+        if hasattr(self.model, 'predict_compact'):
+            # NumpyMLP: one-hot に展開せずに1層目を計算できる
+            probs = self.model.predict_compact(x_compact)
+        else:
+            probs = self.model.predict(expand_one_hot(x_compact), batch_size=4096, verbose=0)
+        # 成立・上書きの確率 = 1 - 不成立(クラス4)の確率
+        success = 1.0 - np.asarray(probs)[:, 4]
+        success = success.reshape(len(states), NUM_CHOICES, 2)
+        roles = np.where(success[:, :, 0] > success[:, :, 1], 0, 1).astype(np.int8)
+        for (board_type, board_price), row in zip(states, roles):
+            if board_type == BOARD_EMPTY:
+                self.table[BOARD_EMPTY, :, :] = row
+            else:
+                self.table[board_type, board_price, :] = row
+
+    def build(self):
+        """ 全ての板の状態について表を作る """
+        states = _board_states()
+        for i in range(0, len(states), self.batch_states):
+            self._evaluate(states[i:i + self.batch_states])
+        return self
+
+    def role_code(self, board_type, board_price, price):
+        """ 0:買い, 1:売り を返す (未計算の行はその板の状態の分だけ一括推論する) """
+        if board_type == BOARD_EMPTY:
+            board_price = 0
+        code = self.table[board_type, board_price, price - CHOICE_MIN]
+        if code == UNKNOWN:
+            if self.model is None:
+                raise ValueError("意思決定表が未計算で、推論に使うモデルもありません")
+            self._evaluate([(board_type, board_price)])
+            code = self.table[board_type, board_price, price - CHOICE_MIN]
+        return code
+
+    def role_codes(self, board_types, board_prices, prices):
+        """ エージェントの集団の分をまとめて引く (未計算の行があれば先に表を全部作る) """
+        if (self.table == UNKNOWN).any():
+            if self.model is None:
+                raise ValueError("意思決定表が未計算で、推論に使うモデルもありません")
+            self.build()
+        board_types = np.asarray(board_types)
+        board_prices = np.where(board_types == BOARD_EMPTY, 0, board_prices)
+        return self.table[board_types, board_prices, np.asarray(prices) - CHOICE_MIN]
+
+    def choose_role(self, board, price):
+        """ 板(dict)と提示価格から 'buyer' / 'seller' を返す """
+        return ROLES[self.role_code(BOARD_TYPES[board['type']], board['price'], price)]
+
+    def save(self, filename):
+        np.save(filename, self.table)
+        print(f"意思決定表を保存しました: {filename}")
+
+    @classmethod
+    def load(cls, filename, model=None):
+        policy = cls(model=model, lazy=True)
+        policy.table = np.load(filename)
+        return policy
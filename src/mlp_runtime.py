@@ -0,0 +1,117 @@
+import numpy as np
+
+from encoding import (PRICE_MAX, BOARD_EMPTY, BOARD_PRICE_OFFSET, ROLE_OFFSET, ACTION_PRICE_OFFSET, INPUT_DIM,
+                      COMPACT_DIM, COMPACT_DTYPE, expand_one_hot)
+
+
+def _relu(z):
+    return np.maximum(z, 0.0)
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+ACTIVATIONS = {'relu': _relu, 'softmax': _softmax, 'sigmoid': _sigmoid,
+               'tanh': np.tanh, 'linear': lambda z: z}
+
+
+def export_dense_weights(model, filename):
+    """
+    Keras モデルの Dense 層の重みを .npz に書き出す (Dropout は推論時に何もしないので飛ばす)
+    W0, b0, W1, b1, ... と activations (活性化関数の名前) を保存する
+    """
+    arrays = {}
+    activations = []
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        kernel, bias = weights
+        i = len(activations)
+        arrays[f"W{i}"] = kernel.astype(np.float32)
+        arrays[f"b{i}"] = bias.astype(np.float32)
+        activations.append(layer.get_config().get('activation', 'linear'))
+    np.savez(filename, activations=np.array(activations), **arrays)
+    print(f"重みを書き出しました: {filename} ({len(activations)} 層)")
+
+
+class NumpyMLP:
+    """
+    export_dense_weights で書き出した重みで順伝播する (TensorFlow 不要)
+    predict は Keras の model.predict と同じ呼び方ができる
+    """
+    def __init__(self, weights, biases, activations):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activations = list(activations)
+        for name in self.activations:
+            if name not in ACTIVATIONS:
+                raise ValueError(f"未対応の活性化関数です: {name}")
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            activations = [str(a) for a in data['activations']]
+            weights = [data[f"W{i}"] for i in range(len(activations))]
+            biases = [data[f"b{i}"] for i in range(len(activations))]
+        return cls(weights, biases, activations)
+
+    @classmethod
+    def random(cls, seed=None, layer_sizes=(INPUT_DIM, 128, 64, 5), scale=0.1):
+        """ 乱数の重み (正規分布) の MLP (学習済みの重みが無いときのテスト・ベンチマーク用) """
+        rng = np.random.default_rng(seed)
+        shapes = list(zip(layer_sizes[:-1], layer_sizes[1:]))
+        weights = [rng.normal(0, scale, s) for s in shapes]
+        biases = [rng.normal(0, scale, s[1]) for s in shapes]
+        return cls(weights, biases, ['relu'] * (len(shapes) - 1) + ['softmax'])
+
+    def _forward_from(self, h, first_layer=0):
+        """ first_layer 層目の線形変換 (+バイアス) 後の h から残りを計算する """
+        h = ACTIVATIONS[self.activations[first_layer]](h)
+        for W, b, name in zip(self.weights[first_layer + 1:], self.biases[first_layer + 1:],
+                              self.activations[first_layer + 1:]):
+            h = ACTIVATIONS[name](h @ W + b)
+        return h
+
+    def predict(self, x, batch_size=None, verbose=0):
+        """ 407次元 (dense) 入力の順伝播. batch_size/verbose は Keras との互換用で使わない """
+        x = np.asarray(x, dtype=np.float32)
+        return self._forward_from(x @ self.weights[0] + self.biases[0])
+
+    def predict_compact(self, x_compact):
+        """
+        コンパクト形式 (板の種類, 板の価格, 売買, 提示価格) の入力の順伝播
+        one-hot なので1層目は行列積の代わりに重みの行を足すだけでよい
+        """
+        W0 = self.weights[0]
+        if W0.shape[0] != INPUT_DIM:
+            raise ValueError(f"1層目の入力次元が {INPUT_DIM} ではありません: {W0.shape[0]}")
+        x_compact = np.asarray(x_compact, dtype=np.intp)
+        board_type = x_compact[:, 0]
+        h = W0[board_type] + W0[ROLE_OFFSET + x_compact[:, 2]] + W0[ACTION_PRICE_OFFSET + x_compact[:, 3]]
+        h += self.biases[0]
+        has_price = board_type != BOARD_EMPTY
+        h[has_price] += W0[BOARD_PRICE_OFFSET + x_compact[has_price, 1]]
+        return self._forward_from(h)
+
+
+def check_export(model, mlp, num_samples=1000, seed=0):
+    """ ランダムな入力で Keras モデルと NumpyMLP (dense/コンパクト両方) の出力の差の最大値を返す """
+    rng = np.random.default_rng(seed)
+    x_compact = np.empty((num_samples, COMPACT_DIM), dtype=COMPACT_DTYPE)
+    x_compact[:, 0] = rng.integers(0, 3, num_samples)
+    x_compact[:, 1] = np.where(x_compact[:, 0] == BOARD_EMPTY, -1, rng.integers(0, PRICE_MAX + 1, num_samples))
+    x_compact[:, 2] = rng.integers(0, 2, num_samples)
+    x_compact[:, 3] = rng.integers(0, PRICE_MAX + 1, num_samples)
+    x = expand_one_hot(x_compact)
+
+    expected = np.asarray(model.predict(x, verbose=0))
+    return max(float(np.abs(expected - mlp.predict(x)).max()),
+               float(np.abs(expected - mlp.predict_compact(x_compact)).max()))
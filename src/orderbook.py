@@ -0,0 +1,539 @@
+import random
+import time
+import numpy as np
+
+from trader_pool import AvailablePool
+from trade_log import AGENT_TYPES, RESULT_OVERWRITE, RESULT_EXECUTED
+from encoding import PRICE_MAX, BOARD_EMPTY, BOARD_ASK, BOARD_BID, ROLE_BUYER, ROLE_SELLER
+from engine import Board, CHOICE_MIN
+from rule_policy import RANDOM_ROLE
+from ml_policy import NUM_CHOICES
+from kernels import (njit, HAVE_NUMBA, KERNEL_ZIT, NUM_OUTCOMES,
+                     STATE_SIZE, STATE_ARRIVAL, STATE_STEPS, STATE_LAST_SIDE)
+
+
+NO_ORDER = -1
+
+
+class OrderBook:
+    """
+    価格 0 ~ PRICE_MAX の整数ティックごとの FIFO キューを持つ板 (価格優先・時間優先)
+    1人1注文までなので、エージェントIDをそのまま連結リストのノードにする (next/prev は配列)
+    買い/売りそれぞれ、注文のあるティックをビットマップ (Python の int) で持ち、最良気配を O(1) で引く
+    side は ROLE_BUYER (買い) / ROLE_SELLER (売り)
+    """
+    def __init__(self, num_agents, num_ticks=PRICE_MAX + 1):
+        self.num_agents = num_agents
+        self.num_ticks = num_ticks
+        self.clear()
+
+    def clear(self):
+        n = self.num_agents
+        self.next = [NO_ORDER] * n
+        self.prev = [NO_ORDER] * n
+        self.order_price = [NO_ORDER] * n
+        self.order_side = [NO_ORDER] * n
+        self.head = [NO_ORDER] * (2 * self.num_ticks)
+        self.tail = [NO_ORDER] * (2 * self.num_ticks)
+        self.bits = [0, 0]
+        self.num_orders = 0
+
+    def __len__(self):
+        return self.num_orders
+
+    def has_order(self, agent_id):
+        return self.order_side[agent_id] != NO_ORDER
+
+    def add(self, agent_id, side, price):
+        """ price のキューの末尾に並べる (既に注文があれば先に取り消す) """
+        if self.order_side[agent_id] != NO_ORDER:
+            self.cancel(agent_id)
+        level = side * self.num_ticks + price
+        last = self.tail[level]
+        self.prev[agent_id] = last
+        self.next[agent_id] = NO_ORDER
+        if last == NO_ORDER:
+            self.head[level] = agent_id
+            self.bits[side] |= 1 << price
+        else:
+            self.next[last] = agent_id
+        self.tail[level] = agent_id
+        self.order_price[agent_id] = price
+        self.order_side[agent_id] = side
+        self.num_orders += 1
+
+    def cancel(self, agent_id):
+        """ 注文を取り消す (無ければ False) """
+        side = self.order_side[agent_id]
+        if side == NO_ORDER:
+            return False
+        price = self.order_price[agent_id]
+        level = side * self.num_ticks + price
+        before, after = self.prev[agent_id], self.next[agent_id]
+        if before == NO_ORDER:
+            self.head[level] = after
+        else:
+            self.next[before] = after
+        if after == NO_ORDER:
+            self.tail[level] = before
+        else:
+            self.prev[after] = before
+        if self.head[level] == NO_ORDER:
+            self.bits[side] &= ~(1 << price)
+        self.order_side[agent_id] = NO_ORDER
+        self.order_price[agent_id] = NO_ORDER
+        self.num_orders -= 1
+        return True
+
+    def best_bid(self):
+        """ 最も高い買い注文の価格 (無ければ -1) """
+        return self.bits[ROLE_BUYER].bit_length() - 1
+
+    def best_ask(self):
+        """ 最も安い売り注文の価格 (無ければ -1) """
+        bits = self.bits[ROLE_SELLER]
+        return (bits & -bits).bit_length() - 1
+
+    def best(self, side):
+        return self.best_bid() if side == ROLE_BUYER else self.best_ask()
+
+    def front(self, side, price):
+        """ price のキューの先頭 (最も早く並んだ) エージェント """
+        return self.head[side * self.num_ticks + price]
+
+    def pop_best(self, side):
+        """ 最良気配のキューの先頭を取り出してそのエージェントIDを返す (無ければ -1) """
+        price = self.best(side)
+        if price == -1:
+            return NO_ORDER
+        agent_id = self.front(side, price)
+        self.cancel(agent_id)
+        return agent_id
+
+    def submit_orders(self, agents, sides, prices):
+        """
+        注文の列 (エージェントID, side, 価格) をまとめて book_orders_kernel で処理し、約定した件数を返す
+        1件ずつ cancel -> (交差すれば) pop_best / (しなければ) add と呼ぶのと同じ結果になる
+        """
+        best = [self.best_bid(), self.best_ask()]
+        links = [self.next, self.prev, self.order_price, self.order_side, self.head, self.tail]
+        if HAVE_NUMBA:
+            links = [np.array(a, dtype=np.int64) for a in links]
+            best = np.array(best, dtype=np.int64)
+            orders = [np.asarray(a, dtype=np.int64) for a in (agents, sides, prices)]
+        else:
+            # Python で実行するときはリストのまま回す
+            orders = [np.asarray(a).tolist() for a in (agents, sides, prices)]
+        executed, change = book_orders_kernel(*links, best, self.num_ticks, *orders)
+        if HAVE_NUMBA:
+            self.next, self.prev, self.order_price, self.order_side, self.head, self.tail = (a.tolist() for a in links)
+        self.num_orders += change
+        for side in (ROLE_BUYER, ROLE_SELLER):
+            heads = self.head[side * self.num_ticks:(side + 1) * self.num_ticks]
+            self.bits[side] = sum(1 << price for price, agent_id in enumerate(heads) if agent_id != NO_ORDER)
+        return executed
+
+    def depth(self, side):
+        """ [(価格, 注文数), ...] を最良気配から順に返す (確認・分析用) """
+        levels = []
+        prices = range(self.num_ticks - 1, -1, -1) if side == ROLE_BUYER else range(self.num_ticks)
+        for price in prices:
+            count = 0
+            agent_id = self.front(side, price)
+            while agent_id != NO_ORDER:
+                count += 1
+                agent_id = self.next[agent_id]
+            if count:
+                levels.append((price, count))
+        return levels
+
+
+@njit(cache=True)
+def book_orders_kernel(next_, prev, order_price, order_side, head, tail, best, num_ticks, agents, sides, prices):
+    """
+    注文の列を OrderBook と同じ規則で1件ずつ処理する (cancel / pop_best / add をまとめて1つのループにしたもの)
+    1件ごとに前の注文を取り消し、反対側の最良気配と交差すればそのキューの先頭と約定し、
+    しなければ price のキューの末尾に並べる
+    head/tail[side * num_ticks + price] はキューの先頭・末尾, best[side] は最良気配 (-1 は注文なし)
+    (約定した件数, 板の注文数の増減) を返す
+    numba があれば配列のままコンパイルして実行し、無ければ (OrderBook のリストのまま) Python で実行する
+    """
+    executed = 0
+    change = 0
+    for i in range(len(agents)):
+        agent_id = agents[i]
+        side = sides[i]
+        price = prices[i]
+        # 1回目は自分の前の注文、交差したときの2回目は反対側の最良気配の先頭をキューから外す
+        removed = agent_id
+        while removed != NO_ORDER:
+            removed_side = order_side[removed]
+            if removed_side != NO_ORDER:
+                removed_price = order_price[removed]
+                level = removed_side * num_ticks + removed_price
+                before = prev[removed]
+                after = next_[removed]
+                if before == NO_ORDER:
+                    head[level] = after
+                else:
+                    next_[before] = after
+                if after == NO_ORDER:
+                    tail[level] = before
+                else:
+                    prev[after] = before
+                if head[level] == NO_ORDER and best[removed_side] == removed_price:
+                    # 最良気配の価格が空になったら、買いは安い方へ、売りは高い方へ次の注文を探す
+                    quote = NO_ORDER
+                    if removed_side == ROLE_BUYER:
+                        for p in range(removed_price - 1, -1, -1):
+                            if head[p] != NO_ORDER:
+                                quote = p
+                                break
+                    else:
+                        for p in range(removed_price + 1, num_ticks):
+                            if head[num_ticks + p] != NO_ORDER:
+                                quote = p
+                                break
+                    best[removed_side] = quote
+                order_side[removed] = NO_ORDER
+                order_price[removed] = NO_ORDER
+                change -= 1
+            if removed != agent_id:
+                executed += 1
+                break
+
+            quote = best[1 - side]
+            if quote != NO_ORDER and (price >= quote if side == ROLE_BUYER else price <= quote):
+                removed = head[(1 - side) * num_ticks + quote]
+            else:
+                level = side * num_ticks + price
+                last = tail[level]
+                prev[agent_id] = last
+                next_[agent_id] = NO_ORDER
+                if last == NO_ORDER:
+                    head[level] = agent_id
+                else:
+                    next_[last] = agent_id
+                tail[level] = agent_id
+                order_price[agent_id] = price
+                order_side[agent_id] = side
+                if best[side] == NO_ORDER or (price > best[side] if side == ROLE_BUYER else price < best[side]):
+                    best[side] = price
+                change += 1
+                removed = NO_ORDER
+    return executed, change
+
+
+@njit(cache=True)
+def book_period_kernel(type_codes, kernel_of_type, tables, buy_price, sell_price, asset, traded, members, position,
+                       next_, prev, order_price, order_side, head, tail, best, num_ticks,
+                       state, arrivals, uniforms, max_steps, counts):
+    """
+    run_book_simulation の1期間を最大 max_steps ステップ実行する (kernels.board_period_kernel の板を OrderBook にしたもの)
+    板は book_orders_kernel と同じ配列 (next_/prev/order_price/order_side/head/tail/best) で持ち、呼び出しをまたいで続ける
+    戦略に見せる板は update_board_view と同じく、直前に注文を置いた側 (state[STATE_LAST_SIDE]) の最良気配を優先する
+    エージェントの選び方・乱数の使い方・state / counts / 戻り値は board_period_kernel と同じ
+    """
+    size = state[STATE_SIZE]
+    arrival = state[STATE_ARRIVAL]
+    last_side = state[STATE_LAST_SIDE]
+    use_arrivals = len(arrivals) > 0
+    cursor = 0
+    steps = 0
+
+    while steps < max_steps and size > 0:
+        if use_arrivals:
+            while arrival < len(arrivals) and traded[arrivals[arrival]]:
+                arrival += 1
+            if arrival == len(arrivals):
+                break
+            agent_id = arrivals[arrival]
+            arrival += 1
+        else:
+            agent_id = members[int(uniforms[cursor] * size)]
+            cursor += 1
+        steps += 1
+        agent_type = type_codes[agent_id]
+        if kernel_of_type[agent_type] == KERNEL_ZIT:
+            role = int(uniforms[cursor] * 2)
+            cursor += 1
+            price = buy_price[agent_id] if role == ROLE_BUYER else sell_price[agent_id]
+        else:
+            # 板の見え方: 直前に置いた側の最良気配, その側が空なら反対側, 両方空なら空板
+            board_type = BOARD_EMPTY
+            board_price = 0
+            if last_side != NO_ORDER:
+                if best[last_side] != NO_ORDER:
+                    board_type = BOARD_BID if last_side == ROLE_BUYER else BOARD_ASK
+                    board_price = best[last_side]
+                elif best[1 - last_side] != NO_ORDER:
+                    board_type = BOARD_ASK if last_side == ROLE_BUYER else BOARD_BID
+                    board_price = best[1 - last_side]
+            price = CHOICE_MIN + int(uniforms[cursor] * NUM_CHOICES)
+            cursor += 1
+            role = tables[agent_type][board_type][board_price][price - CHOICE_MIN]
+            if role == RANDOM_ROLE:
+                role = int(uniforms[cursor] * 2)
+                cursor += 1
+
+        # 1回目は自分の前の注文、交差したときの2回目は反対側の最良気配の先頭をキューから外す
+        counterpart = NO_ORDER
+        quote = NO_ORDER
+        removed = agent_id
+        while removed != NO_ORDER:
+            removed_side = order_side[removed]
+            if removed_side != NO_ORDER:
+                removed_price = order_price[removed]
+                level = removed_side * num_ticks + removed_price
+                before = prev[removed]
+                after = next_[removed]
+                if before == NO_ORDER:
+                    head[level] = after
+                else:
+                    next_[before] = after
+                if after == NO_ORDER:
+                    tail[level] = before
+                else:
+                    prev[after] = before
+                if head[level] == NO_ORDER and best[removed_side] == removed_price:
+                    next_best = NO_ORDER
+                    if removed_side == ROLE_BUYER:
+                        for p in range(removed_price - 1, -1, -1):
+                            if head[p] != NO_ORDER:
+                                next_best = p
+                                break
+                    else:
+                        for p in range(removed_price + 1, num_ticks):
+                            if head[num_ticks + p] != NO_ORDER:
+                                next_best = p
+                                break
+                    best[removed_side] = next_best
+                order_side[removed] = NO_ORDER
+                order_price[removed] = NO_ORDER
+            if removed != agent_id:
+                counterpart = removed
+                break
+
+            quote = best[1 - role]
+            if quote != NO_ORDER and (price >= quote if role == ROLE_BUYER else price <= quote):
+                removed = head[(1 - role) * num_ticks + quote]
+            else:
+                level = role * num_ticks + price
+                last = tail[level]
+                prev[agent_id] = last
+                next_[agent_id] = NO_ORDER
+                if last == NO_ORDER:
+                    head[level] = agent_id
+                else:
+                    next_[last] = agent_id
+                tail[level] = agent_id
+                order_price[agent_id] = price
+                order_side[agent_id] = role
+                if best[role] == NO_ORDER or (price > best[role] if role == ROLE_BUYER else price < best[role]):
+                    best[role] = price
+                last_side = role
+                removed = NO_ORDER
+
+        if counterpart != NO_ORDER:
+            # --- 取引成立 (最良気配のキューの先頭と、その価格で) ---
+            traded[agent_id] = True
+            traded[counterpart] = True
+            for removed in (agent_id, counterpart):
+                pos = position[removed]
+                if pos < size:
+                    last_id = members[size - 1]
+                    members[pos] = last_id
+                    position[last_id] = pos
+                    members[size - 1] = removed
+                    position[removed] = size - 1
+                    size -= 1
+            if role == ROLE_BUYER:
+                asset[agent_id] -= quote
+                asset[counterpart] += quote
+            else:
+                asset[agent_id] += quote
+                asset[counterpart] -= quote
+            counts[agent_type * NUM_OUTCOMES + 2 + 2 * role] += 1
+            counts[type_codes[counterpart] * NUM_OUTCOMES + 2 + 2 * (1 - role)] += 1
+        else:
+            counts[agent_type * NUM_OUTCOMES + 1 + 2 * role] += 1
+
+    state[STATE_SIZE] = size
+    state[STATE_ARRIVAL] = arrival
+    state[STATE_LAST_SIDE] = last_side
+    state[STATE_STEPS] += steps
+    return cursor
+
+
+def update_board_view(board, book, last_side):
+    """
+    Rule/ML の戦略に見せる板 (Board) を作る: 直前に注文が置かれた側の最良気配を優先し、
+    その側が空なら反対側の最良気配、両方空なら空板にする (1枠の板での「最後に置かれた注文」に相当)
+    """
+    for side in (last_side, 1 - last_side):
+        if side == ROLE_BUYER:
+            price = book.best_bid()
+            if price != -1:
+                board.set(BOARD_BID, price, book.front(ROLE_BUYER, price))
+                return
+        elif side == ROLE_SELLER:
+            price = book.best_ask()
+            if price != -1:
+                board.set(BOARD_ASK, price, book.front(ROLE_SELLER, price))
+                return
+    board.clear()
+
+
+def run_book_simulation(population, strategies, num_periods, steps_per_period,
+                        trade_log=None, action_stats=None, prof=None, progress_every=10,
+                        start_period=0, checkpointer=None, rng=None):
+    """
+    engine.run_simulation の板を OrderBook (複数価格・価格時間優先) に替えたモード
+    - 反対側の最良気配と交差すれば、そのキューの先頭と最良気配の価格で約定する (結果は RESULT_EXECUTED)
+    - 交差しなければ板に並べる (結果は RESULT_OVERWRITE = 板に置いた)
+    - 1人1注文: 新しい注文を出すと前の注文は取り消す. 約定した人は期間の残りは注文しない
+    板は期間ごとに空にする
+    start_period / checkpointer / rng は engine.run_simulation と同じ
+    取引ログ・プロファイラが要らなければ engine.run_simulation(backend='kernel') で book_period_kernel を使う方が速い
+    (同じ BlockRNG なら同じ結果)
+    """
+    type_codes = population.type.tolist()
+    missing = sorted(set(type_codes) - set(strategies))
+    if missing:
+        raise ValueError(f"戦略が指定されていないタイプがあります: {[AGENT_TYPES[t] for t in missing]}")
+    choose = [strategies[t].choose if t in strategies else None for t in range(len(AGENT_TYPES))]
+    unique_strategies = list({id(s): s for s in strategies.values()}.values())
+
+    if rng is None:
+        rng = random
+    pool = AvailablePool(len(population))
+    pick = pool.pick
+    remove = pool.remove
+    asset = population.asset
+    traded = population.traded
+    book = OrderBook(len(population))
+    board = Board()
+    if action_stats is not None:
+        record = action_stats.record
+    if trade_log is not None:
+        append = trade_log.append
+    if prof is not None:
+        now = prof.clock
+        prof.start_run(num_periods, steps_per_period)
+
+    for period in range(start_period, num_periods):
+        if prof is not None:
+            prof.start_period(period)
+        population.reset_period()
+        pool.reset()
+        for strategy in unique_strategies:
+            strategy.start_period(population)
+        if action_stats is not None:
+            action_stats.start_period()
+        book.clear()
+        board.clear()
+        order_side = book.order_side
+        last_side = NO_ORDER
+
+        for step in range(steps_per_period):
+            if not pool:
+                break
+
+            if prof is not None: t0 = now()
+            agent_id = pick(rng)
+            if prof is not None: t1 = now()
+            agent_type = type_codes[agent_id]
+            role, price = choose[agent_type](agent_id, board)
+            if prof is not None: t2 = now()
+
+            if order_side[agent_id] != NO_ORDER:
+                book.cancel(agent_id)
+            best = book.best_ask() if role == ROLE_BUYER else book.best_bid()
+            if best != -1 and (price >= best if role == ROLE_BUYER else price <= best):
+                # --- 取引成立 (最良気配のキューの先頭と、その価格で) ---
+                counterpart = book.pop_best(1 - role)
+                traded[agent_id] = True
+                traded[counterpart] = True
+                remove(agent_id)
+                remove(counterpart)
+                if role == ROLE_BUYER:
+                    asset[agent_id] -= best
+                    asset[counterpart] += best
+                else:
+                    asset[agent_id] += best
+                    asset[counterpart] -= best
+                result = RESULT_EXECUTED
+                log_price = best
+            else:
+                book.add(agent_id, role, price)
+                last_side = role
+                counterpart = NO_ORDER
+                result = RESULT_OVERWRITE
+                log_price = price
+            update_board_view(board, book, last_side)
+
+            if prof is not None: t3 = now()
+
+            if action_stats is not None:
+                record(agent_type, role, result)
+                if counterpart != NO_ORDER:
+                    record(type_codes[counterpart], 1 - role, RESULT_EXECUTED)
+            if trade_log is not None:
+                append(period + 1, step + 1, agent_id, agent_type, role, log_price, result)
+                if counterpart != NO_ORDER:
+                    append(period + 1, step + 1, counterpart, type_codes[counterpart], 1 - role, log_price,
+                           RESULT_EXECUTED)
+            if prof is not None:
+                prof.step(agent_type, t0, t1, t2, t3, now())
+
+        if action_stats is not None:
+            action_stats.end_period()
+        if checkpointer is not None and checkpointer.due(period + 1):
+            checkpointer.save(period + 1, population, trade_log, action_stats, rng=rng)
+        if prof is not None:
+            prof.end_period(period)
+        elif progress_every and (period + 1) % progress_every == 0:
+            print(f"  ... 期間 {period + 1}/{num_periods} 完了 (板の注文数 {len(book)})")
+
+    if trade_log is not None:
+        trade_log.flush()
+    return population, action_stats
+
+
+def benchmark_book(num_orders=1000000, num_agents=100000, seed=0):
+    """
+    板の操作だけ (注文・取消・約定) の処理速度を測る
+    (1件ずつのメソッド呼び出し, submit_orders のカーネル) の (注文/秒, 約定件数) を返す
+    numba があれば初回のコンパイルは除く
+    """
+    rng = np.random.default_rng(seed)
+    agents = rng.integers(0, num_agents, size=num_orders)
+    sides = rng.integers(0, 2, size=num_orders)
+    prices = rng.integers(0, PRICE_MAX + 1, size=num_orders)
+
+    book = OrderBook(num_agents)
+    executed = 0
+    t0 = time.perf_counter()
+    for agent_id, side, price in zip(agents.tolist(), sides.tolist(), prices.tolist()):
+        book.cancel(agent_id)
+        best = book.best_ask() if side == ROLE_BUYER else book.best_bid()
+        if best != -1 and (price >= best if side == ROLE_BUYER else price <= best):
+            book.pop_best(1 - side)
+            executed += 1
+        else:
+            book.add(agent_id, side, price)
+    per_call = num_orders / (time.perf_counter() - t0), executed
+
+    OrderBook(num_agents).submit_orders(agents[:10], sides[:10], prices[:10])
+    book = OrderBook(num_agents)
+    t0 = time.perf_counter()
+    executed = book.submit_orders(agents, sides, prices)
+    return per_call, (num_orders / (time.perf_counter() - t0), executed)
+
+
+if __name__ == '__main__':
+
+    print(f"numba: {'あり (コンパイルして実行)' if HAVE_NUMBA else 'なし (Python で実行)'}")
+    (rate, executed), (kernel_rate, kernel_executed) = benchmark_book()
+    print(f"板の操作 (1件ずつ): {rate:,.0f} 注文/秒 (約定 {executed} 件)")
+    print(f"板の操作 (submit_orders): {kernel_rate:,.0f} 注文/秒 (約定 {kernel_executed} 件)")
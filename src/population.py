@@ -0,0 +1,119 @@
+import numpy as np
+
+from trade_log import AGENT_TYPES, AGENT_TYPE_CODES
+
+
+PRICE_MAX = 200
+INITIAL_ASSET = 500.0
+
+ZIT = AGENT_TYPE_CODES['ZIT']
+RULE = AGENT_TYPE_CODES['Rule']
+ML = AGENT_TYPE_CODES['ML']
+
+TRADER_NAMES = {'ZIT': 'ZITrader', 'Rule': 'RuleTrader', 'ML': 'MLTrader'}
+
+
+def draw_limit_prices(rng, size):
+    """
+    ZIT の (コスト, 価値, 買い指値, 売り指値) を size (整数か形のタプル) の int16 配列でまとめて引く
+    価値 < コストになった人は価値をコスト以上で引き直す
+    """
+    cost = rng.integers(0, PRICE_MAX + 1, size=size, dtype=np.int16)
+    value = rng.integers(0, PRICE_MAX + 1, size=size, dtype=np.int16)
+    redraw = value < cost
+    value[redraw] = rng.integers(cost[redraw], PRICE_MAX + 1, dtype=np.int16)
+    buy_price = rng.integers(0, value + 1, dtype=np.int16)
+    sell_price = rng.integers(cost, PRICE_MAX + 1, dtype=np.int16)
+    return cost, value, buy_price, sell_price
+
+
+class TraderPopulation:
+    """
+    トレーダー集団を配列で持つコンテナ (1人1オブジェクトの代わり)
+    asset: float64, traded: bool, cost/value/buy_price/sell_price: int16, type: uint8
+    エージェントID = 配列の添字
+    """
+    def __init__(self, types, initial_asset=INITIAL_ASSET, seed=None, rng=None):
+        self.type = np.asarray(types, dtype=np.uint8)
+        n = len(self.type)
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        self.asset = np.full(n, initial_asset, dtype=np.float64)
+        self.traded = np.zeros(n, dtype=bool)
+        self.cost = np.zeros(n, dtype=np.int16)
+        self.value = np.zeros(n, dtype=np.int16)
+        self.buy_price = np.zeros(n, dtype=np.int16)
+        self.sell_price = np.zeros(n, dtype=np.int16)
+        self.reset_period()
+
+    @classmethod
+    def mixed(cls, num_traders, ratio=0.0, special_type='Rule', **kwargs):
+        """ 先頭 int(num_traders * ratio) 人が special_type, 残りが ZIT の集団 """
+        num_special = int(num_traders * ratio)
+        types = np.full(num_traders, ZIT, dtype=np.uint8)
+        types[:num_special] = AGENT_TYPE_CODES[special_type]
+        return cls(types, **kwargs)
+
+    def __len__(self):
+        return len(self.type)
+
+    def reset_period(self):
+        """
+        期間ごとに全員の価値とコスト・指値をまとめて引き直す (従来の ZITrader.reset_period と同じ分布)
+        Rule/ML はこれらを使わない
+        """
+        self.traded[:] = False
+        self.cost[:], self.value[:], self.buy_price[:], self.sell_price[:] = draw_limit_prices(self.rng, len(self))
+
+    def count(self, type_name):
+        return int(np.count_nonzero(self.type == AGENT_TYPE_CODES[type_name]))
+
+    def assets_of(self, type_name):
+        return self.asset[self.type == AGENT_TYPE_CODES[type_name]]
+
+    def view(self, agent_id):
+        return TraderView(self, agent_id)
+
+    def __getitem__(self, agent_id):
+        return self.view(agent_id)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.type, self.asset, self.traded, self.cost,
+                                      self.value, self.buy_price, self.sell_price))
+
+
+class TraderView:
+    """ デバッグ用: 1人分を従来のトレーダーオブジェクトのように見せる """
+    def __init__(self, population, agent_id):
+        self._pop = population
+        self.id = agent_id
+
+    @property
+    def type(self):
+        return AGENT_TYPES[self._pop.type[self.id]]
+
+    @property
+    def asset(self):
+        return float(self._pop.asset[self.id])
+
+    @property
+    def has_traded(self):
+        return bool(self._pop.traded[self.id])
+
+    @property
+    def cost(self):
+        return int(self._pop.cost[self.id])
+
+    @property
+    def value(self):
+        return int(self._pop.value[self.id])
+
+    @property
+    def buy_price(self):
+        return int(self._pop.buy_price[self.id])
+
+    @property
+    def sell_price(self):
+        return int(self._pop.sell_price[self.id])
+
+    def __repr__(self):
+        return f"{TRADER_NAMES[self.type]}(ID:{self.id}, Asset:{self.asset:.2f}, Traded:{self.has_traded})"
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+from trade_log import AGENT_TYPES
+
+
+PHASES = ('pick', 'decision', 'matching', 'logging')
+
+
+class Profiler:
+    """
+    マッチングループのフェーズ別 (選択・意思決定・マッチング・ログ) の累積時間と回数をエージェントタイプ別に数える
+    ループ側は `if prof is not None` のときだけ時刻を取るので、渡さなければほぼコストはかからない
+    progress_interval 秒ごとに進捗 (steps/s と残り時間) を表示し、Chrome trace 形式で書き出せる
+    """
+    def __init__(self, progress_interval=10.0, sample_every=0, clock=time.perf_counter):
+        self.clock = clock
+        self.progress_interval = progress_interval
+        self.sample_every = sample_every  # n ステップに1回、各フェーズを trace のイベントとして残す (0 なら残さない)
+        self.times = [[0.0] * len(AGENT_TYPES) for _ in PHASES]
+        self.calls = [0] * len(AGENT_TYPES)
+        self.steps = 0
+        self.events = []
+        self._origin = clock()
+        self._run_start = None
+        self._last_progress = None
+        self._period_start = None
+
+    def now(self):
+        return self.clock()
+
+    def step(self, agent_type, t0, t1, t2, t3, t4):
+        """ 1ステップ分: t0-t1 選択, t1-t2 意思決定, t2-t3 マッチング, t3-t4 ログ """
+        times = self.times
+        times[0][agent_type] += t1 - t0
+        times[1][agent_type] += t2 - t1
+        times[2][agent_type] += t3 - t2
+        times[3][agent_type] += t4 - t3
+        self.calls[agent_type] += 1
+        self.steps += 1
+        if self.sample_every and self.steps % self.sample_every == 0:
+            args = {'agent_type': AGENT_TYPES[agent_type]}
+            for name, start, end in zip(PHASES, (t0, t1, t2, t3), (t1, t2, t3, t4)):
+                self._event(name, start, end - start, args, tid=1)
+
+    def start_run(self, num_periods, steps_per_period):
+        self.num_periods = num_periods
+        self.steps_per_period = steps_per_period
+        self._run_start = self._last_progress = self.clock()
+
+    def start_period(self, period):
+        self._period_start = self.clock()
+
+    def end_period(self, period):
+        """ 期間の区切りを trace に残し、progress_interval 秒たっていれば進捗を表示する """
+        end = self.clock()
+        self._event(f"period {period + 1}", self._period_start, end - self._period_start, {'steps': self.steps})
+        self.events.append({'name': 'phase_seconds', 'ph': 'C', 'pid': 0, 'tid': 0, 'ts': self._us(end),
+                            'args': dict(zip(PHASES, (sum(t) for t in self.times)))})
+        if self.progress_interval is not None and end - self._last_progress >= self.progress_interval:
+            self._last_progress = end
+            self.print_progress(period, end)
+
+    def print_progress(self, period, now=None):
+        now = self.clock() if now is None else now
+        elapsed = now - self._run_start
+        done = period + 1
+        rate = self.steps / elapsed if elapsed > 0 else 0.0
+        eta = elapsed / done * (self.num_periods - done)
+        print(f"  ... 期間 {done}/{self.num_periods}, {rate:,.0f} steps/s, 経過 {elapsed:.1f} s, 残り約 {eta:.1f} s")
+
+    def _us(self, t):
+        return (t - self._origin) * 1e6
+
+    def _event(self, name, start, duration, args=None, tid=0):
+        event = {'name': name, 'ph': 'X', 'pid': 0, 'tid': tid, 'ts': self._us(start), 'dur': duration * 1e6}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def summary(self):
+        """ {'steps', 'phase_seconds', 'by_type': {タイプ: {'calls', フェーズ: 秒}}} """
+        by_type = {}
+        for code, name in enumerate(AGENT_TYPES):
+            if self.calls[code] == 0:
+                continue
+            by_type[name] = {'calls': self.calls[code]}
+            by_type[name].update({phase: self.times[i][code] for i, phase in enumerate(PHASES)})
+        return {'steps': self.steps,
+                'phase_seconds': {phase: sum(self.times[i]) for i, phase in enumerate(PHASES)},
+                'by_type': by_type}
+
+    def report(self):
+        summary = self.summary()
+        total = sum(summary['phase_seconds'].values())
+        print(f"\n--- プロファイル ({summary['steps']} ステップ) ---")
+        for phase, seconds in summary['phase_seconds'].items():
+            share = seconds / total * 100 if total > 0 else 0.0
+            print(f"  {phase:10s}: {seconds:8.3f} s ({share:5.1f}%)")
+        for name, row in summary['by_type'].items():
+            per_call = sum(row[p] for p in PHASES) / row['calls'] * 1e6
+            print(f"  {name:5s}: {row['calls']} 回, {per_call:.2f} us/ステップ")
+
+    def export_chrome_trace(self, filename):
+        """ chrome://tracing や Perfetto で開ける JSON を書き出す """
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms',
+                       'otherData': self.summary()}, f)
+        print(f"トレースを保存しました: {filename}")
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+import analysis
+from action_stats import ActionStats
+from trade_log import AGENT_TYPES, AGENT_TYPE_CODES
+
+
+METADATA_FILE = "metadata.json"
+
+
+class ResultsStore:
+    """
+    1ラン分の結果を1ディレクトリに保存する: 配列ごとに <名前>.npy + metadata.json
+    配列は np.save で一括で書き、読むときは mmap_mode で必要な分だけ読める
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def create(cls, path, metadata=None):
+        os.makedirs(path, exist_ok=True)
+        store = cls(path)
+        store.write_metadata(metadata or {})
+        return store
+
+    def _array_filename(self, name):
+        return os.path.join(self.path, f"{name}.npy")
+
+    def save_array(self, name, array):
+        np.save(self._array_filename(name), np.asarray(array))
+
+    def load_array(self, name, mmap_mode=None):
+        return np.load(self._array_filename(name), mmap_mode=mmap_mode)
+
+    def has_array(self, name):
+        return os.path.exists(self._array_filename(name))
+
+    def array_names(self):
+        return sorted(f[:-4] for f in os.listdir(self.path) if f.endswith(".npy"))
+
+    def write_metadata(self, metadata):
+        with open(os.path.join(self.path, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+    @property
+    def metadata(self):
+        with open(os.path.join(self.path, METADATA_FILE)) as f:
+            return json.load(f)
+
+
+def save_run(path, population, action_stats=None, label=None, types=None, **metadata):
+    """
+    シミュレーション1ラン分 (資産・タイプ・期間別の行動統計) を ResultsStore に保存する
+    types: .dat に書き出すタイプ (既定: population にいるタイプ)
+    metadata には割合・期間数などを自由に入れる (metadata.json に書く)
+    """
+    if types is None:
+        types = [t for t in AGENT_TYPES if population.count(t) > 0]
+    meta = {'label': label or os.path.basename(os.path.normpath(path)), 'types': list(types),
+            'num_traders': len(population), 'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    meta.update(metadata)
+    store = ResultsStore.create(path)
+    store.save_array('asset', population.asset)
+    store.save_array('type', population.type)
+    if action_stats is not None:
+        store.save_array('action_stats', action_stats.per_period())
+    # metadata.json を最後に書く (これがあるディレクトリは書き終わっている)
+    store.write_metadata(meta)
+    print(f"結果を保存しました: {path} ({', '.join(store.array_names())})")
+    return store
+
+
+def load_run(path):
+    """ save_run で保存したランを (metadata, 資産, タイプのコード, ActionStats または None) で返す """
+    store = ResultsStore(path)
+    action_stats = None
+    if store.has_array('action_stats'):
+        action_stats = ActionStats()
+        action_stats.load_per_period(store.load_array('action_stats'))
+    return store.metadata, store.load_array('asset'), store.load_array('type'), action_stats
+
+
+def export_dat(path, out_dir, label=None):
+    """
+    ResultsStore から gnuplot 用の .dat を作る (従来の Rule.py / ML.py と同じファイル名)
+    asset_raw_<label>_all.dat, asset_raw_<label>_<タイプ>.dat, asset_ccdf_<label>_all.dat,
+    asset_ccdf_<label>_logbin.dat, action_stats_<label>.dat, action_stats_<label>_period.dat, gaussian_theory.dat
+    """
+    meta, assets, type_codes, action_stats = load_run(path)
+    label = label or meta['label']
+    types = meta['types']
+    written = []
+
+    def out(name):
+        filename = os.path.join(out_dir, name)
+        written.append(filename)
+        return filename
+
+    analysis.save_values_dat(out(f"asset_raw_{label}_all.dat"), assets, "Raw Asset Values")
+    for t in types:
+        analysis.save_values_dat(out(f"asset_raw_{label}_{t.lower()}.dat"),
+                                 assets[type_codes == AGENT_TYPE_CODES[t]], f"{t} Assets")
+    if not analysis.save_ccdf_dat(assets, out(f"asset_ccdf_{label}_all.dat")):
+        written.pop()
+    if not analysis.save_log_binned_ccdf_dat(assets, out(f"asset_ccdf_{label}_logbin.dat")):
+        written.pop()
+    if action_stats is not None:
+        action_stats.save_dat(out(f"action_stats_{label}.dat"), types)
+        action_stats.save_period_dat(out(f"action_stats_{label}_period.dat"), types)
+    analysis.save_gaussian_dat(out("gaussian_theory.dat"))
+
+    print(f"DAT書き出し: {path} -> {out_dir} ({len(written)} ファイル)")
+    return written
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="ResultsStore の中身を表示・gnuplot 用 .dat に書き出す")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="gnuplot 用の .dat を書き出す")
+    export_parser.add_argument('runs', nargs='+', help="save_run で保存したディレクトリ")
+    export_parser.add_argument('--out', default="fig", help="出力先 (既定: fig)")
+    export_parser.add_argument('--label', default=None, help="ファイル名のラベル (既定: metadata の label)")
+    show_parser = subparsers.add_parser('show', help="メタデータと配列の一覧を表示する")
+    show_parser.add_argument('runs', nargs='+')
+    args = parser.parse_args()
+
+    for run in args.runs:
+        if args.command == 'export':
+            export_dat(run, args.out, args.label)
+        else:
+            store = ResultsStore(run)
+            print(f"{run}: {json.dumps(store.metadata, ensure_ascii=False)}")
+            for name in store.array_names():
+                array = store.load_array(name, mmap_mode='r')
+                print(f"  {name}: {array.dtype} {array.shape}")
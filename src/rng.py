@@ -0,0 +1,103 @@
+import operator
+import numpy as np
+
+
+# シミュレーションの乱数ストリーム (部品ごとに独立)
+SIMULATION_STREAMS = ('population', 'engine')
+# 学習の乱数ストリーム
+TRAINING_STREAMS = ('split', 'val_split', 'train_sampler', 'val_sampler', 'test_sampler')
+
+
+def spawn_generators(seed, names):
+    """
+    SeedSequence(seed).spawn で部品ごとに独立した np.random.Generator を作る
+    同じ seed なら、どのプロセス・どの順番で使っても各ストリームの乱数は同じ
+    """
+    children = np.random.SeedSequence(seed).spawn(len(names))
+    return {name: np.random.default_rng(child) for name, child in zip(names, children)}
+
+
+class BlockRNG:
+    """
+    np.random.Generator から一様乱数を block_size 個ずつまとめて引いておき、1個ずつ取り出す
+    マッチングループで使う random モジュールの関数 (random / randrange / randint / choice) と同じ呼び方ができる
+    整数は floor(u * n) で作る (n が 2^53 よりずっと小さければ偏りは無視できる)
+    バッファはリストのイテレータで読み、使い切ったときだけ StopIteration で引き足す
+    """
+    def __init__(self, generator=None, seed=None, block_size=1 << 16):
+        self.generator = generator if generator is not None else np.random.default_rng(seed)
+        self.block_size = block_size
+        self._set_buffer([])
+
+    def _set_buffer(self, values):
+        self._buffer = values
+        self._iter = iter(values)
+        self._next = self._iter.__next__
+
+    def _refill(self):
+        self._set_buffer(self.generator.random(self.block_size).tolist())
+
+    def random(self):
+        """ [0, 1) の一様乱数 """
+        try:
+            return self._next()
+        except StopIteration:
+            self._refill()
+            return self._next()
+
+    def randrange(self, n):
+        """ 0 ~ n-1 の整数 """
+        try:
+            return int(self._next() * n)
+        except StopIteration:
+            self._refill()
+            return int(self._next() * n)
+
+    def randint(self, a, b):
+        """ a ~ b (両端を含む) の整数 """
+        try:
+            return a + int(self._next() * (b - a + 1))
+        except StopIteration:
+            self._refill()
+            return a + int(self._next() * (b - a + 1))
+
+    def choice(self, seq):
+        try:
+            return seq[int(self._next() * len(seq))]
+        except StopIteration:
+            self._refill()
+            return seq[int(self._next() * len(seq))]
+
+    def take(self, n):
+        """
+        次の n 個の一様乱数を配列で取り出す (random() を n 回呼ぶのと同じ値. コンパイル済みカーネル用)
+        使わなかった分は unread() で戻す
+        """
+        remaining = self._buffer[len(self._buffer) - operator.length_hint(self._iter):]
+        if len(remaining) >= n:
+            self._set_buffer(remaining[n:])
+            return np.array(remaining[:n], dtype=np.float64)
+        self._set_buffer([])
+        return np.concatenate([np.array(remaining, dtype=np.float64), self.generator.random(n - len(remaining))])
+
+    def unread(self, values):
+        """ take() で取り出して使わなかった乱数を、次に使う乱数として戻す """
+        remaining = self._buffer[len(self._buffer) - operator.length_hint(self._iter):]
+        self._set_buffer(np.asarray(values, dtype=np.float64).tolist() + remaining)
+
+    def getstate(self):
+        """ (Generator の状態, まだ使っていないバッファ) を返す (チェックポイント用) """
+        remaining = operator.length_hint(self._iter)
+        used = len(self._buffer) - remaining
+        return self.generator.bit_generator.state, np.array(self._buffer[used:], dtype=np.float64)
+
+    def setstate(self, state):
+        bit_generator_state, remaining = state
+        self.generator.bit_generator.state = bit_generator_state
+        self._set_buffer(np.asarray(remaining, dtype=np.float64).tolist())
+
+
+def simulation_rngs(seed):
+    """ (TraderPopulation 用の Generator, マッチングループ用の BlockRNG) """
+    generators = spawn_generators(seed, SIMULATION_STREAMS)
+    return generators['population'], BlockRNG(generators['engine'])
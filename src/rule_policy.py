@@ -0,0 +1,56 @@
+import numpy as np
+
+from encoding import PRICE_MAX, BOARD_EMPTY, BOARD_ASK, BOARD_BID, BOARD_TYPES, ROLES, ROLE_BUYER, ROLE_SELLER
+from ml_policy import CHOICE_MIN, CHOICE_MAX, NUM_CHOICES
+
+
+# 表の「売買をランダムに選ぶ」マーク (空板のとき)
+RANDOM_ROLE = 2
+
+
+class RuleDecisionTable:
+    """
+    RuleTraderの意思決定表 (MLDecisionTable と同じ形 3 x 201 x 199)
+    (板の種類, 板の価格, 提示価格) -> 0:買い, 1:売り, RANDOM_ROLE:ランダム
+    - 売り板: 提示価格 >= 板の価格なら買い (成立), それ以外は売り (上書き)
+    - 買い板: 提示価格 <= 板の価格なら売り (成立), それ以外は買い (上書き)
+    - 空板: 売買をランダムに選ぶ
+    """
+    def __init__(self):
+        prices = np.arange(CHOICE_MIN, CHOICE_MAX + 1)[None, :]
+        board_prices = np.arange(PRICE_MAX + 1)[:, None]
+        # table[board_type, board_price, price - CHOICE_MIN]
+        self.table = np.empty((3, PRICE_MAX + 1, NUM_CHOICES), dtype=np.int8)
+        self.table[BOARD_EMPTY] = RANDOM_ROLE
+        self.table[BOARD_ASK] = np.where(prices >= board_prices, ROLE_BUYER, ROLE_SELLER)
+        self.table[BOARD_BID] = np.where(prices <= board_prices, ROLE_SELLER, ROLE_BUYER)
+
+    def role_code(self, board_type, board_price, price):
+        """ 0:買い, 1:売り, RANDOM_ROLE を返す (空板の board_price は無視する) """
+        if board_type == BOARD_EMPTY:
+            board_price = 0
+        return self.table[board_type, board_price, price - CHOICE_MIN]
+
+    def role_codes(self, board_types, board_prices, prices, rng=None):
+        """
+        エージェントの集団の分をまとめて引く (引数はすべて同じ長さの配列)
+        rng (np.random.Generator) を渡すと RANDOM_ROLE を 0/1 に引いて返す
+        """
+        board_types = np.asarray(board_types)
+        board_prices = np.where(board_types == BOARD_EMPTY, 0, board_prices)
+        codes = self.table[board_types, board_prices, np.asarray(prices) - CHOICE_MIN]
+        if rng is not None:
+            draw = codes == RANDOM_ROLE
+            codes[draw] = rng.integers(0, 2, size=int(np.count_nonzero(draw)))
+        return codes
+
+    def choose_role(self, board, price, rng=None):
+        """ 板(dict)と提示価格から 'buyer' / 'seller' を返す (空板なら rng でランダムに選ぶ) """
+        code = self.role_code(BOARD_TYPES[board['type']], board['price'], price)
+        if code == RANDOM_ROLE:
+            code = (rng or np.random.default_rng()).integers(0, 2)
+        return ROLES[code]
+
+
+# 表は乱数を含まないので全員で共有する
+RULE_POLICY = RuleDecisionTable()
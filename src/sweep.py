@@ -0,0 +1,150 @@
+import argparse
+import csv
+import itertools
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from action_stats import ActionStats, OUTCOMES
+from engine import run_simulation, default_strategies
+from rng import simulation_rngs
+from population import TraderPopulation
+
+
+INITIAL_ASSET = 500.0
+AGENT_TYPES = {'Rule': ['ZIT', 'Rule'], 'ML': ['ZIT', 'ML']}
+
+# ワーカーごとに1回だけ読み込むMLの意思決定表
+_ml_policy = None
+
+
+def _init_worker(ml_table_path, ml_weights_path=None):
+    global _ml_policy
+    from ml_policy import MLDecisionTable
+    if ml_table_path is not None:
+        _ml_policy = MLDecisionTable.load(ml_table_path)
+    elif ml_weights_path is not None:
+        # NumPy だけで推論して意思決定表を作る (TensorFlow 不要)
+        from mlp_runtime import NumpyMLP
+        _ml_policy = MLDecisionTable(NumpyMLP.load(ml_weights_path))
+
+
+def run_cell(strategy, ratio, num_traders, num_periods, steps_per_period, seed, out_dir, market='board'):
+    """ グリッドの1セル・1シード分を実行して結果の1行を返す """
+    # 乱数はシードから部品ごとに作る (グローバルの random / np.random は使わないのでワーカー数に依存しない)
+    population_rng, rng = simulation_rngs(seed)
+
+    # 先頭が Rule/ML, 残りが ZIT
+    population = TraderPopulation.mixed(num_traders, ratio, strategy, initial_asset=INITIAL_ASSET, rng=population_rng)
+    if strategy == 'ML' and _ml_policy is None:
+        raise ValueError("MLのスイープには意思決定表 (--ml-table) か重み (--ml-weights) が必要です")
+    population, action_stats = run_simulation(population, default_strategies(_ml_policy, rng), num_periods,
+                                              steps_per_period, action_stats=ActionStats(), market=market, rng=rng)
+
+    assets = population.asset
+    row = {
+        'strategy': strategy, 'market': market, 'ratio': ratio, 'traders': num_traders,
+        'periods': num_periods, 'steps': steps_per_period, 'seed': seed,
+        'mu': float(np.mean(assets)), 'sigma': float(np.std(assets)),
+    }
+    counts = action_stats.as_dict(AGENT_TYPES[strategy])
+    for t in AGENT_TYPES[strategy]:
+        own = population.assets_of(t)
+        row[f'mu_{t}'] = float(np.mean(own)) if own.size else float('nan')
+        row[f'sigma_{t}'] = float(np.std(own)) if own.size else float('nan')
+        for key in OUTCOMES:
+            row[f'{t}_{key}'] = counts[t][key]
+
+    if out_dir is not None:
+        label = f"{strategy}_{market}_{int(ratio*100)}pct_N{num_traders}_P{num_periods}_S{steps_per_period}_seed{seed}"
+        np.save(os.path.join(out_dir, f"assets_{label}.npy"), assets)
+    return row
+
+
+def summarize(rows):
+    """ 同じセルのシードをまとめ、μ/σ の平均と95%信頼区間の半幅を出す """
+    from scipy import stats
+
+    cell_keys = ['strategy', 'market', 'ratio', 'traders', 'periods', 'steps']
+    cells = {}
+    for row in rows:
+        cells.setdefault(tuple(row[k] for k in cell_keys), []).append(row)
+
+    summary = []
+    for key, cell_rows in sorted(cells.items()):
+        entry = dict(zip(cell_keys, key))
+        entry['seeds'] = len(cell_rows)
+        for metric in ['mu', 'sigma']:
+            values = np.array([r[metric] for r in cell_rows])
+            entry[f'{metric}_mean'] = float(np.mean(values))
+            if len(values) > 1:
+                sem = np.std(values, ddof=1) / np.sqrt(len(values))
+                entry[f'{metric}_ci95'] = float(stats.t.ppf(0.975, len(values) - 1) * sem)
+            else:
+                entry[f'{metric}_ci95'] = float('nan')
+        summary.append(entry)
+    return summary
+
+
+def write_table(rows, filename):
+    fieldnames = []
+    for row in rows:
+        fieldnames += [k for k in row if k not in fieldnames]
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"CSV保存: {filename}")
+
+
+def run_sweep(strategy, ratios, trader_counts, period_counts, steps_list, seeds,
+              workers=None, out_dir="sweep", ml_table_path=None, ml_weights_path=None, save_assets=True,
+              market='board'):
+    """
+    (割合, トレーダー数, 期間数, 1期間のステップ数, シード) の全組み合わせを
+    プロセスプールで実行し、結果を1つの表にまとめる
+    steps_list に None を入れると「トレーダー数 × 2」を使う
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    grid = []
+    for ratio, n, periods, steps, seed in itertools.product(ratios, trader_counts, period_counts, steps_list, seeds):
+        grid.append((strategy, ratio, n, periods, steps if steps is not None else n * 2, seed,
+                     out_dir if save_assets else None, market))
+    print(f"スイープ開始: {strategy}, {len(grid)} ラン")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ml_table_path, ml_weights_path)) as executor:
+        futures = [executor.submit(run_cell, *cell) for cell in grid]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            rows.append(row)
+            print(f"[{done}/{len(grid)}] ratio={row['ratio']} N={row['traders']} seed={row['seed']}: "
+                  f"mu={row['mu']:.2f} sigma={row['sigma']:.2f}")
+
+    rows.sort(key=lambda r: (r['ratio'], r['traders'], r['periods'], r['steps'], r['seed']))
+    name = strategy if market == 'board' else f"{strategy}_{market}"
+    write_table(rows, os.path.join(out_dir, f"sweep_{name}_runs.csv"))
+    write_table(summarize(rows), os.path.join(out_dir, f"sweep_{name}_summary.csv"))
+    return rows
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Rule/ML 混合割合のパラメータスイープ")
+    parser.add_argument('--strategy', choices=['Rule', 'ML'], default='Rule')
+    parser.add_argument('--ratios', type=float, nargs='+', default=[0.1, 0.2, 0.3, 0.4, 0.5])
+    parser.add_argument('--traders', type=int, nargs='+', default=[2000])
+    parser.add_argument('--periods', type=int, nargs='+', default=[100])
+    parser.add_argument('--steps', type=int, nargs='+', default=None, help="省略時はトレーダー数 × 2")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2, 3, 4])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out-dir', default="sweep")
+    parser.add_argument('--ml-table', default=None, help="ML.py が保存した ml_decision_table.npy")
+    parser.add_argument('--ml-weights', default=None, help="ML.py が書き出した zit_model_407.npz")
+    parser.add_argument('--market', choices=['board', 'book'], default='board',
+                        help="board: 従来の1枠の板, book: 価格優先・時間優先の複数価格の板")
+    parser.add_argument('--no-assets', action='store_true', help="ランごとの資産配列を保存しない")
+    args = parser.parse_args()
+
+    run_sweep(args.strategy, args.ratios, args.traders, args.periods, args.steps or [None], args.seeds,
+              workers=args.workers, out_dir=args.out_dir, ml_table_path=args.ml_table, ml_weights_path=args.ml_weights,
+              save_assets=not args.no_assets, market=args.market)
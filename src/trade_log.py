@@ -0,0 +1,165 @@
+import array
+import csv
+import glob
+import os
+import numpy as np
+
+from encoding import ROLES
+
+
+# カテゴリ列のコード
+AGENT_TYPES = ('ZIT', 'Rule', 'ML')
+AGENT_TYPE_CODES = {name: code for code, name in enumerate(AGENT_TYPES)}
+
+RESULT_FAIL = 0
+RESULT_OVERWRITE = 1
+RESULT_EXECUTED = 2
+RESULTS = ('fail', 'overwrite', 'executed')
+
+# 1イベント = 1行 (Period, Step, AgentID, Type, Role, Price, Result)
+LOG_DTYPE = np.dtype([
+    ('period', np.int32), ('step', np.int32), ('agent_id', np.int32),
+    ('type', np.uint8), ('role', np.uint8), ('price', np.int16), ('result', np.uint8),
+])
+CSV_HEADER = ["Period", "Step", "AgentID", "Type", "Role", "Price", "Result"]
+
+_TYPECODES = {'period': 'i', 'step': 'i', 'agent_id': 'i',
+              'type': 'B', 'role': 'B', 'price': 'h', 'result': 'B'}
+
+
+class TradeLog:
+    """
+    取引ログの書き出し先
+    型付きの列 (array.array) にためて、chunk_size 行ごとにバイナリのチャンクとして書き出す
+    out_dir=None のときはチャンクをメモリ上に持つ
+    fmt='parquet' は pyarrow がある場合のみ (無ければ .npy)
+    """
+    def __init__(self, out_dir=None, chunk_size=1 << 16, fmt='npy'):
+        self.out_dir = out_dir
+        self.chunk_size = chunk_size
+        self.fmt = fmt
+        if fmt == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print("pyarrow が無いので .npy チャンクで保存します")
+                self.fmt = 'npy'
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+
+        self.memory_chunks = []
+        self.num_chunks = 0
+        self.num_flushed = 0
+        self._new_columns()
+
+    def _new_columns(self):
+        self.columns = {name: array.array(code) for name, code in _TYPECODES.items()}
+        self._period = self.columns['period'].append
+        self._step = self.columns['step'].append
+        self._agent_id = self.columns['agent_id'].append
+        self._type = self.columns['type'].append
+        self._role = self.columns['role'].append
+        self._price = self.columns['price'].append
+        self._result = self.columns['result'].append
+
+    def append(self, period, step, agent_id, agent_type, role, price, result):
+        """ agent_type/role/result はコード (AGENT_TYPE_CODES, ROLE_*, RESULT_*) """
+        self._period(period)
+        self._step(step)
+        self._agent_id(agent_id)
+        self._type(agent_type)
+        self._role(role)
+        self._price(price)
+        self._result(result)
+        if len(self.columns['period']) >= self.chunk_size:
+            self.flush()
+
+    def __len__(self):
+        return self.num_flushed + len(self.columns['period'])
+
+    def _pending_chunk(self):
+        chunk = np.empty(len(self.columns['period']), dtype=LOG_DTYPE)
+        for name, column in self.columns.items():
+            chunk[name] = np.frombuffer(column, dtype=LOG_DTYPE[name]) if len(column) else []
+        return chunk
+
+    def flush(self):
+        """ たまっている行を1チャンクとして書き出す """
+        if len(self.columns['period']) == 0:
+            return
+        chunk = self._pending_chunk()
+        if self.out_dir is None:
+            self.memory_chunks.append(chunk)
+        elif self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.table({name: chunk[name] for name in LOG_DTYPE.names})
+            pq.write_table(table, os.path.join(self.out_dir, f"trade_log_{self.num_chunks:05d}.parquet"))
+        else:
+            np.save(os.path.join(self.out_dir, f"trade_log_{self.num_chunks:05d}.npy"), chunk)
+        self.num_chunks += 1
+        self.num_flushed += len(chunk)
+        self._new_columns()
+
+    def close(self):
+        self.flush()
+
+    def resume(self, num_chunks, num_flushed, rows=None):
+        """
+        チェックポイントの時点 (num_chunks 個のチャンク, num_flushed 行) に戻す
+        out_dir があるときはそれ以降に書かれたチャンクを消す. メモリ上のログは rows (構造化配列) で戻す
+        """
+        if self.out_dir is None:
+            self.memory_chunks = [rows] if rows is not None and len(rows) else []
+        else:
+            for f in glob.glob(os.path.join(self.out_dir, "trade_log_*.*")):
+                index = os.path.basename(f).split('.')[0].rsplit('_', 1)[-1]
+                if index.isdigit() and int(index) >= num_chunks:
+                    os.remove(f)
+        self.num_chunks = num_chunks
+        self.num_flushed = num_flushed
+        self._new_columns()
+
+    def read(self):
+        """ ログ全体を構造化配列で返す """
+        if self.out_dir is None:
+            chunks = self.memory_chunks + [self._pending_chunk()]
+            return np.concatenate(chunks)
+        self.flush()
+        return load_trade_log(self.out_dir)
+
+    def iter_rows(self):
+        """ 従来の full_logs と同じ形の行 (文字列のカテゴリ) を順に返す """
+        data = self.read()
+        for period, step, agent_id, agent_type, role, price, result in data.tolist():
+            yield [period, step, agent_id, AGENT_TYPES[agent_type], ROLES[role], price, RESULTS[result]]
+
+    def export_csv(self, filename):
+        export_csv(self.iter_rows(), filename)
+
+
+def load_trade_log(out_dir):
+    """ TradeLog が書き出したチャンクを読み込んで1つの構造化配列にする """
+    npy_files = sorted(glob.glob(os.path.join(out_dir, "trade_log_*.npy")))
+    parquet_files = sorted(glob.glob(os.path.join(out_dir, "trade_log_*.parquet")))
+    chunks = [np.load(f) for f in npy_files]
+    if parquet_files:
+        import pyarrow.parquet as pq
+        for f in parquet_files:
+            table = pq.read_table(f)
+            chunk = np.empty(table.num_rows, dtype=LOG_DTYPE)
+            for name in LOG_DTYPE.names:
+                chunk[name] = table.column(name).to_numpy()
+            chunks.append(chunk)
+    if not chunks:
+        return np.empty(0, dtype=LOG_DTYPE)
+    return np.concatenate(chunks)
+
+
+def export_csv(rows, filename):
+    """ ログをCSVに書き出す (必要なときだけ) """
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(rows)
+    print(f"CSV保存: {filename}")
@@ -0,0 +1,40 @@
+import random
+
+
+class AvailablePool:
+    """ 未取引エージェントのプール (swap-remove によるO(1)抽選・O(1)削除) """
+    def __init__(self, num_agents):
+        self.num_agents = num_agents
+        # members[:size] が未取引エージェントのID, position[id] はその格納位置
+        self.members = list(range(num_agents))
+        self.position = list(range(num_agents))
+        self.size = num_agents
+
+    def reset(self):
+        """ 期間の開始時に全エージェントを利用可能に戻す """
+        self.members = list(range(self.num_agents))
+        self.position = list(range(self.num_agents))
+        self.size = self.num_agents
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, agent_id):
+        return self.position[agent_id] < self.size
+
+    def pick(self, rng=random):
+        """ 未取引エージェントから一様に1人選ぶ (random.choice と同じ分布) """
+        return self.members[rng.randrange(self.size)]
+
+    def remove(self, agent_id):
+        """ 取引済みエージェントを末尾と入れ替えて取り除く (既に除外済みなら何もしない) """
+        pos = self.position[agent_id]
+        if pos >= self.size:
+            return
+        last = self.size - 1
+        last_id = self.members[last]
+        self.members[pos] = last_id
+        self.position[last_id] = pos
+        self.members[last] = agent_id
+        self.position[agent_id] = last
+        self.size = last